@@ -96,12 +96,15 @@ ALLOWED_HOSTS = ["localhost", "127.0.0.1", ".localhost"]
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
-    'django_tenants.middleware.main.TenantMainMiddleware',
+    'core.middleware.RequestProfilingMiddleware',
+    'core.middleware.MetricsMiddleware',
+    'core.middleware.CachedTenantMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'patients.middleware.AuditContextMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -133,16 +136,40 @@ WSGI_APPLICATION = 'config.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django_tenants.postgresql_backend',  # ← IMPORTANT
+        'ENGINE': 'core.postgresql_backend',  # ← IMPORTANT (django_tenants.postgresql_backend étendu)
         'NAME': os.getenv('DB_NAME'),
         'USER': os.getenv('DB_USER'),
         'PASSWORD': os.getenv('DB_PASSWORD'),
         'HOST': os.getenv('DB_HOST', 'localhost'),
         'PORT': os.getenv('DB_PORT', '5432'),
+        # Connexions persistantes : durée de vie maximale (s), 0 = une connexion par requête
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', '600')),
+        # Vérifie une connexion réutilisée avant la première requête SQL
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# SET search_path une seule fois par requête et par cabinet (voir core.postgresql_backend)
+TENANT_LIMIT_SET_CALLS = True
+
+# Réplicas en lecture (optionnel) : DB_REPLICA_HOSTS="hote1:5432,hote2:5432"
+DATABASE_REPLICAS = []
+for index, address in enumerate(filter(None, os.getenv('DB_REPLICA_HOSTS', '').split(','))):
+    host, _, port = address.strip().partition(':')
+    DATABASES[f'replica{index + 1}'] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'PORT': port or DATABASES['default']['PORT'],
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica{index + 1}')
+
+REPLICA_MAX_LAG = 5  # secondes de retard au-delà desquelles on lit sur le primaire
+REPLICA_STICKY_SECONDS = 5  # lectures sur le primaire après une écriture du même utilisateur
+REPLICA_HEALTH_CHECK_INTERVAL = 5
+
 DATABASE_ROUTERS = (
+    'core.routers.ReplicaRouter',
     'django_tenants.routers.TenantSyncRouter',
 )
 
@@ -191,16 +218,16 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Django REST Framework Configuration
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'core.authentication.CachedJWTAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'core.pagination.StandardPagination',
     'PAGE_SIZE': 20,
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
+        'core.profiling.ProfiledJSONRenderer',
     ],
 }
 
@@ -213,3 +240,95 @@ SIMPLE_JWT = {
     'ROTATE_REFRESH_TOKENS': True,
     'BLACKLIST_AFTER_ROTATION': True,
 }
+
+# Chiffrement des données patients
+ENCRYPTION_KEY_FILE = os.getenv('ENCRYPTION_KEY_FILE', 'encryption.key')
+BLIND_INDEX_KEY_FILE = os.getenv('BLIND_INDEX_KEY_FILE', 'blind_index.key')
+# Relecture du fichier de clés s'il a changé (rotation sans redémarrage)
+ENCRYPTION_KEY_RELOAD_INTERVAL = 30  # secondes
+# Chiffrement d'enveloppe : clé de données par cabinet, chiffrée par le KMS (clés maîtres)
+ENCRYPTION_KMS_CLASS = os.getenv('ENCRYPTION_KMS_CLASS', 'patients.encryption.LocalKMS')
+TENANT_DATA_KEY_CACHE_SIZE = 1024
+TENANT_DATA_KEY_CACHE_TTL = 300  # secondes
+
+# Identification de l'appelant (recherche par numéro de téléphone)
+PHONE_DEFAULT_COUNTRY_CODE = '33'
+PHONE_NATIONAL_NUMBER_LENGTH = 9  # chiffres d'un numéro national sans le 0 initial
+CALLER_ID_CACHE_SIZE = 4096
+CALLER_ID_CACHE_TTL = 300  # secondes (invalidé dans tous les processus via le cache partagé)
+
+# Cache partagé par tous les processus (statistiques, lectures sur réplicas, cabinets) :
+# Redis si CACHE_REDIS_URL est défini, sinon table de la base (manage.py createcachetable).
+# Sans Redis, chaque lecture du cache reste une requête SQL (une par tableau de bord
+# pour les statistiques) : le repli évite les agrégations mais pas l'aller-retour à
+# la base, Redis est donc attendu en production.
+if os.getenv('CACHE_REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('CACHE_REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'django_cache',
+        }
+    }
+
+# Statistiques patients (invalidées à chaque création/modification/suppression ;
+# zéro requête en régime établi uniquement avec Redis, voir CACHES)
+PATIENT_STATISTICS_CACHE_TIMEOUT = 3600  # secondes
+
+# Journal d'audit : écriture différée par lots (False = écriture immédiate, pour les tests)
+AUDIT_LOG_ASYNC = True
+AUDIT_LOG_BATCH_SIZE = 500
+AUDIT_LOG_FLUSH_INTERVAL = 2.0  # secondes
+AUDIT_LOG_MAX_PENDING = 100000
+
+# Mesures par requête (en-tête Server-Timing et logs core.profiling), désactivées par défaut
+REQUEST_PROFILING = os.getenv('REQUEST_PROFILING', 'False') == 'True'
+# ?profile=1 : résumé cProfile, réservé aux superutilisateurs authentifiés par JWT
+REQUEST_PROFILER_ENABLED = os.getenv('REQUEST_PROFILER_ENABLED', 'False') == 'True'
+
+# Import en masse via l'API : exécuté en arrière-plan (False = dans la requête, pour les tests)
+PATIENT_IMPORT_ASYNC = True
+# Processus de chiffrement (0 : dans le thread d'import)
+PATIENT_IMPORT_WORKERS = int(os.getenv('PATIENT_IMPORT_WORKERS', '0'))
+# Répertoire des fichiers en attente d'import (par défaut : répertoire temporaire du système)
+PATIENT_IMPORT_DIR = os.getenv('PATIENT_IMPORT_DIR') or None
+
+# Déchiffrement par paquets (exports) : threads de déchiffrement (0 : un par cœur)
+PATIENT_DECRYPT_WORKERS = int(os.getenv('PATIENT_DECRYPT_WORKERS', '0'))
+
+# Cache de résolution des cabinets (nom d'hôte -> cabinet)
+TENANT_CACHE_SIZE = 1024
+TENANT_CACHE_TTL = 60  # secondes, délai de propagation entre processus
+TENANT_CACHE_SHARED = os.getenv('TENANT_CACHE_SHARED', 'False') == 'True'
+
+# Cache des utilisateurs authentifiés par JWT (délai maximal de prise en compte
+# d'une désactivation ou d'un verrouillage faits sans save())
+USER_CACHE_SIZE = 4096
+USER_CACHE_TTL = 30
+
+# Jeton exigé par /metrics (Authorization: Bearer <jeton>) ; /metrics refusé (403) si vide
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'core.profiling': {
+            'handlers': ['console'],
+            'level': os.getenv('REQUEST_PROFILING_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+    },
+}
+
+# Archives froides du journal d'audit (segments compressés par cabinet et par mois)
+AUDIT_ARCHIVE_DIR = os.getenv('AUDIT_ARCHIVE_DIR', BASE_DIR / 'audit_archive')
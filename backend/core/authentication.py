@@ -0,0 +1,82 @@
+import copy
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .cache import LRUCache
+
+
+# ============================================================================
+# AUTHENTIFICATION JWT AVEC CACHE DES UTILISATEURS
+# ============================================================================
+#
+# Les utilisateurs sont partagés entre cabinets (schéma public) : le cache est
+# indexé par identifiant. Toute sauvegarde ou suppression d'un utilisateur
+# l'invalide (core.signals) ; les mises à jour en masse (QuerySet.update)
+# prennent effet au plus tard après USER_CACHE_TTL secondes.
+
+_cache = LRUCache(
+    maxsize=getattr(settings, 'USER_CACHE_SIZE', 4096),
+    ttl=getattr(settings, 'USER_CACHE_TTL', 30),
+)
+
+
+def get_cached_user(user_id):
+    """Utilisateur par identifiant (cache puis base), ou None s'il n'existe pas"""
+    # Identifiant en texte : les jetons récents le sérialisent ainsi
+    user = _cache.get(str(user_id))
+    if user is None:
+        User = get_user_model()
+        try:
+            user = User.objects.get(**{api_settings.USER_ID_FIELD: user_id})
+        except User.DoesNotExist:
+            return None
+        _cache.set(str(user_id), user)
+    # Copie : les attributs posés pendant la requête ne sont pas partagés
+    return copy.copy(user)
+
+
+def invalidate_user(user):
+    """Oublie un utilisateur (rôle, activation, mot de passe ou verrouillage modifiés)"""
+    _cache.delete(str(getattr(user, api_settings.USER_ID_FIELD)))
+
+
+def clear():
+    """Vide le cache des utilisateurs"""
+    _cache.clear()
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication sans lecture de l'utilisateur en base à chaque requête.
+    Mêmes contrôles (actif, mot de passe changé), plus le verrouillage du compte.
+    """
+    
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_("Token contained no recognizable user identification")) from e
+        
+        user = get_cached_user(user_id)
+        if user is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+        
+        locked_until = getattr(user, 'account_locked_until', None)
+        if locked_until is not None and locked_until > timezone.now():
+            raise AuthenticationFailed("Compte verrouillé.", code="account_locked")
+        
+        return user
@@ -0,0 +1,95 @@
+import itertools
+import random
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection
+from django.db.backends.signals import connection_created
+from django.test import override_settings
+from django_tenants.utils import get_public_schema_name
+from rest_framework.test import APIClient
+
+from core.models import Domain
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare le débit (requêtes/s) avec une connexion par requête et avec "
+        "des connexions persistantes, sur un mélange de requêtes de plusieurs cabinets"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=300)
+        parser.add_argument('--path', default='/api/patients/?fields=id,patient_number')
+        parser.add_argument('--username', help="Utilisateur authentifié (par défaut le premier superutilisateur)")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        hosts = list(
+            Domain.objects.exclude(tenant__schema_name=get_public_schema_name())
+            .values_list('domain', flat=True)
+        )
+        if not hosts:
+            raise CommandError("Aucun cabinet à interroger.")
+        user = self.get_user(options['username'])
+        client = APIClient()
+        client.force_authenticate(user)
+
+        # Mélange de cabinets, identique pour les deux modes
+        rng = random.Random(options['seed'])
+        mix = [rng.choice(hosts) for _ in range(options['requests'])]
+
+        max_age = connection.settings_dict['CONN_MAX_AGE'] or 600
+        results = []
+        for label, conn_max_age, limit_set_calls in (
+            ("Connexion par requête", 0, False),
+            ("Connexions persistantes", max_age, True),
+        ):
+            requests_per_second, connects = self.run(client, mix, options['path'], conn_max_age, limit_set_calls)
+            results.append(requests_per_second)
+            self.stdout.write(f"{label:<26}: {requests_per_second:8.1f} req/s, {connects} connexions ouvertes")
+
+        self.stdout.write(f"{'Cabinets':<26}: {len(hosts)}")
+        self.stdout.write(self.style.SUCCESS(f"{'Gain':<26}: x{results[1] / results[0]:.2f}"))
+
+    def run(self, client, mix, path, conn_max_age, limit_set_calls):
+        """Débit d'un mode ; les signaux de début/fin de requête d'un serveur WSGI sont émulés"""
+        original_max_age = connection.settings_dict['CONN_MAX_AGE']
+        connection.settings_dict['CONN_MAX_AGE'] = conn_max_age
+        connection.close()
+        connects = itertools.count()
+
+        def on_connect(**kwargs):
+            next(connects)
+
+        connection_created.connect(on_connect)
+        try:
+            with override_settings(TENANT_LIMIT_SET_CALLS=limit_set_calls):
+                for host in mix[:10]:  # préchauffage
+                    self.request(client, host, path)
+                start = time.perf_counter()
+                for host in mix:
+                    self.request(client, host, path)
+                elapsed = time.perf_counter() - start
+        finally:
+            connection_created.disconnect(on_connect)
+            connection.settings_dict['CONN_MAX_AGE'] = original_max_age
+            connection.close()
+        return len(mix) / elapsed, next(connects)
+
+    def request(self, client, host, path):
+        close_old_connections()
+        response = client.get(path, HTTP_HOST=host)
+        close_old_connections()
+        if response.status_code != 200:
+            raise CommandError(f"{host}{path} : HTTP {response.status_code}")
+
+    @staticmethod
+    def get_user(username):
+        User = get_user_model()
+        users = User.objects.filter(username=username) if username else User.objects.filter(is_superuser=True)
+        user = users.first()
+        if user is None:
+            raise CommandError("Utilisateur introuvable (--username).")
+        return user
@@ -0,0 +1,174 @@
+from array import array
+from bisect import bisect_left
+from threading import Lock
+
+from django.db import connection
+
+
+# ============================================================================
+# REGISTRE DE MÉTRIQUES EN MÉMOIRE (FORMAT D'EXPOSITION PROMETHEUS)
+# ============================================================================
+#
+# Métriques propres à chaque processus : avec plusieurs workers, chaque
+# worker expose les siennes (Prometheus agrège par instance).
+
+# Secondes ; couvre les réponses d'API de quelques ms jusqu'aux exports
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Counter:
+    """Compteur par combinaison d'étiquettes"""
+    type = 'counter'
+    
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = Lock()
+    
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+    
+    def samples(self):
+        with self._lock:
+            values = list(self._values.items())
+        for labels, value in values:
+            yield self.name, _format_labels(self.labelnames, labels), value
+
+
+class Histogram:
+    """
+    Histogramme à bornes fixes : une ligne array('d') par combinaison
+    d'étiquettes (effectif de chaque intervalle, puis +Inf, puis somme).
+    """
+    type = 'histogram'
+    
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = Lock()
+    
+    def observe(self, labels, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = array('d', bytes(8 * (len(self.buckets) + 2)))
+            series[index] += 1
+            series[-1] += value
+    
+    def samples(self):
+        with self._lock:
+            series = [(labels, array('d', values)) for labels, values in self._series.items()]
+        names = self.labelnames + ('le',)
+        bounds = [_format_value(bound) for bound in self.buckets] + ['+Inf']
+        for labels, values in series:
+            cumulative = 0
+            for bound, count in zip(bounds, values):
+                cumulative += count
+                yield f'{self.name}_bucket', _format_labels(names, labels + (bound,)), cumulative
+            label_text = _format_labels(self.labelnames, labels)
+            yield f'{self.name}_count', label_text, cumulative
+            yield f'{self.name}_sum', label_text, values[-1]
+
+
+class Gauge:
+    """Jauge calculée à la collecte par une fonction retournant {étiquettes: valeur}"""
+    type = 'gauge'
+    
+    def __init__(self, name, documentation, labelnames=(), callback=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+    
+    def samples(self):
+        for labels, value in self.callback().items():
+            yield self.name, _format_labels(self.labelnames, labels), value
+
+
+class Registry:
+    """Ensemble des métriques exposées par /metrics"""
+    
+    def __init__(self):
+        self._metrics = {}
+        self._lock = Lock()
+    
+    def register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+    
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+    
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+    
+    def gauge(self, name, documentation, labelnames=(), callback=None):
+        return self.register(Gauge(name, documentation, labelnames, callback))
+    
+    def exposition(self):
+        """Texte au format d'exposition Prometheus 0.0.4"""
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{labels} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+# ============================================================================
+# MÉTRIQUES HTTP ET BASE DE DONNÉES
+# ============================================================================
+
+REQUEST_LABELS = ('schema', 'view', 'action')
+
+http_requests = registry.counter(
+    'edental_http_requests_total', "Requêtes HTTP traitées",
+    REQUEST_LABELS + ('status',)
+)
+http_request_duration = registry.histogram(
+    'edental_http_request_duration_seconds', "Durée de traitement des requêtes HTTP",
+    REQUEST_LABELS
+)
+
+
+def _database_connections():
+    """Connexions ouvertes sur la base, par état (pg_stat_activity)"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT coalesce(state, 'unknown'), count(*) FROM pg_stat_activity "
+            "WHERE datname = current_database() GROUP BY 1"
+        )
+        return {(state,): count for state, count in cursor.fetchall()}
+
+
+registry.gauge(
+    'edental_db_connections', "Connexions PostgreSQL ouvertes sur la base, par état",
+    ('state',), _database_connections
+)
@@ -0,0 +1,129 @@
+import json
+import logging
+from contextlib import ExitStack
+from time import perf_counter
+
+from django.conf import settings
+from django.db import connection, connections
+from django.http import HttpResponse
+from django_tenants.middleware.main import TenantMainMiddleware
+from rest_framework.exceptions import APIException
+
+from . import metrics, tenants
+from .authentication import CachedJWTAuthentication
+from .profiling import RequestMetrics, current_metrics, profile_summary, query_timer, start_profiler
+
+logger = logging.getLogger('core.profiling')
+
+
+class CachedTenantMiddleware(TenantMainMiddleware):
+    """TenantMainMiddleware dont la résolution nom d'hôte -> cabinet est mise en cache"""
+    
+    def get_tenant(self, domain_model, hostname):
+        return tenants.get_tenant_for_hostname(hostname)
+
+
+class RequestProfilingMiddleware:
+    """
+    Mesure par requête et par cabinet : requêtes SQL et temps base,
+    chiffrements/déchiffrements, sérialisation, taille de la réponse.
+    Résultats en en-tête Server-Timing et en log structuré (logger core.profiling).
+    Avec REQUEST_PROFILER_ENABLED, ?profile=1 renvoie un résumé cProfile aux
+    superutilisateurs (jeton JWT vérifié avant de démarrer le profileur).
+    """
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+    
+    def __call__(self, request):
+        if not getattr(settings, 'REQUEST_PROFILING', False):
+            return self.get_response(request)
+        
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        profiler = start_profiler() if self.profiler_allowed(request) else None
+        start = perf_counter()
+        try:
+            with ExitStack() as stack:
+                for alias in connections:
+                    stack.enter_context(connections[alias].execute_wrapper(query_timer))
+                response = self.get_response(request)
+        finally:
+            total = perf_counter() - start
+            if profiler is not None:
+                profiler.disable()
+            current_metrics.reset(token)
+        
+        if profiler is not None:
+            return HttpResponse(profile_summary(profiler), content_type='text/plain; charset=utf-8')
+        
+        size = None if response.streaming else len(response.content)
+        response['Server-Timing'] = self.server_timing(metrics, total)
+        self.log(request, response, metrics, total, size)
+        return response
+    
+    @staticmethod
+    def profiler_allowed(request):
+        """?profile=1 d'un superutilisateur, authentifié avant la vue (le profileur ralentit la requête)"""
+        if request.GET.get('profile') != '1' or not getattr(settings, 'REQUEST_PROFILER_ENABLED', False):
+            return False
+        try:
+            authenticated = CachedJWTAuthentication().authenticate(request)
+        except APIException:
+            return False
+        return authenticated is not None and authenticated[0].is_superuser
+    
+    @staticmethod
+    def server_timing(metrics, total):
+        entries = [
+            f'{name};desc="{metrics.counts[name]}";dur={metrics.durations[name] * 1000:.2f}'
+            for name in ('db', 'encrypt', 'decrypt', 'serialize') if name in metrics.counts
+        ]
+        entries.append(f'total;dur={total * 1000:.2f}')
+        return ', '.join(entries)
+    
+    @staticmethod
+    def log(request, response, metrics, total, size):
+        data = {
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'schema': connection.schema_name,
+            'duration_ms': round(total * 1000, 2),
+            'response_bytes': size,
+        }
+        for name in ('db', 'encrypt', 'decrypt', 'serialize'):
+            data[f'{name}_count'] = metrics.counts.get(name, 0)
+            data[f'{name}_ms'] = round(metrics.durations.get(name, 0.0) * 1000, 2)
+        logger.info(json.dumps(data), extra={'profile': data})
+
+
+class MetricsMiddleware:
+    """
+    Compte les requêtes et leur durée par cabinet, vue et action DRF
+    (étiquettes bornées : les URL non résolues sont regroupées).
+    """
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+    
+    def __call__(self, request):
+        start = perf_counter()
+        request.metrics_view = ('unmatched', '')
+        response = self.get_response(request)
+        duration = perf_counter() - start
+        
+        labels = (connection.schema_name,) + request.metrics_view
+        metrics.http_request_duration.observe(labels, duration)
+        metrics.http_requests.inc(labels + (f'{response.status_code // 100}xx',))
+        return response
+    
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, 'cls', None)
+        if view_class is not None:
+            # ViewSet : action DRF associée à la méthode HTTP (list, retrieve, audit_log...)
+            actions = getattr(view_func, 'actions', None) or {}
+            action = actions.get(request.method.lower(), request.method.lower())
+            request.metrics_view = (view_class.__name__, action)
+        else:
+            request.metrics_view = (getattr(view_func, '__name__', 'view'), request.method.lower())
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-17 01:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='client',
+            name='encrypted_data_key',
+            field=models.TextField(blank=True, editable=False, verbose_name='Clé de données chiffrée'),
+        ),
+    ]
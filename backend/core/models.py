@@ -26,6 +26,9 @@ class Client(TenantMixin):
     default_appointment_duration = models.IntegerField(default=30, verbose_name="Durée RDV par défaut (min)")
     emergency_slots_per_day = models.IntegerField(default=2, verbose_name="Créneaux urgence/jour")
     
+    # Clé de données du cabinet, chiffrée par la clé maître (voir patients.encryption)
+    encrypted_data_key = models.TextField(blank=True, editable=False, verbose_name="Clé de données chiffrée")
+    
     auto_create_schema = True
     
     class Meta:
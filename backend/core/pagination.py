@@ -0,0 +1,318 @@
+import base64
+import datetime
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError
+from django.db import connections
+from django.db.models import Q, QuerySet
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+# ============================================================================
+# COMPTAGES
+# ============================================================================
+
+def approximate_count(queryset):
+    """Nombre de lignes estimé par PostgreSQL, sans parcourir la table"""
+    connection = connections[queryset.db]
+    with connection.cursor() as cursor:
+        if not queryset.query.where:
+            # Table entière : statistiques maintenues par VACUUM/ANALYZE. Une table
+            # partitionnée n'en a pas (jamais analysée par l'autovacuum) : somme
+            # sur ses partitions (reltuples = -1 tant qu'une table n'est pas analysée)
+            table = queryset.model._meta.db_table
+            cursor.execute(
+                "SELECT coalesce(sum(greatest(reltuples, 0)), 0)::bigint FROM pg_class "
+                "WHERE (oid = %s::regclass AND relkind <> 'p') "
+                "OR oid IN (SELECT relid FROM pg_partition_tree(%s::regclass) WHERE isleaf)",
+                [table, table]
+            )
+            return cursor.fetchone()[0]
+
+        # Requête filtrée : estimation du planificateur
+        sql, params = queryset.order_by().query.sql_with_params()
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return plan[0]['Plan']['Plan Rows']
+
+
+# ============================================================================
+# PAGINATION PAR CURSEUR (KEYSET)
+# ============================================================================
+
+class KeysetPagination(BasePagination):
+    """
+    Pagination par curseur opaque sur un couple (colonne triée, id).
+    Pas d'OFFSET ni de COUNT(*) : chaque page est une lecture d'index,
+    stable même si des lignes sont insérées entre deux pages.
+    """
+    page_size = api_settings.PAGE_SIZE
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    invalid_cursor_message = 'Curseur invalide.'
+
+    def __init__(self, ordering=None):
+        self.ordering = ordering
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        if self.ordering is None:
+            self.ordering = get_cursor_ordering(view)
+        self.fields = [field.lstrip('-') for field in self.ordering]
+
+        archive = None
+        if isinstance(queryset, ArchivedQuerySet):
+            archive, queryset = queryset, queryset.queryset
+        position, reverse = self.decode_cursor(request, queryset.model)
+        self.count = self.get_count(queryset, request)
+        if self.count is not None and archive is not None:
+            self.count += archive.archived_count()
+
+        ordering = self.ordering
+        if reverse:
+            ordering = [self._invert(field) for field in ordering]
+        if position is not None:
+            queryset = queryset.filter(self._after(position, ordering))
+
+        if archive is None:
+            results = list(queryset.order_by(*ordering)[:self.page_size + 1])
+        else:
+            results = self._with_archive(archive, queryset, position, ordering, reverse)
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+            self.has_next, self.has_previous = position is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+
+        self.first_position = self._position(results[0]) if results else position
+        self.last_position = self._position(results[-1]) if results else position
+        return results
+
+    def get_paginated_response(self, data):
+        fields = [('next', self.get_next_link()), ('previous', self.get_previous_link())]
+        if self.count is not None:
+            fields.append(('count', self.count))
+        fields.append(('results', data))
+        return Response(OrderedDict(fields))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'count': {'type': 'integer', 'nullable': True},
+                'results': schema,
+            },
+        }
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return replace_query_param(self.base_url, self.cursor_query_param, self.encode_cursor(self.last_position, False))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        return replace_query_param(self.base_url, self.cursor_query_param, self.encode_cursor(self.first_position, True))
+
+    def _with_archive(self, archive, queryset, position, ordering, reverse):
+        """
+        Page lue en base puis complétée par les archives, plus anciennes que
+        toutes les lignes en base : lues seulement si la page les atteint.
+        """
+        limit = self.page_size + 1
+        if not reverse:
+            results = list(queryset.order_by(*ordering)[:limit])
+            if len(results) < limit:
+                results += archive.after(position, ordering, self.fields)[:limit - len(results)]
+            return results
+
+        # Sens inverse : archives plus récentes que la position, puis lignes en base
+        older = archive.queryset.filter(self._after(position, self.ordering))
+        archived = [] if older.exists() else archive.after(position, ordering, self.fields)[:limit]
+        if len(archived) < limit:
+            archived += list(queryset.order_by(*ordering)[:limit - len(archived)])
+        return archived
+
+    def get_count(self, queryset, request):
+        """Comptage optionnel : ?count=approx (statistiques PostgreSQL) ou ?count=exact"""
+        mode = request.query_params.get(self.count_query_param)
+        if mode == 'exact':
+            return queryset.count()
+        if mode == 'approx':
+            return approximate_count(queryset)
+        return None
+
+    def encode_cursor(self, position, reverse):
+        payload = json.dumps([position, int(reverse)], default=self._encode_value)
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, request, model):
+        """Retourne (position, sens inverse) ; position None pour la première page"""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            payload = base64.urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4))
+            values, reverse = json.loads(payload)
+            position = [
+                model._meta.get_field(field).to_python(value)
+                for field, value in zip(self.fields, values, strict=True)
+            ]
+        except (TypeError, ValueError, LookupError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        return position, bool(reverse)
+
+    @staticmethod
+    def _encode_value(value):
+        # Précision à la microseconde : un arrondi ferait sauter ou répéter des lignes
+        if isinstance(value, (datetime.datetime, datetime.date)):
+            return value.isoformat()
+        return str(value)
+
+    def _position(self, instance):
+        if isinstance(instance, dict):
+            return [instance[field] for field in self.fields]
+        return [getattr(instance, field) for field in self.fields]
+
+    @staticmethod
+    def _invert(field):
+        return field[1:] if field.startswith('-') else f'-{field}'
+
+    @staticmethod
+    def _after(position, ordering):
+        """Lignes situées strictement après la position dans l'ordre donné"""
+        (first, tie_breaker), (first_value, tie_value) = ordering, position
+        first_name, tie_name = first.lstrip('-'), tie_breaker.lstrip('-')
+        first_op = 'lt' if first.startswith('-') else 'gt'
+        tie_op = 'lt' if tie_breaker.startswith('-') else 'gt'
+        # La borne large sur la première colonne permet un parcours d'index
+        return Q(**{f'{first_name}__{first_op}e': first_value}) & (
+            Q(**{f'{first_name}__{first_op}': first_value}) |
+            Q(**{f'{tie_name}__{tie_op}': tie_value})
+        )
+
+
+class ArchivedQuerySet:
+    """
+    Lignes d'un QuerySet suivies d'enregistrements archivés (dicts), tous plus
+    anciens dans l'ordre de pagination. Paginé par numéro de page (tranches)
+    ou par curseur sans charger le QuerySet : les archives ne sont lues
+    (load_archived) qu'une fois les lignes en base épuisées, et comptées par
+    count_archived sans être lues (à défaut, lues pour être comptées).
+    """
+
+    def __init__(self, queryset, load_archived, count_archived=None):
+        self.queryset = queryset
+        self._load_archived = load_archived
+        self._count_archived = count_archived
+        self._archived = None
+        self._archived_count = None
+        self._queryset_count = None
+
+    @property
+    def archived(self):
+        if self._archived is None:
+            self._archived = list(self._load_archived())
+        return self._archived
+
+    def queryset_count(self):
+        if self._queryset_count is None:
+            self._queryset_count = self.queryset.count()
+        return self._queryset_count
+
+    def archived_count(self):
+        if self._archived is not None or self._count_archived is None:
+            return len(self.archived)
+        if self._archived_count is None:
+            self._archived_count = self._count_archived()
+        return self._archived_count
+
+    def count(self):
+        return self.queryset_count() + self.archived_count()
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        """Tranche [start:stop] : instances du QuerySet puis enregistrements archivés"""
+        if not isinstance(index, slice) or index.step is not None:
+            raise TypeError("Seules les tranches simples sont prises en charge")
+        start, stop = index.start or 0, index.stop if index.stop is not None else self.count()
+        in_database = self.queryset_count()
+        results = list(self.queryset[start:min(stop, in_database)]) if start < in_database else []
+        if stop > in_database:
+            results += self.archived[max(start - in_database, 0):stop - in_database]
+        return results
+
+    def after(self, position, ordering, fields):
+        """Enregistrements archivés situés strictement après la position, dans l'ordre donné"""
+        model_fields = [(field, self.queryset.model._meta.get_field(field)) for field in fields]
+
+        def key(record):
+            return [model_field.to_python(record[field]) for field, model_field in model_fields]
+
+        records = sorted(self.archived, key=key, reverse=ordering[0].startswith('-'))
+        if position is None:
+            return records
+        return [record for record in records if _is_after(key(record), position, ordering)]
+
+
+def _is_after(values, position, ordering):
+    """Comparaison lexicographique, chaque colonne dans son sens de tri"""
+    for value, reference, field in zip(values, position, ordering):
+        if value != reference:
+            return value < reference if field.startswith('-') else value > reference
+    return False
+
+
+def get_cursor_ordering(view):
+    """Ordre (colonne, id) utilisé par la vue pour la pagination par curseur"""
+    if hasattr(view, 'get_cursor_ordering'):
+        return view.get_cursor_ordering()
+    return getattr(view, 'cursor_ordering', None)
+
+
+class StandardPagination(PageNumberPagination):
+    """
+    Pagination par numéro de page par défaut ; pagination par curseur
+    si le paramètre ?cursor= est présent (vide pour la première page),
+    que la vue définit cursor_ordering et que les données sont un QuerySet
+    (éventuellement suivi d'archives, ArchivedQuerySet).
+    """
+    keyset_class = KeysetPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if (self.keyset_class.cursor_query_param in request.query_params
+                and isinstance(queryset, (QuerySet, ArchivedQuerySet)) and get_cursor_ordering(view)):
+            self.keyset = self.keyset_class()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def get_next_link(self):
+        if self.keyset is not None:
+            return self.keyset.get_next_link()
+        return super().get_next_link()
+
+    def get_previous_link(self):
+        if self.keyset is not None:
+            return self.keyset.get_previous_link()
+        return super().get_previous_link()
@@ -0,0 +1,35 @@
+from contextvars import ContextVar
+
+from django.db import DEFAULT_DB_ALIAS
+from django_tenants.postgresql_backend.base import DatabaseWrapper as TenantDatabaseWrapper
+
+# Schéma de la connexion par défaut, lisible sans passer par django.db.connection
+# (mandataire coûteux dans les chemins chauds, ex. chiffrement des champs)
+current_schema_name = ContextVar('current_schema_name', default=None)
+
+
+class DatabaseWrapper(TenantDatabaseWrapper):
+    """
+    Backend django-tenants adapté aux connexions persistantes (CONN_MAX_AGE)
+    avec TENANT_LIMIT_SET_CALLS : le search_path n'est envoyé qu'une fois par
+    requête et par cabinet, et renvoyé dès qu'il a pu être annulé.
+    """
+    
+    def set_tenant(self, tenant, include_public=True):
+        super().set_tenant(tenant, include_public)
+        if self.alias == DEFAULT_DB_ALIAS:
+            current_schema_name.set(self.schema_name)
+    
+    def close_if_unusable_or_obsolete(self):
+        # Début et fin de requête : le cabinet de la requête suivante est inconnu
+        super().close_if_unusable_or_obsolete()
+        self.search_path_set_schemas = None
+    
+    def _rollback(self):
+        # Un SET search_path fait dans la transaction annulée est lui aussi annulé
+        super()._rollback()
+        self.search_path_set_schemas = None
+    
+    def _savepoint_rollback(self, sid):
+        super()._savepoint_rollback(sid)
+        self.search_path_set_schemas = None
@@ -0,0 +1,21 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+
+
+# ============================================================================
+# PROCESSUS DE TRAVAIL
+# ============================================================================
+
+def process_pool(workers):
+    """
+    Pool de processus utilisable depuis un processus multithread (serveur web,
+    thread d'écriture de l'audit) : les processus sont créés par un serveur
+    forkserver sans les verrous hérités d'un fork, puis Django y est initialisé.
+    """
+    return ProcessPoolExecutor(
+        workers,
+        mp_context=multiprocessing.get_context('forkserver'),
+        initializer=django.setup,
+    )
@@ -0,0 +1,106 @@
+import cProfile
+import io
+import pstats
+from collections import defaultdict
+from contextvars import ContextVar
+from functools import wraps
+from time import perf_counter
+
+from rest_framework.renderers import JSONRenderer
+
+
+# ============================================================================
+# MESURES PAR REQUÊTE
+# ============================================================================
+
+# Mesures de la requête en cours, positionnées par RequestProfilingMiddleware
+current_metrics = ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    """Nombre d'appels et durée cumulée (secondes) par catégorie : db, encrypt, decrypt, serialize"""
+    
+    def __init__(self):
+        self.counts = defaultdict(int)
+        self.durations = defaultdict(float)
+    
+    def add(self, name, duration):
+        self.counts[name] += 1
+        self.durations[name] += duration
+
+
+def record(name, duration):
+    """Ajoute une mesure à la requête en cours (sans effet hors requête)"""
+    metrics = current_metrics.get()
+    if metrics is not None:
+        metrics.add(name, duration)
+
+
+def profiled(name):
+    """Décorateur : compte les appels et le temps passé dans la fonction"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            metrics = current_metrics.get()
+            if metrics is None:
+                return func(*args, **kwargs)
+            start = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                metrics.add(name, perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def query_timer(execute, sql, params, many, context):
+    """Enveloppe d'exécution SQL (connection.execute_wrapper)"""
+    start = perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        record('db', perf_counter() - start)
+
+
+class ProfiledSerializerMixin:
+    """Compte le temps de sérialisation (to_representation) des objets"""
+    
+    def to_representation(self, instance):
+        metrics = current_metrics.get()
+        if metrics is None:
+            return super().to_representation(instance)
+        start = perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            metrics.add('serialize', perf_counter() - start)
+
+
+class ProfiledJSONRenderer(JSONRenderer):
+    """JSONRenderer dont l'encodage compte dans le temps de sérialisation"""
+    
+    @profiled('serialize')
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return super().render(data, accepted_media_type, renderer_context)
+
+
+# ============================================================================
+# PROFIL CPROFILE
+# ============================================================================
+
+def profile_summary(profiler, limit=40):
+    """Résumé texte d'un profil, trié par temps cumulé"""
+    output = io.StringIO()
+    stats = pstats.Stats(profiler, stream=output)
+    stats.strip_dirs().sort_stats(pstats.SortKey.CUMULATIVE).print_stats(limit)
+    return output.getvalue()
+
+
+def start_profiler():
+    """Démarre un profileur, ou None si un autre est déjà actif (Python 3.12+)"""
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        return None
+    return profiler
@@ -0,0 +1,143 @@
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from rest_framework.permissions import SAFE_METHODS
+
+
+# ============================================================================
+# LECTURES SUR RÉPLICAS
+# ============================================================================
+
+# Lectures de la requête en cours autorisées sur un réplica (ReplicaReadMixin)
+use_replica = ContextVar('use_replica', default=False)
+
+# Retard de réplication en secondes ; NULL si le réplica n'a encore rien rejoué
+REPLICATION_LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE extract(epoch FROM now() - pg_last_xact_replay_timestamp())
+    END
+"""
+
+_health = {}
+
+
+def get_replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def replica_is_healthy(alias):
+    """Réplica joignable et en retard de moins de REPLICA_MAX_LAG secondes (vérifié périodiquement)"""
+    now = time.monotonic()
+    checked_at, healthy = _health.get(alias, (None, False))
+    if checked_at is not None and now - checked_at < getattr(settings, 'REPLICA_HEALTH_CHECK_INTERVAL', 5):
+        return healthy
+    try:
+        with connections[alias].cursor() as cursor:
+            cursor.execute(REPLICATION_LAG_SQL)
+            lag = cursor.fetchone()[0]
+        healthy = lag is not None and lag <= getattr(settings, 'REPLICA_MAX_LAG', 5)
+    except DatabaseError:
+        healthy = False
+    _health[alias] = (now, healthy)
+    return healthy
+
+
+@contextmanager
+def read_from_primary():
+    """
+    Lectures du bloc sur le primaire, même dans une action replica_actions :
+    pour les résultats mis en cache, qu'un réplica en retard rendrait périmés
+    pour toute la durée du cache.
+    """
+    token = use_replica.set(False)
+    try:
+        yield
+    finally:
+        use_replica.reset(token)
+
+
+def _sticky_key(user):
+    return f'replica:sticky:{user.pk}'
+
+
+def mark_write(user):
+    """Les lectures de cet utilisateur restent sur le primaire quelques secondes"""
+    if not get_replicas():
+        return  # tout est lu sur le primaire : rien à retenir
+    cache.set(_sticky_key(user), True, getattr(settings, 'REPLICA_STICKY_SECONDS', 5))
+
+
+def is_sticky(user):
+    if not get_replicas():
+        return False
+    return user.is_authenticated and cache.get(_sticky_key(user), False)
+
+
+class ReplicaRouter:
+    """
+    Envoie les lectures autorisées (use_replica) vers un réplica sain, avec le
+    search_path du cabinet courant ; tout le reste va au primaire.
+    Se place avant django_tenants.routers.TenantSyncRouter.
+    """
+    
+    def db_for_read(self, model, **hints):
+        if not use_replica.get() or not get_replicas():
+            return None
+        if model._meta.app_label == 'django_cache':
+            return DEFAULT_DB_ALIAS  # cache partagé (DatabaseCache) : jamais en retard
+        primary = connections[DEFAULT_DB_ALIAS]
+        if primary.in_atomic_block:
+            return DEFAULT_DB_ALIAS  # lire ce que la transaction vient d'écrire
+        
+        healthy = [alias for alias in get_replicas() if replica_is_healthy(alias)]
+        if not healthy:
+            return DEFAULT_DB_ALIAS
+        alias = random.choice(healthy)
+        replica = connections[alias]
+        if replica.schema_name != primary.schema_name:
+            replica.set_tenant(primary.tenant)
+        return alias
+    
+    def db_for_write(self, model, **hints):
+        # Jamais vers un réplica, même pour un objet qui en a été lu
+        return DEFAULT_DB_ALIAS if get_replicas() else None
+    
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {DEFAULT_DB_ALIAS, *get_replicas()}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+    
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Les réplicas reçoivent le schéma par réplication
+        return False if db in get_replicas() else None
+
+
+class ReplicaReadMixin:
+    """
+    ViewSet dont les actions replica_actions lisent sur un réplica, sauf dans
+    les REPLICA_STICKY_SECONDS qui suivent une écriture du même utilisateur.
+    """
+    replica_actions = ['list', 'retrieve']
+    
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if self.action in self.replica_actions and not is_sticky(request.user):
+            self._replica_token = use_replica.set(True)
+    
+    def finalize_response(self, request, response, *args, **kwargs):
+        token = getattr(self, '_replica_token', None)
+        if token is not None:
+            use_replica.reset(token)
+            self._replica_token = None
+        if (request.method not in SAFE_METHODS and self.action not in self.replica_actions
+                and response.status_code < 400 and request.user.is_authenticated):
+            mark_write(request.user)
+        return super().finalize_response(request, response, *args, **kwargs)
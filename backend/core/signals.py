@@ -0,0 +1,29 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import authentication, tenants
+from .models import Client, Domain
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=Client)
+@receiver(post_delete, sender=Client)
+def invalidate_tenant_cache(sender, instance, **kwargs):
+    """Un cabinet modifié ou supprimé n'est plus servi depuis le cache"""
+    tenants.invalidate_tenant(instance.pk)
+
+
+@receiver(post_save, sender=Domain)
+@receiver(post_delete, sender=Domain)
+def invalidate_domain_cache(sender, instance, **kwargs):
+    """Un domaine ajouté, modifié ou supprimé invalide les noms d'hôte de son cabinet"""
+    tenants.invalidate_tenant(instance.tenant_id)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_cache(sender, instance, **kwargs):
+    """Rôle, activation, mot de passe ou verrouillage modifiés : relire l'utilisateur"""
+    authentication.invalidate_user(instance)
@@ -0,0 +1,71 @@
+import copy
+
+from django.conf import settings
+from django.core.cache import cache
+from django_tenants.utils import get_tenant_domain_model
+
+from .cache import LRUCache
+
+
+# ============================================================================
+# RÉSOLUTION DES CABINETS PAR NOM D'HÔTE (CACHE)
+# ============================================================================
+#
+# Cache local au processus (nom d'hôte -> cabinet), éventuellement adossé au
+# cache Django partagé (TENANT_CACHE_SHARED). Les signaux de Client et Domain
+# vident le cache local et changent la version du cache partagé ; les autres
+# processus voient la modification au plus tard après TENANT_CACHE_TTL.
+
+_VERSION_KEY = 'tenants:version'
+
+_cache = LRUCache(
+    maxsize=getattr(settings, 'TENANT_CACHE_SIZE', 1024),
+    ttl=getattr(settings, 'TENANT_CACHE_TTL', 60),
+)
+
+
+def _shared_enabled():
+    return getattr(settings, 'TENANT_CACHE_SHARED', False)
+
+
+def _shared_key(hostname):
+    version = cache.get_or_set(_VERSION_KEY, 1, None)
+    return f'tenants:{version}:{hostname}'
+
+
+def get_tenant_for_hostname(hostname):
+    """
+    Cabinet actif servi par un nom d'hôte, copié pour la requête.
+    Lève Domain.DoesNotExist si le domaine est inconnu ou le cabinet inactif.
+    """
+    domain_model = get_tenant_domain_model()
+    tenant = _cache.get(hostname)
+    if tenant is None:
+        shared_key = _shared_key(hostname) if _shared_enabled() else None
+        if shared_key is not None:
+            tenant = cache.get(shared_key)
+        if tenant is None:
+            tenant = domain_model.objects.select_related('tenant').get(domain=hostname).tenant
+        if not tenant.is_active:
+            raise domain_model.DoesNotExist(f'Cabinet inactif pour "{hostname}"')
+        _cache.set(hostname, tenant)
+        if shared_key is not None:
+            cache.set(shared_key, tenant, getattr(settings, 'TENANT_CACHE_SHARED_TTL', 3600))
+    
+    # Copie : domain_url et autres attributs posés par requête ne sont pas partagés
+    return copy.copy(tenant)
+
+
+def invalidate_tenant(tenant_id):
+    """Oublie les noms d'hôte d'un cabinet (local) et tout le cache partagé"""
+    _cache.delete_where(lambda hostname, tenant: tenant.pk == tenant_id)
+    if _shared_enabled():
+        try:
+            cache.incr(_VERSION_KEY)
+        except ValueError:
+            cache.set(_VERSION_KEY, 2, None)
+
+
+def clear():
+    """Vide le cache local des cabinets"""
+    _cache.clear()
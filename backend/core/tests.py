@@ -1,3 +1,436 @@
-from django.test import TestCase
+import time
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django_tenants.test.cases import TenantTestCase
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import authentication, metrics, profiling, routers, tenants
+from .models import Client, Domain
+
+User = get_user_model()
+
+
+class CoreTestCase(TenantTestCase):
+    """Cabinet de test, paramètres modifiés pour la durée du test"""
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient(HTTP_HOST=self.domain.domain)
+
+    def settings(self, **kwargs):
+        # TenantTestCase ignore les décorateurs de classe
+        overridden = override_settings(AUDIT_LOG_ASYNC=False, **kwargs)
+        overridden.enable()
+        self.addCleanup(overridden.disable)
+
+    def bearer(self, user):
+        return {'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(user)}'}
+
+
+# ============================================================================
+# CABINETS PAR NOM D'HÔTE (CACHE)
+# ============================================================================
+
+class TenantCacheTests(CoreTestCase):
+    """Nom d'hôte résolu sans requête une fois en cache, invalidé par les signaux"""
+
+    def setUp(self):
+        super().setUp()
+        self.settings()
+        tenants.clear()
+        self.addCleanup(tenants.clear)
+        self.hostname = self.domain.domain
+
+    def lookup(self, queries):
+        """Résolution du nom d'hôte ; queries : lectures attendues des domaines"""
+        with CaptureQueriesContext(connection) as captured:
+            tenant = tenants.get_tenant_for_hostname(self.hostname)
+        self.assertEqual(len(self.domain_queries(captured)), queries)
+        return tenant
+
+    @staticmethod
+    def domain_queries(captured):
+        return [query['sql'] for query in captured if 'core_domain' in query['sql']]
+
+    def fresh_tenant(self):
+        # Copie : le cabinet de la classe de test est partagé entre les tests
+        return Client.objects.get(pk=self.tenant.pk)
+
+    def test_warm_lookup_makes_no_query(self):
+        first = self.lookup(1)
+        with self.assertNumQueries(0):
+            second = tenants.get_tenant_for_hostname(self.hostname)
+        self.assertEqual(second.pk, self.tenant.pk)
+        self.assertIsNot(second, first)
+
+    def test_middleware_uses_cache(self):
+        self.client.get('/introuvable/')
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/introuvable/')
+        self.assertEqual(self.domain_queries(queries), [])
+
+    def test_client_save_invalidates(self):
+        self.lookup(1)
+        tenant = self.fresh_tenant()
+        tenant.name = 'Cabinet renommé'
+        tenant.save()
+        self.assertEqual(self.lookup(1).name, 'Cabinet renommé')
+
+    def test_domain_save_invalidates(self):
+        self.lookup(1)
+        Domain.objects.create(domain='autre.test.com', tenant=self.tenant, is_primary=False)
+        self.lookup(1)
+        Domain.objects.filter(domain='autre.test.com').get().delete()
+        self.lookup(1)
+
+    def test_inactive_tenant_not_found(self):
+        self.assertEqual(self.client.get('/introuvable/').status_code, 404)  # cache rempli
+        tenant = self.fresh_tenant()
+        tenant.is_active = False
+        tenant.save()
+        with self.assertRaises(Domain.DoesNotExist):
+            tenants.get_tenant_for_hostname(self.hostname)
+        user = User.objects.create_user(username='dentiste', password='x', role='DENTIST')
+        response = self.client.get('/api/patients/', **self.bearer(user))
+        self.assertEqual(response.status_code, 404)
+
+    def test_entries_expire_after_ttl(self):
+        self.lookup(1)
+        # Modification par un autre processus : aucun signal dans celui-ci
+        Client.objects.filter(pk=self.tenant.pk).update(name='Cabinet renommé')
+        self.assertNotEqual(self.lookup(0).name, 'Cabinet renommé')
+        expired = time.monotonic() + settings.TENANT_CACHE_TTL + 1
+        with mock.patch('core.cache.time.monotonic', return_value=expired):
+            self.assertEqual(self.lookup(1).name, 'Cabinet renommé')
+
+
+# ============================================================================
+# PROFILAGE DES REQUÊTES
+# ============================================================================
+
+class RequestProfilingTests(CoreTestCase):
+    """?profile=1 : profileur démarré seulement pour un superutilisateur authentifié"""
+
+    def setUp(self):
+        super().setUp()
+        self.settings(REQUEST_PROFILING=True, REQUEST_PROFILER_ENABLED=True)
+        self.admin = User.objects.create_superuser(username='admin', password='x', role='ADMIN')
+        self.dentist = User.objects.create_user(username='dentiste', password='x', role='DENTIST')
+
+    def get(self, **headers):
+        with mock.patch('core.middleware.start_profiler', wraps=profiling.start_profiler) as start:
+            response = self.client.get('/api/patients/?profile=1', **headers)
+        return response, start.called
+
+    def test_anonymous_never_profiled(self):
+        response, started = self.get()
+        self.assertFalse(started)
+        self.assertEqual(response.status_code, 401)
+        self.assertIn('Server-Timing', response)
+
+    def test_non_superuser_never_profiled(self):
+        response, started = self.get(**self.bearer(self.dentist))
+        self.assertFalse(started)
+        self.assertEqual(response.status_code, 200)
+
+    def test_superuser_profiled(self):
+        response, started = self.get(**self.bearer(self.admin))
+        self.assertTrue(started)
+        self.assertEqual(response['Content-Type'], 'text/plain; charset=utf-8')
+        self.assertIn(b'cumulative', response.content)
+
+    def test_profiler_disabled_by_default(self):
+        self.settings(REQUEST_PROFILER_ENABLED=False)
+        response, started = self.get(**self.bearer(self.admin))
+        self.assertFalse(started)
+        self.assertEqual(response.status_code, 200)
+
+
+# ============================================================================
+# MÉTRIQUES PROMETHEUS
+# ============================================================================
+
+class MetricsViewTests(CoreTestCase):
+    """/metrics : refusé sans jeton configuré, sinon jeton Bearer exigé"""
+
+    def test_refused_without_configured_token(self):
+        self.settings(METRICS_TOKEN='')
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer ')
+        self.assertEqual(response.status_code, 403)
+
+    def test_wrong_token_rejected(self):
+        self.settings(METRICS_TOKEN='secret')
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer autre')
+        self.assertEqual(response.status_code, 401)
+
+    def test_valid_token_served(self):
+        self.settings(METRICS_TOKEN='secret')
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+
+
+class MetricsMiddlewareTests(CoreTestCase):
+    """Étiquettes bornées : vue et action DRF plutôt que le chemin, classe de statut"""
+
+    def setUp(self):
+        super().setUp()
+        self.settings()
+        self.user = User.objects.create_user(username='dentiste', password='x', role='DENTIST')
+        self.client.force_authenticate(self.user)
+
+    def counts(self):
+        """(requêtes par étiquettes, observations de durée par étiquettes) du cabinet de test"""
+        schema = self.tenant.schema_name
+        requests = {labels[1:]: value for labels, value in metrics.http_requests._values.items() if labels[0] == schema}
+        durations = {
+            labels[1:]: sum(series[:-1])
+            for labels, series in metrics.http_request_duration._series.items() if labels[0] == schema
+        }
+        return requests, durations
+
+    def test_labels(self):
+        requests_before, durations_before = self.counts()
+        for path in ['/api/patients/', '/api/patients/999999/', '/api/patients/999998/', '/introuvable/123/']:
+            self.client.get(path)
+        requests, durations = self.counts()
+
+        def new(counts, before):
+            return {labels: value - before.get(labels, 0) for labels, value in counts.items() if value != before.get(labels, 0)}
+
+        self.assertEqual(new(requests, requests_before), {
+            ('PatientViewSet', 'list', '2xx'): 1,
+            ('PatientViewSet', 'retrieve', '4xx'): 2,
+            ('unmatched', '', '4xx'): 1,
+        })
+        self.assertEqual(new(durations, durations_before), {
+            ('PatientViewSet', 'list'): 1,
+            ('PatientViewSet', 'retrieve'): 2,
+            ('unmatched', ''): 1,
+        })
+        exposition = metrics.registry.exposition()
+        for raw in ['999999', '/api/patients', 'introuvable']:
+            self.assertNotIn(raw, exposition)
+
+
+class HistogramTests(SimpleTestCase):
+    """Format d'exposition : _bucket cumulatifs jusqu'à le="+Inf", puis _count et _sum"""
+
+    def test_exposition(self):
+        registry = metrics.Registry()
+        histogram = registry.histogram('duree_secondes', "Durée", ('vue',), buckets=(0.1, 1.0, 0.5))
+        for value in (0.05, 0.1, 0.3, 0.7, 2.0):
+            histogram.observe(('liste',), value)
+        histogram.observe(('détail "x"',), 0.2)
+
+        self.assertEqual(registry.exposition().splitlines(), [
+            '# HELP duree_secondes Durée',
+            '# TYPE duree_secondes histogram',
+            'duree_secondes_bucket{vue="liste",le="0.1"} 2',
+            'duree_secondes_bucket{vue="liste",le="0.5"} 3',
+            'duree_secondes_bucket{vue="liste",le="1"} 4',
+            'duree_secondes_bucket{vue="liste",le="+Inf"} 5',
+            'duree_secondes_count{vue="liste"} 5',
+            'duree_secondes_sum{vue="liste"} 3.15',
+            'duree_secondes_bucket{vue="détail \\"x\\"",le="0.1"} 0',
+            'duree_secondes_bucket{vue="détail \\"x\\"",le="0.5"} 1',
+            'duree_secondes_bucket{vue="détail \\"x\\"",le="1"} 1',
+            'duree_secondes_bucket{vue="détail \\"x\\"",le="+Inf"} 1',
+            'duree_secondes_count{vue="détail \\"x\\""} 1',
+            'duree_secondes_sum{vue="détail \\"x\\""} 0.2',
+        ])
+
+
+# ============================================================================
+# BACKEND POSTGRESQL (search_path mémorisé)
+# ============================================================================
+
+class SearchPathBackendTests(CoreTestCase):
+    """Le search_path mémorisé est oublié quand son SET a pu être annulé"""
+
+    def current_search_path(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SHOW search_path')
+            return cursor.fetchone()[0]
+
+    def test_set_once_per_tenant(self):
+        self.current_search_path()
+        self.assertEqual(connection.search_path_set_schemas, [self.tenant.schema_name, 'public'])
+
+    def test_savepoint_rollback_resends_search_path(self):
+        connection.set_schema_to_public()
+        self.assertNotIn(self.tenant.schema_name, self.current_search_path())
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                # SET search_path envoyé dans le point de sauvegarde annulé
+                connection.set_tenant(self.tenant)
+                self.assertIn(self.tenant.schema_name, self.current_search_path())
+                raise RuntimeError
+        self.assertIn(self.tenant.schema_name, self.current_search_path())
+        self.assertEqual(User.objects.count(), 0)
+
+
+# ============================================================================
+# AUTHENTIFICATION JWT (cache des utilisateurs)
+# ============================================================================
+
+class CachedJWTAuthenticationTests(CoreTestCase):
+    """Utilisateur servi depuis le cache, relu après sauvegarde ou suppression"""
+
+    def setUp(self):
+        super().setUp()
+        self.settings()
+        authentication.clear()
+        self.addCleanup(authentication.clear)
+        self.user = User.objects.create_user(username='dentiste', password='x', role='DENTIST')
+        self.token = AccessToken.for_user(self.user)
+        self.backend = authentication.CachedJWTAuthentication()
+
+    def test_cached_user_served_without_query(self):
+        with self.assertNumQueries(1):
+            self.backend.get_user(self.token)
+        with self.assertNumQueries(0):
+            user = self.backend.get_user(self.token)
+        self.assertEqual(user.pk, self.user.pk)
+
+    def test_cached_user_is_copied(self):
+        self.backend.get_user(self.token).custom_attribute = True
+        self.assertFalse(hasattr(self.backend.get_user(self.token), 'custom_attribute'))
+
+    def test_save_invalidates_cached_user(self):
+        self.backend.get_user(self.token)
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.backend.get_user(self.token)
+
+    def test_lock_invalidates_cached_user(self):
+        self.backend.get_user(self.token)
+        self.user.account_locked_until = timezone.now() + timedelta(minutes=15)
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.backend.get_user(self.token)
+
+    def test_delete_invalidates_cached_user(self):
+        self.backend.get_user(self.token)
+        self.user.delete()
+        with self.assertRaises(AuthenticationFailed):
+            self.backend.get_user(self.token)
+
+    def test_api_request_rejected_after_deactivation(self):
+        headers = self.bearer(self.user)
+        self.assertEqual(self.client.get('/api/patients/', **headers).status_code, 200)
+        self.user.is_active = False
+        self.user.save(update_fields=['is_active'])
+        self.assertEqual(self.client.get('/api/patients/', **headers).status_code, 401)
+
+
+# ============================================================================
+# ROUTAGE DES LECTURES SUR RÉPLICAS
+# ============================================================================
+
+class ReplicaRouterTests(CoreTestCase):
+    """Lectures autorisées sur un réplica sain, tout le reste sur le primaire"""
+
+    def setUp(self):
+        super().setUp()
+        self.settings(DATABASE_REPLICAS=['replica1'])
+        self.primary = mock.Mock(in_atomic_block=False, schema_name=self.tenant.schema_name, tenant=self.tenant)
+        self.replica = mock.Mock(schema_name='public')
+        for target, value in [
+            ('core.routers.connections', {'default': self.primary, 'replica1': self.replica}),
+            ('core.routers.replica_is_healthy', lambda alias: True),
+        ]:
+            patcher = mock.patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.router = routers.ReplicaRouter()
+
+    def db_for_read(self, model=User):
+        token = routers.use_replica.set(True)
+        try:
+            return self.router.db_for_read(model)
+        finally:
+            routers.use_replica.reset(token)
+
+    def test_reads_stay_on_primary_without_use_replica(self):
+        self.assertIsNone(self.router.db_for_read(User))
+
+    def test_reads_stay_on_primary_without_replicas(self):
+        self.settings(DATABASE_REPLICAS=[])
+        self.assertIsNone(self.db_for_read())
+        self.assertIsNone(self.router.db_for_write(User))
+
+    def test_replica_read_follows_tenant(self):
+        self.assertEqual(self.db_for_read(), 'replica1')
+        self.replica.set_tenant.assert_called_once_with(self.tenant)
+        self.assertEqual(self.router.db_for_write(User), 'default')
+
+    def test_unhealthy_replica_falls_back_to_primary(self):
+        with mock.patch('core.routers.replica_is_healthy', lambda alias: False):
+            self.assertEqual(self.db_for_read(), 'default')
+
+    def test_atomic_block_reads_primary(self):
+        self.primary.in_atomic_block = True
+        self.assertEqual(self.db_for_read(), 'default')
+
+    def test_shared_cache_reads_primary(self):
+        model = mock.Mock(_meta=mock.Mock(app_label='django_cache'))
+        self.assertEqual(self.db_for_read(model), 'default')
+
+    def test_read_from_primary(self):
+        token = routers.use_replica.set(True)
+        try:
+            with routers.read_from_primary():
+                self.assertIsNone(self.router.db_for_read(User))
+            self.assertEqual(self.router.db_for_read(User), 'replica1')
+        finally:
+            routers.use_replica.reset(token)
+
+
+class ReplicaStickinessTests(CoreTestCase):
+    """Après une écriture, les lectures du même utilisateur restent sur le primaire"""
+
+    def setUp(self):
+        super().setUp()
+        self.settings(DATABASE_REPLICAS=['replica1'])
+        self.user = User.objects.create_user(username='dentiste', password='x', role='DENTIST')
+        self.other = User.objects.create_user(username='assistant', password='x', role='DENTIST')
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def test_write_makes_user_sticky(self):
+        self.assertFalse(routers.is_sticky(self.user))
+        response = self.client.post(
+            '/api/patients/',
+            {'first_name': 'Jean', 'last_name': 'Dupont', 'gender': 'M', 'birth_date': '1980-01-01'},
+            format='json',
+            **self.bearer(self.user),
+        )
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertTrue(routers.is_sticky(self.user))
+        self.assertFalse(routers.is_sticky(self.other))
+
+    def test_failed_write_not_sticky(self):
+        response = self.client.post('/api/patients/', {}, format='json', **self.bearer(self.user))
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(routers.is_sticky(self.user))
+
+    def test_no_stickiness_without_replicas(self):
+        self.settings(DATABASE_REPLICAS=[])
+        routers.mark_write(self.user)
+        self.assertFalse(routers.is_sticky(self.user))
+        self.settings(DATABASE_REPLICAS=['replica1'])
+        self.assertFalse(routers.is_sticky(self.user))
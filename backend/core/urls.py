@@ -6,7 +6,8 @@ from .views import (
     CustomTokenObtainPairView,
     CustomUserViewSet,
     ClientViewSet,
-    DomainViewSet
+    DomainViewSet,
+    metrics_view
 )
 
 # Router pour les ViewSets
@@ -22,4 +23,7 @@ urlpatterns = [
     
     # APIs REST
     path('api/', include(router.urls)),
+    
+    # Métriques Prometheus
+    path('metrics', metrics_view, name='metrics'),
 ]
@@ -3,9 +3,13 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework_simplejwt.views import TokenObtainPairView
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.db.models import Q
+from django.http import HttpResponse
+from django.utils.crypto import constant_time_compare
 
+from .metrics import registry
 from .models import Client, Domain
 from .serializers import (
     CustomUserSerializer, CustomUserCreateSerializer,
@@ -148,3 +152,14 @@ class DomainViewSet(viewsets.ReadOnlyModelViewSet):
     def get_queryset(self):
         """Retourner seulement les domaines du tenant actuel"""
         return Domain.objects.filter(tenant=self.request.tenant)
+
+
+def metrics_view(request):
+    """Métriques du processus au format d'exposition Prometheus"""
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if not token:
+        # Noms des cabinets et trafic par cabinet : jamais exposés sans jeton
+        return HttpResponse(status=403)
+    if not constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponse(status=401)
+    return HttpResponse(registry.exposition(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.utils.html import format_html
-from .models import Patient, AuditLog
+from .models import Patient, AuditLog, PatientImport
 
 
 # ============================================================================
@@ -32,6 +32,12 @@ class PatientAdmin(admin.ModelAdmin):
             'classes': ('collapse',)
         })
     )
+    
+    def get_search_results(self, request, queryset, search_term):
+        """Recherche via les index aveugles (les champs chiffrés ne sont pas lisibles en base)"""
+        if not search_term:
+            return queryset, False
+        return queryset.search(search_term), False
 
 
 @admin.register(AuditLog)
@@ -46,3 +52,16 @@ class AuditLogAdmin(admin.ModelAdmin):
     
     def has_change_permission(self, request, obj=None):
         return False  # Les logs d'audit ne peuvent pas être modifiés
+
+
+@admin.register(PatientImport)
+class PatientImportAdmin(admin.ModelAdmin):
+    list_display = ['created_at', 'created_by', 'file_name', 'status', 'processed', 'created', 'error_count']
+    list_filter = ['status', 'file_format']
+    readonly_fields = [
+        'status', 'file_format', 'file_name', 'processed', 'created', 'error_count', 'errors',
+        'created_by', 'created_at', 'updated_at', 'finished_at'
+    ]
+    
+    def has_add_permission(self, request):
+        return False  # Les imports sont lancés depuis l'API ou import_patients
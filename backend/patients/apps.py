@@ -4,3 +4,15 @@ from django.apps import AppConfig
 class PatientsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'patients'
+    
+    def ready(self):
+        # Enregistrer les signaux de l'application
+        from . import signals  # noqa: F401
+        
+        # Entrées du journal d'audit en attente d'écriture (/metrics)
+        from core.metrics import registry
+        from .audit import audit_writer
+        registry.gauge(
+            'edental_audit_log_pending', "Logs d'audit en attente d'écriture",
+            callback=lambda: {(): audit_writer.pending()}
+        )
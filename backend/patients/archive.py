@@ -0,0 +1,251 @@
+import json
+import mmap
+import os
+import zlib
+from pathlib import Path
+
+from django.conf import settings
+from rest_framework import serializers
+
+from core.cache import LRUCache
+
+
+# ============================================================================
+# ARCHIVES FROIDES DU JOURNAL D'AUDIT
+# ============================================================================
+
+class AuditArchive:
+    """
+    Segments d'archive en ajout seul, un par cabinet et par mois :
+
+        <AUDIT_ARCHIVE_DIR>/<schéma>/<AAAA-MM>.seg       blocs zlib de lignes NDJSON
+        <AUDIT_ARCHIVE_DIR>/<schéma>/<AAAA-MM>.idx.json  index des blocs et nombre de lignes
+                                                         par objet et utilisateur
+
+    La lecture mappe le segment en mémoire et ne décompresse que les blocs
+    indiqués par l'index ; les comptages n'en décompressent aucun.
+    """
+    block_size = 256
+    compression_level = 6
+
+    def __init__(self, root=None):
+        self._root = root
+        self._indexes = LRUCache(maxsize=256)
+
+    @property
+    def root(self):
+        return Path(self._root or getattr(settings, 'AUDIT_ARCHIVE_DIR', 'audit_archive'))
+
+    def segment_paths(self, schema_name, month):
+        """Chemins (segment, index) d'un mois"""
+        directory = self.root / schema_name
+        name = f'{month.year:04d}-{month.month:02d}'
+        return directory / f'{name}.seg', directory / f'{name}.idx.json'
+
+    # ------------------------------------------------------------------
+    # Écriture
+    # ------------------------------------------------------------------
+
+    def append(self, schema_name, month, records):
+        """Ajoute des enregistrements (dicts) au segment du mois ; retourne le nombre de nouveaux"""
+        segment_path, index_path = self.segment_paths(schema_name, month)
+        segment_path.parent.mkdir(parents=True, exist_ok=True)
+        if index_path.exists():
+            with open(index_path) as f:
+                index = json.load(f)
+            if 'counts' not in index:
+                self._add_counts(segment_path, index)
+        else:
+            index = {'blocks': [], 'object': {}, 'user': {}, 'counts': {'object': {}, 'user': {}}, 'max_id': None}
+
+        count = 0
+        records = self._new_records(segment_path, index, records)
+        with open(segment_path, 'ab') as segment:
+            offset = segment.seek(0, os.SEEK_END)
+            for block in self._blocks(records):
+                payload = zlib.compress(
+                    '\n'.join(json.dumps(record) for record in block).encode(),
+                    self.compression_level
+                )
+                segment.write(payload)
+                block_id = len(index['blocks'])
+                index['blocks'].append([offset, len(payload), len(block)])
+                offset += len(payload)
+                count += len(block)
+                for record in block:
+                    self._index_record(index, record, block_id)
+            segment.flush()
+            os.fsync(segment.fileno())
+
+        # Remplacement atomique de l'index une fois le segment écrit
+        tmp_path = index_path.with_suffix('.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(index, f, separators=(',', ':'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, index_path)
+        return count
+
+    def _new_records(self, segment_path, index, records):
+        """
+        Enregistrements pas encore archivés : un archivage interrompu puis relancé
+        réécrit des lignes déjà présentes, écartées pour que les comptages restent
+        exacts. Le segment n'est relu qu'à la première ligne d'id déjà atteint.
+        """
+        blocks, max_id, existing = list(index['blocks']), index['max_id'], None
+        for record in records:
+            if max_id is not None and record['id'] <= max_id:
+                if existing is None:
+                    existing = {r['id'] for r in self._segment_records(segment_path, blocks)}
+                if record['id'] in existing:
+                    continue
+            yield record
+
+    def _index_record(self, index, record, block_id):
+        object_key = self.object_key(record['model_name'], record['object_id'])
+        self._add_to_index(index['object'], object_key, block_id)
+        self._count(index['counts']['object'], object_key)
+        if record['user'] is not None:
+            self._add_to_index(index['user'], str(record['user']), block_id)
+            self._count(index['counts']['user'], str(record['user']))
+        if index['max_id'] is None or record['id'] > index['max_id']:
+            index['max_id'] = record['id']
+
+    def _add_counts(self, segment_path, index):
+        """Index écrit avant les comptages : complété une fois en relisant le segment"""
+        index['counts'], index['max_id'] = {'object': {}, 'user': {}}, None
+        records = {r['id']: r for r in self._segment_records(segment_path, index['blocks'])}
+        for record in records.values():
+            object_key = self.object_key(record['model_name'], record['object_id'])
+            self._count(index['counts']['object'], object_key)
+            if record['user'] is not None:
+                self._count(index['counts']['user'], str(record['user']))
+            if index['max_id'] is None or record['id'] > index['max_id']:
+                index['max_id'] = record['id']
+
+    def _blocks(self, records):
+        block = []
+        for record in records:
+            block.append(record)
+            if len(block) >= self.block_size:
+                yield block
+                block = []
+        if block:
+            yield block
+
+    @staticmethod
+    def _add_to_index(index, key, block_id):
+        block_ids = index.setdefault(key, [])
+        if not block_ids or block_ids[-1] != block_id:
+            block_ids.append(block_id)
+
+    @staticmethod
+    def _count(counts, key):
+        counts[key] = counts.get(key, 0) + 1
+
+    @staticmethod
+    def object_key(model_name, object_id):
+        return f'{model_name}:{object_id}'
+
+    # ------------------------------------------------------------------
+    # Lecture
+    # ------------------------------------------------------------------
+
+    def lookup(self, schema_name, model_name=None, object_id=None, user_id=None):
+        """Enregistrements archivés d'un objet ou d'un utilisateur, du plus récent au plus ancien"""
+        section, key = self._section(model_name, object_id, user_id)
+        records = {}
+        for index_path, index in self._indexes_of(schema_name):
+            for record in self._matching_records(index_path, index, section, key):
+                # Un archivage interrompu puis relancé peut dupliquer des lignes
+                records[record['id']] = record
+        return sorted(records.values(), key=lambda r: (r['timestamp'], r['id']), reverse=True)
+
+    def count(self, schema_name, model_name=None, object_id=None, user_id=None):
+        """Nombre d'enregistrements archivés d'un objet ou d'un utilisateur, lu dans les index"""
+        section, key = self._section(model_name, object_id, user_id)
+        total = 0
+        for index_path, index in self._indexes_of(schema_name):
+            if 'counts' in index:
+                total += index['counts'][section].get(key, 0)
+            else:  # index antérieur aux comptages, pas encore complété par un ajout
+                total += len({r['id'] for r in self._matching_records(index_path, index, section, key)})
+        return total
+
+    def _section(self, model_name, object_id, user_id):
+        if object_id is not None:
+            return 'object', self.object_key(model_name, object_id)
+        return 'user', str(user_id)
+
+    def _indexes_of(self, schema_name):
+        """(chemin, index) des segments d'un cabinet"""
+        directory = self.root / schema_name
+        if not directory.is_dir():
+            return
+        for index_path in directory.glob('*.idx.json'):
+            index = self._read_index(index_path)
+            if index:
+                yield index_path, index
+
+    def _matching_records(self, index_path, index, section, key):
+        """Enregistrements d'un segment correspondant à la clé, blocs indiqués par l'index seulement"""
+        block_ids = index[section].get(key)
+        if not block_ids:
+            return
+        segment_path = index_path.with_name(index_path.name.replace('.idx.json', '.seg'))
+        blocks = [index['blocks'][block_id] for block_id in block_ids]
+        for record in self._segment_records(segment_path, blocks):
+            if self._matches(record, section, key):
+                yield record
+
+    @staticmethod
+    def _segment_records(segment_path, blocks):
+        """Enregistrements des blocs [offset, longueur, lignes] d'un segment"""
+        if not blocks:
+            return
+        with open(segment_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            for offset, length, _ in blocks:
+                for line in zlib.decompress(data[offset:offset + length]).splitlines():
+                    yield json.loads(line)
+
+    def _matches(self, record, section, key):
+        if section == 'object':
+            return self.object_key(record['model_name'], record['object_id']) == key
+        return str(record['user']) == key
+
+    def _read_index(self, index_path):
+        """Index d'un segment, mis en cache tant que le fichier ne change pas"""
+        try:
+            stat = os.stat(index_path)
+        except FileNotFoundError:
+            return None
+        cache_key = (str(index_path), stat.st_mtime_ns, stat.st_size)
+        index = self._indexes.get(cache_key)
+        if index is None:
+            with open(index_path) as f:
+                index = json.load(f)
+            self._indexes.set(cache_key, index)
+        return index
+
+
+audit_archive = AuditArchive()
+
+
+_timestamp_field = serializers.DateTimeField()
+
+
+def archive_record(log):
+    """Enregistrement d'archive d'un AuditLog (champs d'AuditLogSerializer et user_agent)"""
+    return {
+        'id': log.id,
+        'user': log.user_id,
+        'user_username': log.user.username if log.user_id else None,
+        'action': log.action,
+        'model_name': log.model_name,
+        'object_id': log.object_id,
+        'object_repr': log.object_repr,
+        'changes': log.changes,
+        'timestamp': _timestamp_field.to_representation(log.timestamp),
+        'ip_address': log.ip_address,
+        'user_agent': log.user_agent,
+    }
@@ -0,0 +1,292 @@
+import atexit
+import datetime
+import decimal
+import io
+import json
+import logging
+import threading
+import uuid
+from collections import defaultdict
+from contextvars import ContextVar
+from functools import lru_cache
+
+from cryptography.fernet import InvalidToken
+from django.conf import settings
+from django.db import InterfaceError, OperationalError, close_old_connections, connection, models, transaction
+from django.utils import timezone
+from django_tenants.utils import schema_context
+
+from .models import AuditLog, Ciphertext, EncryptedField
+
+logger = logging.getLogger(__name__)
+
+# Requête en cours, positionnée par AuditContextMiddleware
+current_request = ContextVar('audit_current_request', default=None)
+
+
+# ============================================================================
+# ÉCRITURE DIFFÉRÉE DES LOGS D'AUDIT
+# ============================================================================
+
+class AuditWriter:
+    """
+    Tampon des logs d'audit par schéma de cabinet, écrit en base par lots
+    (COPY) quand il atteint AUDIT_LOG_BATCH_SIZE entrées ou toutes les
+    AUDIT_LOG_FLUSH_INTERVAL secondes, depuis un thread d'arrière-plan.
+    Avec AUDIT_LOG_ASYNC = False (tests), chaque entrée est écrite immédiatement.
+    """
+
+    def __init__(self, autostart=True):
+        self.autostart = autostart
+        self._buffers = defaultdict(list)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    @property
+    def async_mode(self):
+        return getattr(settings, 'AUDIT_LOG_ASYNC', True)
+
+    @property
+    def batch_size(self):
+        return getattr(settings, 'AUDIT_LOG_BATCH_SIZE', 500)
+
+    @property
+    def flush_interval(self):
+        return getattr(settings, 'AUDIT_LOG_FLUSH_INTERVAL', 2.0)
+
+    def record(self, entry):
+        """Ajoute une entrée (colonnes d'AuditLog par attname) pour le cabinet courant"""
+        entry.setdefault('timestamp', timezone.now())
+        if not self.async_mode:
+            AuditLog(**entry).save()
+            return
+
+        with self._lock:
+            buffer = self._buffers[connection.schema_name]
+            buffer.append(entry)
+            full = len(buffer) >= self.batch_size
+        self._ensure_started()
+        if full and not self._wakeup.is_set():
+            self._wakeup.set()
+
+    def pending(self):
+        """Nombre d'entrées en attente d'écriture"""
+        with self._lock:
+            return sum(len(buffer) for buffer in self._buffers.values())
+
+    def flush(self):
+        """Écrit toutes les entrées en attente, schéma par schéma"""
+        with self._flush_lock:
+            with self._lock:
+                buffers, self._buffers = self._buffers, defaultdict(list)
+            for schema_name, entries in buffers.items():
+                with schema_context(schema_name):
+                    self._write(schema_name, entries)
+
+    def _write(self, schema_name, entries):
+        """
+        Écrit les entrées d'un cabinet. Un lot rejeté par la base est coupé en
+        deux jusqu'à isoler les entrées fautives (utilisateur supprimé, valeur
+        invalide), seules écartées ; si la base est injoignable, les entrées
+        non écrites sont remises en attente.
+        """
+        stack = [entries]
+        while stack:
+            batch = stack.pop()
+            try:
+                write_entries(batch)
+            except (OperationalError, InterfaceError):
+                unwritten = batch + [entry for part in reversed(stack) for entry in part]
+                logger.exception("Échec d'écriture de %d logs d'audit (%s)", len(unwritten), schema_name)
+                self._requeue(schema_name, unwritten)
+                return
+            except Exception:
+                if len(batch) == 1:
+                    entry = batch[0]
+                    logger.exception("Log d'audit rejeté et écarté (%s) : %s %s #%s", schema_name,
+                                     entry.get('action'), entry.get('model_name'), entry.get('object_id'))
+                    continue
+                middle = len(batch) // 2
+                stack += [batch[middle:], batch[:middle]]
+
+    def _requeue(self, schema_name, entries):
+        """Remet des entrées en attente, dans la limite de AUDIT_LOG_MAX_PENDING"""
+        max_pending = getattr(settings, 'AUDIT_LOG_MAX_PENDING', 100000)
+        with self._lock:
+            buffer = self._buffers[schema_name]
+            buffer[:0] = entries
+            if len(buffer) > max_pending:
+                logger.error("Tampon d'audit saturé (%s) : %d entrées perdues", schema_name, len(buffer) - max_pending)
+                del buffer[:len(buffer) - max_pending]
+
+    def _ensure_started(self):
+        if not self.autostart or (self._thread is not None and self._thread.is_alive()):
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            close_old_connections()
+            self.flush()
+
+
+def _copy_value(field, value):
+    """
+    Valeur d'une colonne au format CSV de COPY : toujours entre guillemets,
+    sauf NULL (champ vide sans guillemets), que le texte ne peut pas imiter.
+    """
+    if value is None:
+        return ''
+    if isinstance(field, models.JSONField):
+        value = json.dumps(value, cls=field.encoder)
+    elif isinstance(value, (datetime.datetime, datetime.date)):
+        value = value.isoformat()
+    return '"' + str(value).replace('"', '""') + '"'
+
+
+def write_entries(entries):
+    """Insère des logs d'audit en une seule commande COPY"""
+    if not entries:
+        return
+    fields = [field for field in AuditLog._meta.concrete_fields if not field.primary_key]
+    defaults = {field.attname: field.get_default() for field in fields}
+    buffer = io.StringIO()
+    for entry in entries:
+        buffer.write(','.join(
+            _copy_value(field, entry.get(field.attname, defaults[field.attname]))
+            for field in fields
+        ))
+        buffer.write('\n')
+    buffer.seek(0)
+
+    columns = ', '.join(connection.ops.quote_name(field.column) for field in fields)
+    table = connection.ops.quote_name(AuditLog._meta.db_table)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.copy_expert(f"COPY {table} ({columns}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+
+audit_writer = AuditWriter()
+atexit.register(audit_writer.flush)
+
+
+def get_client_ip(request):
+    """Adresse IP du client (premier proxy de X-Forwarded-For)"""
+    forwarded = request.META.get('HTTP_X_FORWARDED_FOR')
+    if forwarded:
+        return forwarded.split(',')[0].strip()
+    return request.META.get('REMOTE_ADDR')
+
+
+def log_action(action, instance=None, request=None, user=None, model_name='', object_id='',
+               object_repr='', changes=None):
+    """Enregistre une action dans le journal d'audit (écriture différée)"""
+    if request is None:
+        request = current_request.get()
+    if instance is not None:
+        model_name = model_name or instance._meta.object_name
+        object_id = object_id or str(instance.pk)
+        object_repr = object_repr or str(getattr(instance, 'audit_repr', instance))[:200]
+    if user is None and request is not None:
+        request_user = getattr(request, 'user', None)
+        if request_user is not None and request_user.is_authenticated:
+            user = request_user
+
+    audit_writer.record({
+        'user_id': user.pk if user is not None else None,
+        'action': action,
+        'model_name': model_name,
+        'object_id': object_id,
+        'object_repr': object_repr,
+        'changes': changes,
+        'ip_address': get_client_ip(request) if request is not None else None,
+        'user_agent': request.META.get('HTTP_USER_AGENT', '') if request is not None else '',
+        'timestamp': timezone.now(),
+    })
+
+
+# ============================================================================
+# DIFFÉRENCES CHAMP PAR CHAMP
+# ============================================================================
+
+def _jsonable(value):
+    """Valeur sérialisable dans AuditLog.changes"""
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, (decimal.Decimal, uuid.UUID)):
+        return str(value)
+    return value
+
+
+@lru_cache(maxsize=None)
+def _audited_fields(model):
+    """(attname, nom, chiffré ?) des champs suivis par le diff d'un modèle"""
+    excluded = getattr(model, 'AUDIT_EXCLUDED_FIELDS', ())
+    return tuple(
+        (field.attname, field.name, isinstance(field, EncryptedField))
+        for field in model._meta.concrete_fields
+        if not field.primary_key and field.name not in excluded
+    )
+
+
+def snapshot(instance):
+    """Mémorise l'état courant comme état de référence pour le prochain diff"""
+    values = instance.__dict__.copy()
+    values.pop('_loaded_values', None)
+    instance._loaded_values = values
+
+
+def _same_plaintext(old, new):
+    """Valeur en clair identique à la valeur chiffrée chargée (formulaire renvoyé tel quel)"""
+    if not isinstance(old, Ciphertext) or isinstance(new, Ciphertext):
+        return False
+    try:
+        return old.decrypt() == new
+    except InvalidToken:  # valeur illisible remplacée : modification
+        return False
+
+
+def compute_changes(instance):
+    """
+    Différences entre l'état chargé (ou vide pour une création) et l'état
+    courant, sans requête SQL. Les champs chiffrés sont signalés comme
+    modifiés sans qu'aucune valeur ne soit stockée ; l'ancienne valeur n'est
+    déchiffrée que si le champ a été réaffecté sans avoir été lu.
+    """
+    loaded = getattr(instance, '_loaded_values', None)
+    current = instance.__dict__
+    changes = {}
+    for attname, name, encrypted in _audited_fields(type(instance)):
+        if attname not in current:
+            continue
+        new = current[attname]
+        if loaded is None:
+            if new is None or new == '' or new == []:
+                continue
+            old = None
+        else:
+            if attname not in loaded:
+                continue  # champ différé : état d'origine inconnu
+            old = loaded[attname]
+            if new is old or new == old or (encrypted and _same_plaintext(old, new)):
+                continue
+
+        if encrypted:
+            changes[name] = {'changed': True}
+        else:
+            changes[name] = {'old': _jsonable(old), 'new': _jsonable(new)}
+    return changes
+
+
+def log_model_change(instance, created):
+    """Journalise une création ou une modification avec son diff"""
+    changes = compute_changes(instance)
+    if created or changes:
+        log_action('CREATE' if created else 'UPDATE', instance=instance, changes=changes)
+    snapshot(instance)
@@ -0,0 +1,100 @@
+import hashlib
+import hmac
+import re
+import unicodedata
+
+from django.conf import settings
+from django.db import connection
+
+from .encryption import get_key_provider, get_tenant_index_key
+
+
+# ============================================================================
+# INDEX AVEUGLES (RECHERCHE SUR CHAMPS CHIFFRÉS)
+# ============================================================================
+
+# Longueur des jetons stockés (caractères hexadécimaux, soit 64 bits)
+TOKEN_LENGTH = 16
+
+# Préfixes indexés pour les noms : "du", "dup", ... jusqu'à 20 caractères
+NAME_PREFIX_MIN_LENGTH = 2
+NAME_PREFIX_MAX_LENGTH = 20
+
+# Nombre minimal de chiffres pour tenter une recherche par téléphone
+PHONE_MIN_DIGITS = 6
+
+_NON_ALNUM_RE = re.compile(r'[^a-z0-9]+')
+_NON_DIGIT_RE = re.compile(r'\D+')
+
+
+def normalize_text(value):
+    """Minuscules, sans accents ni ponctuation"""
+    value = unicodedata.normalize('NFKD', value or '')
+    value = ''.join(c for c in value if not unicodedata.combining(c))
+    return _NON_ALNUM_RE.sub(' ', value.lower()).strip()
+
+
+def normalize_phone(value):
+    """Numéro au format E.164 (+33612345678), ou chaîne vide si invalide"""
+    value = (value or '').strip()
+    digits = _NON_DIGIT_RE.sub('', value)
+    if not digits:
+        return ''
+    if value.startswith('+'):
+        return f'+{digits}'
+    if digits.startswith('00'):
+        return f'+{digits[2:]}'
+    # Format national (06 12 34 56 78, ou 612345678 sans le 0) : indicatif du pays par défaut
+    country_code = getattr(settings, 'PHONE_DEFAULT_COUNTRY_CODE', '33')
+    if digits.startswith('0'):
+        return f'+{country_code}{digits[1:]}'
+    if len(digits) == getattr(settings, 'PHONE_NATIONAL_NUMBER_LENGTH', 9):
+        return f'+{country_code}{digits}'
+    return f'+{digits}'
+
+
+def normalize_email(value):
+    """Adresse email sans espaces, en minuscules"""
+    return (value or '').strip().lower()
+
+
+def blind_token(value, field):
+    """Jeton HMAC d'une valeur normalisée, avec la clé du cabinet courant"""
+    key = get_tenant_index_key(get_key_provider().get_blind_index_key(), connection.schema_name)
+    message = f'{field}:{value}'.encode()
+    return hmac.new(key, message, hashlib.sha256).hexdigest()[:TOKEN_LENGTH]
+
+
+def name_tokens(value, field):
+    """Jetons de tous les préfixes de chaque mot d'un nom"""
+    tokens = set()
+    for word in normalize_text(value).split():
+        word = word[:NAME_PREFIX_MAX_LENGTH]
+        for length in range(NAME_PREFIX_MIN_LENGTH, len(word) + 1):
+            tokens.add(blind_token(word[:length], field))
+    return sorted(tokens)
+
+
+def name_query_tokens(value, field):
+    """
+    Jetons à rechercher (tous requis) pour une saisie, un par mot comme à
+    l'indexation ("Jean-Pierre" : "jean" et "pierre") ; les mots trop courts
+    sont ignorés, liste vide si aucun mot n'est assez long.
+    """
+    return [
+        blind_token(word[:NAME_PREFIX_MAX_LENGTH], field)
+        for word in normalize_text(value).split()
+        if len(word) >= NAME_PREFIX_MIN_LENGTH
+    ]
+
+
+def phone_token(value):
+    """Jeton exact d'un numéro de téléphone (fixe ou mobile)"""
+    value = normalize_phone(value)
+    return blind_token(value, 'phone') if value else ''
+
+
+def email_token(value):
+    """Jeton exact d'une adresse email"""
+    value = normalize_email(value)
+    return blind_token(value, 'email') if value else ''
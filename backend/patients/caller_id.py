@@ -0,0 +1,76 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+
+from core.cache import LRUCache
+from core.routers import read_from_primary
+
+from . import blind_index
+from .models import Patient
+from .serializers import PatientListSerializer
+
+
+# ============================================================================
+# IDENTIFICATION DE L'APPELANT
+# ============================================================================
+
+# (schéma, version, jeton du numéro) -> (ids des patients, données sérialisées)
+_cache = LRUCache(
+    maxsize=getattr(settings, 'CALLER_ID_CACHE_SIZE', 4096),
+    ttl=getattr(settings, 'CALLER_ID_CACHE_TTL', 300),
+)
+
+
+def _version_key(schema_name):
+    """Clé du numéro de version partagé entre les processus pour un cabinet"""
+    return f'patients:caller_id:version:{schema_name}'
+
+
+def _bump_version(schema_name):
+    """
+    Change la version du cabinet une fois la transaction validée : les entrées
+    mises en cache par les autres processus ne sont plus jamais relues.
+    """
+    key = _version_key(schema_name)
+
+    def bump():
+        cache.add(key, 0, None)
+        try:
+            cache.incr(key)
+        except ValueError:  # clé évincée entre add et incr
+            cache.set(key, 1, None)
+
+    transaction.on_commit(bump)
+
+
+def lookup(number):
+    """Patients correspondant à un numéro entrant, servis depuis le cache si possible"""
+    schema_name = connection.schema_name
+    version = cache.get(_version_key(schema_name), 0)
+    key = (schema_name, version, blind_index.phone_token(number))
+    cached = _cache.get(key)
+    if cached is not None:
+        return cached[1]
+
+    # Mis en cache : jamais lu sur un réplica en retard
+    with read_from_primary():
+        patients = list(Patient.objects.by_phone(number).order_by('-updated_at'))
+        data = PatientListSerializer(patients, many=True).data
+    _cache.set(key, ({patient.pk for patient in patients}, data))
+    return data
+
+
+def invalidate_patient(patient):
+    """Oublie les numéros associés (avant ou après modification) à un patient"""
+    schema_name = connection.schema_name
+    tokens = {patient.phone_bidx, patient.mobile_bidx}
+    _cache.delete_where(
+        lambda key, value: key[0] == schema_name and (key[2] in tokens or patient.pk in value[0])
+    )
+    _bump_version(schema_name)
+
+
+def clear():
+    """Vide entièrement le cache d'identification, y compris celui des autres processus"""
+    _cache.clear()
+    _bump_version(connection.schema_name)
@@ -0,0 +1,520 @@
+import base64
+import hashlib
+import hmac
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+
+from cryptography.exceptions import InvalidTag
+from cryptography.fernet import Fernet, InvalidToken, MultiFernet
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM, ChaCha20Poly1305
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import DEFAULT_DB_ALIAS, connection
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from django_tenants.utils import get_public_schema_name, get_tenant_model
+
+from core.cache import LRUCache
+from core.postgresql_backend.base import current_schema_name
+from core.tenants import invalidate_tenant
+
+
+# ============================================================================
+# FOURNISSEUR DE CLÉS DE CHIFFREMENT
+# ============================================================================
+
+FERNET = 'fernet'
+
+# Algorithmes AEAD : octet de version en tête des valeurs binaires (bytea)
+AEAD_ALGORITHMS = {
+    'aes-gcm': (1, AESGCM),
+    'chacha20-poly1305': (2, ChaCha20Poly1305),
+}
+_AEAD_VERSIONS = {version: (name, cipher_class) for name, (version, cipher_class) in AEAD_ALGORITHMS.items()}
+AEAD_NONCE_SIZE = 12
+
+# Jeton Fernet (octet de version 0x80 : "gAAAAA" en base64) préfixé de son
+# identifiant de clé, ou encodé une seconde fois en base64 (format historique)
+_FERNET_VALUE_RE = re.compile(r'^(?:[\w-]+:gAAAAA|Z0FBQUFB)')
+
+
+class UnknownKeyId(InvalidToken):
+    """Valeur chiffrée par une clé absente du trousseau (clé ajoutée depuis son chargement)"""
+
+
+class Keyring:
+    """
+    Clés versionnées : chiffrement avec la clé courante (la dernière),
+    déchiffrement avec la clé dont l'identifiant est inscrit dans la valeur.
+
+        <version><len(id)><id><nonce 12><chiffré + tag 16>   AEAD, octets (colonne bytea)
+        <id>:<jeton Fernet>                                  texte
+        base64(<jeton Fernet>)                               format historique, sans identifiant
+                                                             (toutes les clés sont essayées)
+
+    Les sous-clés AEAD sont dérivées (HKDF) de chaque clé, une par algorithme.
+    """
+
+    def __init__(self, keys, current_id=None, schema_name=None):
+        self.keys = dict(keys)
+        self.current_id = current_id or keys[-1][0]
+        self.schema_name = schema_name  # cabinet dont la clé de données est incluse
+        self._ciphers = {key_id: get_cipher(key) for key_id, key in keys}
+        self._legacy = MultiFernet([self._ciphers[key_id] for key_id, _ in reversed(keys)])
+        self._aead = {}
+        self._aead_prefixes = {
+            name: bytes((version, len(self.current_id))) + self.current_id.encode()
+            for name, (version, _) in AEAD_ALGORITHMS.items()
+        }
+
+    def __reduce__(self):
+        # Transmis aux processus de travail (import, rotation) sans les ciphers
+        return Keyring, (list(self.keys.items()), self.current_id, self.schema_name)
+
+    def encrypt(self, data, algorithm=FERNET):
+        """Chiffre des octets avec la clé courante : texte (Fernet) ou octets (AEAD)"""
+        if algorithm != FERNET:
+            nonce = os.urandom(AEAD_NONCE_SIZE)
+            prefix = self._aead_prefixes[algorithm]
+            return prefix + nonce + self._get_aead(algorithm, self.current_id).encrypt(nonce, data, None)
+        token = self._ciphers[self.current_id].encrypt(data)
+        return f'{self.current_id}:{token.decode()}'
+
+    def decrypt(self, value):
+        """Déchiffre une valeur (texte ou octets) ; InvalidToken si aucune clé ne convient"""
+        if isinstance(value, (bytes, memoryview)):
+            value = bytes(value)
+            if value[:1] and value[0] in _AEAD_VERSIONS:
+                return self._decrypt_aead(value)
+            # Valeur texte conservée telle quelle lors du passage de la colonne en bytea
+            value = value.decode()
+        key_id, separator, token = value.partition(':')
+        if not separator:
+            try:
+                return self._legacy.decrypt(base64.urlsafe_b64decode(value.encode()))
+            except ValueError:
+                raise InvalidToken
+        cipher = self._ciphers.get(key_id)
+        if cipher is None:
+            raise UnknownKeyId
+        return cipher.decrypt(token.encode())
+
+    def _decrypt_aead(self, value):
+        algorithm, _ = _AEAD_VERSIONS[value[0]]
+        end = 2 + value[1]
+        try:
+            key_id = value[2:end].decode()
+        except UnicodeDecodeError:
+            raise InvalidToken
+        if key_id not in self.keys:
+            raise UnknownKeyId
+        try:
+            aead = self._get_aead(algorithm, key_id)
+            return aead.decrypt(value[end:end + AEAD_NONCE_SIZE], value[end + AEAD_NONCE_SIZE:], None)
+        except InvalidTag:
+            raise InvalidToken
+
+    def _get_aead(self, algorithm, key_id):
+        aead = self._aead.get((algorithm, key_id))
+        if aead is None:
+            _, cipher_class = AEAD_ALGORITHMS[algorithm]
+            aead = cipher_class(derive_aead_key(self.keys[key_id], algorithm))
+            self._aead[algorithm, key_id] = aead
+        return aead
+
+    @staticmethod
+    def is_ciphertext(value):
+        """
+        Valeur dans l'un des formats chiffrés (AEAD, <id>:<jeton Fernet> ou
+        historique) ; les autres valeurs sont du texte jamais chiffré.
+        """
+        if isinstance(value, (bytes, memoryview)):
+            value = bytes(value)
+            if value[:1] and value[0] in _AEAD_VERSIONS:
+                return True
+            value = value.decode(errors='replace')
+        return bool(_FERNET_VALUE_RE.match(value))
+
+    def needs_rotation(self, value, algorithm=FERNET):
+        """Valeur chiffrée avec une autre clé que la clé courante, ou dans un autre format"""
+        if not value:
+            return False
+        if algorithm != FERNET:
+            return not (isinstance(value, (bytes, memoryview)) and bytes(value).startswith(self._aead_prefixes[algorithm]))
+        return not (isinstance(value, str) and value.startswith(f'{self.current_id}:'))
+
+    @staticmethod
+    def parse(content):
+        """Fichier de clés : lignes <id>:<clé>, ou une seule clé (format historique, id 1)"""
+        lines = [line.strip() for line in content.decode().splitlines() if line.strip()]
+        if len(lines) == 1 and ':' not in lines[0]:
+            return [('1', lines[0].encode())]
+        keys = []
+        for line in lines:
+            key_id, _, key = line.partition(':')
+            keys.append((key_id, key.encode()))
+        return keys
+
+
+class KeyProvider:
+    """
+    Charge les clés de chiffrement une seule fois pour tout le processus.
+    Le fichier de clés est surveillé (ENCRYPTION_KEY_RELOAD_INTERVAL) :
+    une clé ajoutée par rotate_encryption_keys devient courante sans redémarrage.
+    """
+
+    def __init__(self, key_file=None, blind_index_key_file=None):
+        self.key_file = key_file
+        self.blind_index_key_file = blind_index_key_file
+        self._keyring = None
+        self._keyring_mtime = None
+        self._next_check = 0
+        self._blind_index_key = None
+        self._lock = threading.Lock()
+
+    def get_key_file(self):
+        """Chemin du fichier de clé (paramètre ENCRYPTION_KEY_FILE par défaut)"""
+        return self.key_file or getattr(settings, 'ENCRYPTION_KEY_FILE', 'encryption.key')
+
+    def get_blind_index_key_file(self):
+        """Chemin de la clé des index aveugles (BLIND_INDEX_KEY_FILE par défaut)"""
+        return self.blind_index_key_file or getattr(settings, 'BLIND_INDEX_KEY_FILE', 'blind_index.key')
+
+    def get_keyring(self):
+        """Retourne les clés versionnées, chargées au premier appel"""
+        keyring = self._keyring
+        if keyring is None or time.monotonic() >= self._next_check:
+            with self._lock:
+                if self._keyring is None or time.monotonic() >= self._next_check:
+                    self._refresh_keyring()
+                keyring = self._keyring
+        return keyring
+
+    def refresh(self):
+        """
+        Relit le fichier de clés s'il a changé, sans attendre ENCRYPTION_KEY_RELOAD_INTERVAL
+        (valeur chiffrée par une clé que rotate_encryption_keys vient d'ajouter)
+        """
+        with self._lock:
+            self._refresh_keyring()
+            return self._keyring
+
+    def get_key(self):
+        """Retourne la clé courante"""
+        keyring = self.get_keyring()
+        return keyring.keys[keyring.current_id]
+
+    def _refresh_keyring(self):
+        key_file = self.get_key_file()
+        interval = getattr(settings, 'ENCRYPTION_KEY_RELOAD_INTERVAL', 30)
+        self._next_check = time.monotonic() + interval
+        mtime = os.stat(key_file).st_mtime_ns if os.path.exists(key_file) else None
+        if self._keyring is None or mtime != self._keyring_mtime:
+            if self._keyring is not None:
+                # Les clés des cabinets incluent les clés maîtres : à reconstruire
+                _tenant_keyrings.clear()
+            self._keyring = Keyring(Keyring.parse(self._load_or_create_key(key_file)))
+            self._keyring_mtime = os.stat(key_file).st_mtime_ns
+
+    def add_key(self):
+        """Ajoute une clé, qui devient la clé courante ; retourne son identifiant"""
+        key_file = self.get_key_file()
+        with self._lock:
+            keys = Keyring.parse(self._load_or_create_key(key_file))
+            key_id = str(max(int(key_id) for key_id, _ in keys) + 1)
+            keys.append((key_id, Fernet.generate_key()))
+            # Remplacement atomique : le fichier de clés n'est jamais incomplet
+            tmp_path = f'{key_file}.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(b''.join(f'{key_id}:'.encode() + key + b'\n' for key_id, key in keys))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, key_file)
+            self._keyring = None
+        return key_id
+
+    def get_blind_index_key(self):
+        """Clé maître HMAC des index aveugles, distincte de la clé de chiffrement"""
+        key = self._blind_index_key
+        if key is None:
+            with self._lock:
+                if self._blind_index_key is None:
+                    self._blind_index_key = self._load_or_create_key(self.get_blind_index_key_file())
+                key = self._blind_index_key
+        return key
+
+    def reload(self):
+        """Oublie les clés en mémoire : elles seront relues au prochain accès"""
+        with self._lock:
+            self._keyring = None
+            self._blind_index_key = None
+        get_cipher.cache_clear()
+        derive_aead_key.cache_clear()
+        get_tenant_index_key.cache_clear()
+        _tenant_keyrings.clear()
+        _last_keyring.set(None)
+
+    def _load_or_create_key(self, key_file):
+        """Récupère ou crée une clé"""
+        if os.path.exists(key_file):
+            with open(key_file, 'rb') as f:
+                key = f.read().strip()
+        else:
+            key = Fernet.generate_key()
+            with open(key_file, 'wb') as f:
+                f.write(key)
+        return key
+
+
+@lru_cache(maxsize=32)
+def get_cipher(key):
+    """Cipher Fernet partagé pour une clé donnée"""
+    return Fernet(key)
+
+
+@lru_cache(maxsize=64)
+def derive_aead_key(key, algorithm):
+    """Clé AEAD de 256 bits dérivée d'une clé Fernet, propre à l'algorithme"""
+    hkdf = HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=f'edental:{algorithm}'.encode())
+    return hkdf.derive(base64.urlsafe_b64decode(key))
+
+
+@lru_cache(maxsize=256)
+def get_tenant_index_key(master_key, schema_name):
+    """Clé HMAC propre à un cabinet, dérivée de la clé maître des index"""
+    return hmac.new(master_key, schema_name.encode(), hashlib.sha256).digest()
+
+
+_key_provider = KeyProvider()
+
+
+def get_key_provider():
+    """Fournisseur de clés du processus"""
+    return _key_provider
+
+
+def reload_keys():
+    """Force la relecture des clés (après une rotation par exemple)"""
+    _key_provider.reload()
+
+
+# ============================================================================
+# CHIFFREMENT D'ENVELOPPE : UNE CLÉ DE DONNÉES PAR CABINET
+# ============================================================================
+#
+# Chaque cabinet chiffre ses données avec sa propre clé de données, stockée
+# sur Client.encrypted_data_key chiffrée par la clé maître du KMS
+# (ENCRYPTION_KMS_CLASS). Les clés de données sont versionnées, une ligne
+# t<n>:<clé chiffrée> chacune, la dernière courante : les anciennes restent
+# pour lire les valeurs pas encore rechiffrées (rotate_encryption_keys
+# --new-data-key). Les clés déchiffrées sont gardées en mémoire par nom de
+# schéma (TENANT_DATA_KEY_CACHE_SIZE / _TTL) : pas d'appel au KMS par
+# requête. Les valeurs chiffrées avant l'enveloppe (clés maîtres) restent
+# lisibles ; rotate_encryption_keys les rechiffre avec la clé du cabinet.
+
+# Première clé de données, et clé stockée seule sans identifiant (format initial)
+TENANT_KEY_ID = 't1'
+
+_DATA_KEY_RE = re.compile(r'^(t\d+):(.+)$')
+
+_tenant_keyrings = LRUCache(
+    maxsize=getattr(settings, 'TENANT_DATA_KEY_CACHE_SIZE', 1024),
+    ttl=getattr(settings, 'TENANT_DATA_KEY_CACHE_TTL', 300),
+)
+
+# Clés imposées (processus de travail, mesures) à la place de celles du cabinet courant
+_active_keyring = ContextVar('active_keyring', default=None)
+
+# Dernières clés utilisées (schéma, clés, expiration) : évite le verrou du cache
+# à chaque valeur chiffrée ou déchiffrée
+_last_keyring = ContextVar('last_keyring', default=None)
+LAST_KEYRING_TTL = 1.0  # secondes
+
+
+class LocalKMS:
+    """
+    KMS local, substitut d'un KMS managé : les clés maîtres sont celles du
+    fichier ENCRYPTION_KEY_FILE (versionnées, voir Keyring).
+    """
+
+    def __init__(self, provider=None):
+        self.provider = provider or get_key_provider()
+
+    def wrap(self, data_key):
+        """Chiffre une clé de données avec la clé maître courante"""
+        return self.provider.get_keyring().encrypt(data_key)
+
+    def unwrap(self, wrapped_key):
+        """Déchiffre une clé de données"""
+        try:
+            return self.provider.get_keyring().decrypt(wrapped_key)
+        except UnknownKeyId:
+            # Rechiffrée (rewrap_data_keys) avec une clé maître pas encore relue
+            return self.provider.refresh().decrypt(wrapped_key)
+
+    def needs_rewrap(self, wrapped_key):
+        """Clé de données chiffrée avec une ancienne clé maître"""
+        return self.provider.get_keyring().needs_rotation(wrapped_key)
+
+
+@lru_cache(maxsize=None)
+def get_kms():
+    """KMS du processus (ENCRYPTION_KMS_CLASS)"""
+    return import_string(getattr(settings, 'ENCRYPTION_KMS_CLASS', 'patients.encryption.LocalKMS'))()
+
+
+def new_wrapped_data_key():
+    """Nouvelle clé de données, chiffrée par le KMS (première clé d'un cabinet, TENANT_KEY_ID)"""
+    return get_kms().wrap(Fernet.generate_key())
+
+
+def parse_data_keys(stored):
+    """Clés de données chiffrées d'un cabinet [(id, clé chiffrée)], de la plus ancienne à la courante"""
+    keys = []
+    for line in stored.splitlines():
+        line = line.strip()
+        if line:
+            match = _DATA_KEY_RE.match(line)
+            keys.append((match[1], match[2]) if match else (TENANT_KEY_ID, line))
+    return keys
+
+
+def format_data_keys(keys):
+    """Valeur de Client.encrypted_data_key pour des clés [(id, clé chiffrée)]"""
+    return '\n'.join(f'{key_id}:{wrapped_key}' for key_id, wrapped_key in keys)
+
+
+def tenant_keyring(master_keyring, stored, schema_name=None):
+    """Clés maîtres (valeurs antérieures à l'enveloppe) puis clés de données du cabinet, la dernière courante"""
+    kms = get_kms()
+    data_keys = [(key_id, kms.unwrap(wrapped_key)) for key_id, wrapped_key in parse_data_keys(stored)]
+    return Keyring([*master_keyring.keys.items(), *data_keys], data_keys[-1][0], schema_name)
+
+
+def _stored_data_keys(schema_name, fresh=False):
+    """
+    Clés de données chiffrées d'un cabinet (Client.encrypted_data_key), la
+    première créée au premier usage ; fresh : relue en base, pas sur le
+    cabinet de la requête (clé ajoutée depuis son chargement).
+    """
+    tenant = getattr(connection, 'tenant', None)
+    if not fresh and getattr(tenant, 'schema_name', None) == schema_name and getattr(tenant, 'encrypted_data_key', ''):
+        return tenant.encrypted_data_key  # cabinet de la requête : pas de requête SQL
+
+    # Toujours sur le primaire : un réplica en retard rendrait une clé pas encore créée
+    tenants = get_tenant_model().objects.using(DEFAULT_DB_ALIAS).filter(schema_name=schema_name)
+    stored = tenants.values_list('encrypted_data_key', flat=True).get()
+    if not stored:
+        # Deux processus peuvent créer une clé en même temps : seule la première est gardée
+        created = tenants.filter(encrypted_data_key='').update(encrypted_data_key=new_wrapped_data_key())
+        if created:
+            invalidate_tenant(tenants.values_list('pk', flat=True).get())
+        stored = tenants.values_list('encrypted_data_key', flat=True).get()
+    return stored
+
+
+def get_tenant_keyring(schema_name, refresh=False):
+    """Clés d'un cabinet : ses clés de données et les clés maîtres (anciennes valeurs) ; refresh : relues en base"""
+    keyring = None if refresh else _tenant_keyrings.get(schema_name)
+    if keyring is None:
+        master_keyring = get_key_provider().get_keyring()
+        if schema_name == get_public_schema_name():
+            return master_keyring
+        keyring = tenant_keyring(master_keyring, _stored_data_keys(schema_name, fresh=refresh), schema_name)
+        _tenant_keyrings.set(schema_name, keyring)
+    return keyring
+
+
+def rotate_data_key(schema_name):
+    """
+    Ajoute une clé de données au cabinet, qui devient sa clé courante ; les
+    précédentes restent pour la lecture. Retourne son identifiant.
+    """
+    tenants = get_tenant_model().objects.using(DEFAULT_DB_ALIAS).filter(schema_name=schema_name)
+    while True:
+        stored = _stored_data_keys(schema_name, fresh=True)
+        keys = parse_data_keys(stored)
+        key_id = f't{max(int(key_id[1:]) for key_id, _ in keys) + 1}'
+        keys.append((key_id, new_wrapped_data_key()))
+        # Modifiées entre-temps (rewrap_data_keys, autre rotation) : relire et recommencer
+        if tenants.filter(encrypted_data_key=stored).update(encrypted_data_key=format_data_keys(keys)):
+            break
+    invalidate_tenant(tenants.values_list('pk', flat=True).get())
+    _tenant_keyrings.delete(schema_name)
+    _last_keyring.set(None)
+    return key_id
+
+
+def get_current_keyring():
+    """Clés à utiliser : celles imposées par using_keyring, sinon celles du cabinet courant"""
+    keyring = _active_keyring.get()
+    if keyring is not None:
+        return keyring
+    schema_name = current_schema_name.get() or connection.schema_name
+    now = time.monotonic()
+    last = _last_keyring.get()
+    if last is not None and last[0] == schema_name and last[2] > now:
+        return last[1]
+    keyring = get_tenant_keyring(schema_name)
+    _last_keyring.set((schema_name, keyring, now + LAST_KEYRING_TTL))
+    return keyring
+
+
+def reload_keyring(keyring):
+    """
+    Clés à jour à la place de keyring, qui ne connaît pas la clé d'une valeur :
+    fichier de clés relu une fois ; None si aucune clé n'a été ajoutée depuis.
+    """
+    # Clés maîtres modifiées : les clés des cabinets sont reconstruites (_refresh_keyring)
+    master_keyring = get_key_provider().refresh()
+    # Clés du cabinet relues en base : une clé de données a pu être ajoutée
+    fresh = master_keyring if keyring.schema_name is None else get_tenant_keyring(keyring.schema_name, refresh=True)
+    if fresh.keys.keys() == keyring.keys.keys():
+        return None
+    _last_keyring.set(None)
+    return fresh
+
+
+@contextmanager
+def using_keyring(keyring):
+    """Impose des clés pour le bloc (None : clés du cabinet courant)"""
+    token = _active_keyring.set(keyring)
+    try:
+        yield keyring
+    finally:
+        _active_keyring.reset(token)
+
+
+def rewrap_data_keys():
+    """Rechiffre les clés de données avec la clé maître courante ; retourne le nombre de cabinets"""
+    kms = get_kms()
+    count = 0
+    for tenant in get_tenant_model().objects.exclude(encrypted_data_key='').only('encrypted_data_key'):
+        keys = parse_data_keys(tenant.encrypted_data_key)
+        if any(kms.needs_rewrap(wrapped_key) for _, wrapped_key in keys):
+            keys = [
+                (key_id, kms.wrap(kms.unwrap(wrapped_key)) if kms.needs_rewrap(wrapped_key) else wrapped_key)
+                for key_id, wrapped_key in keys
+            ]
+            type(tenant).objects.filter(
+                pk=tenant.pk, encrypted_data_key=tenant.encrypted_data_key
+            ).update(encrypted_data_key=format_data_keys(keys))
+            invalidate_tenant(tenant.pk)
+            count += 1
+    return count
+
+
+@receiver(setting_changed)
+def _reload_keys_on_setting_change(sender, setting, **kwargs):
+    """Recharge les clés quand les tests modifient le fichier de clé"""
+    if setting in ('ENCRYPTION_KEY_FILE', 'BLIND_INDEX_KEY_FILE'):
+        reload_keys()
+    if setting == 'ENCRYPTION_KMS_CLASS':
+        get_kms.cache_clear()
@@ -0,0 +1,131 @@
+import csv
+import json
+import zlib
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+from . import audit
+from .serializers import PatientSerializer
+
+
+# ============================================================================
+# EXPORT RGPD EN FLUX (NDJSON / CSV)
+# ============================================================================
+
+# Champs calculés ou relatifs aux utilisateurs : hors données du patient
+EXPORT_OMIT = ['age', 'created_by_username', 'updated_by_username']
+
+
+class _Echo:
+    """Pseudo-fichier pour csv.writer : writerow retourne la ligne formatée"""
+
+    def write(self, value):
+        return value
+
+
+class PatientExporter:
+    """
+    Export d'un QuerySet de patients sans le charger en mémoire : lecture par
+    id croissant (keyset), déchiffrement en parallèle et sérialisation par paquets de chunk_size,
+    sortie par blocs d'environ buffer_size octets, compressée gzip à la volée
+    si demandé. Une seule entrée EXPORT est journalisée, en fin de flux.
+    """
+    formats = {
+        'ndjson': ('application/x-ndjson', 'ndjson'),
+        'csv': ('text/csv', 'csv'),
+    }
+    buffer_size = 64 * 1024
+
+    def __init__(self, queryset, file_format='ndjson', compress=False, request=None, chunk_size=500):
+        if file_format not in self.formats:
+            raise ValueError(f"Format d'export inconnu : {file_format}")
+        self.queryset = queryset
+        self.file_format = file_format
+        self.compress = compress
+        self.request = request
+        self.chunk_size = chunk_size
+        self.count = 0
+        self.fields = list(PatientSerializer(omit=EXPORT_OMIT).fields)
+
+    @property
+    def content_type(self):
+        return 'application/gzip' if self.compress else f'{self.formats[self.file_format][0]}; charset=utf-8'
+
+    def filename(self, basename):
+        extension = self.formats[self.file_format][1]
+        return f'{basename}.{extension}.gz' if self.compress else f'{basename}.{extension}'
+
+    def stream(self, object_id='', object_repr=''):
+        """Blocs d'octets de l'export ; journalise l'export une fois le flux terminé ou interrompu"""
+        complete = False
+        try:
+            chunks = self._buffered(self._lines())
+            if self.compress:
+                chunks = self._gzip(chunks)
+            yield from chunks
+            complete = True
+        finally:
+            audit.log_action(
+                'EXPORT', request=self.request, model_name='Patient',
+                object_id=object_id,
+                object_repr=object_repr or f"Export {self.file_format} de {self.count} patients",
+                changes={'export': {'count': self.count, 'format': self.file_format, 'complete': complete}},
+            )
+
+    def records(self):
+        """
+        Patients sérialisés (déchiffrés) paquet par paquet, par id croissant.
+        Chaque paquet est lu dans sa propre transaction courte, close avant
+        l'envoi au client : un téléchargement lent ne garde aucun instantané
+        ouvert (VACUUM du cabinet non bloqué). Un patient créé pendant l'export
+        y figure, un patient supprimé avant la lecture de son paquet n'y figure pas.
+        """
+        queryset = self.queryset.order_by('pk')
+        last_id = None
+        while True:
+            page = queryset if last_id is None else queryset.filter(pk__gt=last_id)
+            with transaction.atomic(using=self.queryset.db):
+                patients = list(page[:self.chunk_size].decrypted_iter(chunk=self.chunk_size))
+            if not patients:
+                return
+            yield from self._serialize(patients)
+            if len(patients) < self.chunk_size:
+                return
+            last_id = patients[-1].pk
+
+    def _serialize(self, patients):
+        data = PatientSerializer(patients, many=True, omit=EXPORT_OMIT).data
+        self.count += len(data)
+        return data
+
+    def _lines(self):
+        if self.file_format == 'csv':
+            writer = csv.writer(_Echo())
+            yield writer.writerow(self.fields)
+            for record in self.records():
+                yield writer.writerow([record[name] for name in self.fields])
+        else:
+            for record in self.records():
+                yield json.dumps(record, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+
+    def _buffered(self, lines):
+        buffer, size = [], 0
+        for line in lines:
+            data = line.encode('utf-8')
+            buffer.append(data)
+            size += len(data)
+            if size >= self.buffer_size:
+                yield b''.join(buffer)
+                buffer, size = [], 0
+        if buffer:
+            yield b''.join(buffer)
+
+    @staticmethod
+    def _gzip(chunks):
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31 : en-tête gzip
+        for chunk in chunks:
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.flush()
@@ -0,0 +1,11 @@
+from rest_framework import filters
+
+
+class PatientSearchFilter(filters.SearchFilter):
+    """Filtre ?search= s'appuyant sur les index aveugles des champs chiffrés"""
+    
+    def filter_queryset(self, request, queryset, view):
+        query = ' '.join(self.get_search_terms(request))
+        if not query:
+            return queryset
+        return queryset.search(query)
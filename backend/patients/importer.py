@@ -0,0 +1,257 @@
+import csv
+import io
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections import deque
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from django_tenants.utils import schema_context
+
+from core.processes import process_pool
+
+from . import audit, caller_id
+from .encryption import get_tenant_keyring, using_keyring
+from .models import EncryptedField, Patient, PatientImport
+from .serializers import PatientCreateSerializer
+from .statistics import invalidate_statistics
+
+logger = logging.getLogger(__name__)
+
+
+# ============================================================================
+# IMPORT EN MASSE DE PATIENTS (CSV / NDJSON)
+# ============================================================================
+
+def iter_rows(stream, file_format):
+    """Lignes (numéro, dict) lues au fil de l'eau ; stream texte ou binaire"""
+    if isinstance(stream, (io.RawIOBase, io.BufferedIOBase)) or 'b' in getattr(stream, 'mode', ''):
+        stream = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if file_format == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    elif file_format == 'ndjson':
+        for line_number, line in enumerate(stream, start=1):
+            if line.strip():
+                try:
+                    yield line_number, json.loads(line)
+                except ValueError:
+                    yield line_number, None
+    else:
+        raise ValueError(f"Format d'import inconnu : {file_format}")
+
+
+def _plain_errors(errors):
+    """Erreurs de validation sérialisables (ErrorDetail -> str)"""
+    return json.loads(json.dumps(errors))
+
+
+def prepare_rows(schema_name, rows, keyring):
+    """
+    Valide des lignes (règles de PatientCreateSerializer), calcule les index
+    aveugles et chiffre les champs sensibles. Exécuté dans un processus de
+    travail : aucune requête SQL, seuls le schéma et les clés du cabinet sont nécessaires.
+    """
+    if connection.schema_name != schema_name:
+        connection.set_schema(schema_name)
+    with using_keyring(keyring):
+        return _prepare_rows(rows)
+
+
+def _prepare_rows(rows):
+    indexes = set(Patient.BLIND_INDEX_FIELDS.values())
+    encrypted = [field for field in Patient._meta.concrete_fields if isinstance(field, EncryptedField)]
+    prepared, errors = [], []
+    for line_number, row in rows:
+        if not isinstance(row, dict):
+            errors.append({'row': line_number, 'errors': {'non_field_errors': ['Ligne illisible.']}})
+            continue
+        serializer = PatientCreateSerializer(data=row)
+        if not serializer.is_valid():
+            errors.append({'row': line_number, 'errors': _plain_errors(serializer.errors)})
+            continue
+        patient = Patient(**serializer.validated_data)
+        patient.update_blind_indexes()
+        values = {
+            field.attname: field.value_from_object(patient)
+            for field in Patient._meta.concrete_fields
+            if field.name in serializer.validated_data or field.name in indexes
+        }
+        for field in encrypted:
+            if field.attname in values:
+                values[field.attname] = field.encrypt_value(values[field.attname])
+        prepared.append(values)
+    return prepared, errors
+
+
+class PatientImporter:
+    """
+    Import par paquets : validation et chiffrement en parallèle (workers
+    processus), numéros patients réservés par bloc, bulk_create par paquet.
+    Mémoire bornée : au plus 2 paquets par worker en cours, max_errors erreurs gardées.
+    """
+
+    def __init__(self, user=None, chunk_size=1000, workers=0, max_errors=1000):
+        self.user = user
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self.max_errors = max_errors
+
+    def run(self, rows, progress=None):
+        """Importe les lignes ; retourne {'created', 'error_count', 'errors'}"""
+        schema_name = connection.schema_name
+        keyring = get_tenant_keyring(schema_name)
+        report = {'created': 0, 'error_count': 0, 'errors': []}
+        processed = 0
+
+        for prepared, errors, size in self._prepared_chunks(schema_name, keyring, rows):
+            processed += size
+            report['error_count'] += len(errors)
+            report['errors'].extend(errors[:self.max_errors - len(report['errors'])])
+            if prepared:
+                report['created'] += self.write_chunk(prepared)
+            if progress is not None:
+                progress(processed, report['created'], report['error_count'])
+
+        if report['created']:
+            invalidate_statistics()
+            caller_id.clear()
+        return report
+
+    def _chunks(self, rows):
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= self.chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def _prepared_chunks(self, schema_name, keyring, rows):
+        """(lignes préparées, erreurs, taille) par paquet, dans l'ordre du fichier"""
+        if self.workers <= 1:
+            for chunk in self._chunks(rows):
+                yield (*prepare_rows(schema_name, chunk, keyring), len(chunk))
+            return
+
+        with process_pool(self.workers) as executor:
+            pending = deque()
+            for chunk in self._chunks(rows):
+                pending.append((executor.submit(prepare_rows, schema_name, chunk, keyring), len(chunk)))
+                if len(pending) >= self.workers * 2:
+                    future, size = pending.popleft()
+                    yield (*future.result(), size)
+            while pending:
+                future, size = pending.popleft()
+                yield (*future.result(), size)
+
+    def write_chunk(self, prepared):
+        """Insère un paquet de patients préparés dans une transaction"""
+        now = timezone.now()
+        user_id = self.user.pk if self.user is not None else None
+        encrypted = {
+            field.attname: field for field in Patient._meta.concrete_fields if isinstance(field, EncryptedField)
+        }
+        with transaction.atomic():
+            numbers = self.allocate_numbers(len(prepared))
+            patients = []
+            for values, number in zip(prepared, numbers):
+                for attname, value in values.items():
+                    if attname in encrypted and value:
+                        # Déjà chiffrée : enregistrée telle quelle
+                        values[attname] = encrypted[attname].ciphertext(value)
+                patient = Patient(**values, patient_number=number, created_by_id=user_id, updated_by_id=user_id)
+                if patient.rgpd_consent:
+                    patient.rgpd_consent_date = now
+                patients.append(patient)
+            Patient.objects.bulk_create(patients)
+
+        audit.log_action(
+            'CREATE', model_name='Patient', user=self.user,
+            object_repr=f"Import de {len(patients)} patients",
+            changes={'import': {'count': len(patients), 'first': numbers[0], 'last': numbers[-1]}},
+        )
+        return len(patients)
+
+    @staticmethod
+    def allocate_numbers(count):
+        """Réserve count numéros patients (séquence du cabinet) en une requête"""
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT patients_next_patient_number() FROM generate_series(1, %s)", [count])
+            return [row[0] for row in cursor.fetchall()]
+
+
+# ============================================================================
+# IMPORTS EN ARRIÈRE-PLAN (API)
+# ============================================================================
+
+def start_import(upload, file_format, user=None):
+    """
+    Enregistre le fichier envoyé et lance son import hors de la requête HTTP
+    (thread d'arrière-plan) ; retourne le PatientImport dont suivre la progression.
+    Avec PATIENT_IMPORT_ASYNC = False (tests), l'import est exécuté immédiatement.
+    """
+    fd, path = tempfile.mkstemp(
+        prefix='patient-import-', suffix=f'.{file_format}', dir=getattr(settings, 'PATIENT_IMPORT_DIR', None)
+    )
+    with os.fdopen(fd, 'wb') as destination:
+        for chunk in upload.chunks():
+            destination.write(chunk)
+
+    job = PatientImport.objects.create(
+        file_format=file_format, file_name=getattr(upload, 'name', '')[:255], created_by=user
+    )
+    args = (connection.schema_name, job.pk, path, getattr(settings, 'PATIENT_IMPORT_WORKERS', 0))
+    if not getattr(settings, 'PATIENT_IMPORT_ASYNC', True):
+        run_import(*args)
+        job.refresh_from_db()
+        return job
+
+    thread = threading.Thread(target=_run_in_thread, args=args, name=f'patient-import-{job.pk}', daemon=True)
+    # Le thread lit le PatientImport : pas avant la validation de la transaction
+    transaction.on_commit(thread.start)
+    return job
+
+
+def _run_in_thread(*args):
+    try:
+        run_import(*args)
+    finally:
+        connection.close()  # connexion propre au thread
+
+
+def run_import(schema_name, job_id, path, workers=0):
+    """Importe le fichier d'un PatientImport en relevant la progression, puis le supprime"""
+    try:
+        with schema_context(schema_name):
+            jobs = PatientImport.objects.filter(pk=job_id)
+            jobs.update(status='RUNNING', updated_at=timezone.now())
+            job = jobs.select_related('created_by').get()
+
+            def progress(processed, created, error_count):
+                jobs.update(processed=processed, created=created, error_count=error_count, updated_at=timezone.now())
+
+            try:
+                with open(path, 'rb') as stream:
+                    report = PatientImporter(user=job.created_by, workers=workers).run(
+                        iter_rows(stream, job.file_format), progress=progress
+                    )
+            except Exception:
+                logger.exception("Échec de l'import de patients %s (%s)", job_id, schema_name)
+                jobs.update(
+                    status='FAILED', errors=[{'row': None, 'errors': {'non_field_errors': ["Import interrompu."]}}],
+                    finished_at=timezone.now(), updated_at=timezone.now(),
+                )
+                return
+            jobs.update(
+                status='DONE', created=report['created'], error_count=report['error_count'],
+                errors=report['errors'], finished_at=timezone.now(), updated_at=timezone.now(),
+            )
+    finally:
+        os.unlink(path)
@@ -0,0 +1,179 @@
+import json
+import os
+import time
+from collections import deque
+
+from cryptography.fernet import InvalidToken
+from django.db import connection, transaction
+from psycopg2.extras import execute_values
+
+from core.processes import process_pool
+
+from .encryption import get_tenant_keyring
+from .models import EncryptedField, Patient
+
+
+# ============================================================================
+# ROTATION DES CLÉS DE CHIFFREMENT
+# ============================================================================
+
+def reencrypt_rows(rows, keyring, algorithms):
+    """
+    Rechiffre avec la clé courante du cabinet, dans le format de leur champ
+    (algorithms, un par colonne), les valeurs chiffrées avec une autre clé ou
+    dans un autre format. Exécuté dans un processus de travail, sans requête SQL.
+    Retourne ([(id, anciennes valeurs, nouvelles valeurs)], [id illisibles]).
+    """
+    changed, failed = [], []
+    for row_id, *values in rows:
+        stale = [keyring.needs_rotation(value, algorithm) for value, algorithm in zip(values, algorithms)]
+        if not any(stale):
+            continue
+        try:
+            new_values = [
+                keyring.encrypt(keyring.decrypt(value), algorithm) if needs_rotation else value
+                for value, algorithm, needs_rotation in zip(values, algorithms, stale)
+            ]
+        except InvalidToken:
+            failed.append(row_id)
+            continue
+        changed.append((row_id, values, new_values))
+    return changed, failed
+
+
+class KeyRotation:
+    """
+    Rechiffrement des patients d'un cabinet avec sa clé de données et dans le
+    format de chaque champ (valeurs chiffrées avant le chiffrement d'enveloppe
+    ou avant le passage à un algorithme AEAD), par paquets de batch_size lignes,
+    dans l'ordre des id : lecture et écriture courtes (aucun verrou de table),
+    rechiffrement en parallèle (workers processus), pause entre deux paquets.
+    La progression (clé, formats et dernier id traité, par cabinet) est enregistrée
+    dans un fichier de reprise après chaque paquet.
+    """
+
+    def __init__(self, checkpoint_path, batch_size=500, workers=0, pause=0.0):
+        self.checkpoint_path = checkpoint_path
+        self.batch_size = batch_size
+        self.workers = workers
+        self.pause = pause
+        self.fields = [field for field in Patient._meta.concrete_fields if isinstance(field, EncryptedField)]
+        self.algorithms = [field.algorithm for field in self.fields]
+        self.checkpoint = self._load_checkpoint()
+
+    # ------------------------------------------------------------------
+    # Reprise
+    # ------------------------------------------------------------------
+
+    def _load_checkpoint(self):
+        if os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path) as f:
+                return json.load(f)
+        return {'schemas': {}}
+
+    def _target(self, keyring):
+        """Clé et formats visés : la reprise n'est valable que pour la même cible"""
+        return f"{keyring.current_id}/{'+'.join(sorted(set(self.algorithms)))}"
+
+    def _start_id(self, schema_name, target):
+        """Dernier id traité pour cette cible (0 si la clé courante ou un format a changé)"""
+        saved_target, last_id = self.checkpoint['schemas'].get(schema_name, (None, 0))
+        return last_id if saved_target == target else 0
+
+    def _save_checkpoint(self):
+        tmp_path = f'{self.checkpoint_path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.checkpoint, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def restart(self, schema_name):
+        """Reprend un cabinet depuis le début (rattrapage après la rotation)"""
+        self.checkpoint['schemas'].pop(schema_name, None)
+        self._save_checkpoint()
+
+    # ------------------------------------------------------------------
+    # Rechiffrement
+    # ------------------------------------------------------------------
+
+    def run(self, schema_name, progress=None):
+        """Rechiffre les patients du cabinet courant ; retourne {'key_id', 'scanned', 'rotated', 'skipped', 'failed'}"""
+        keyring = get_tenant_keyring(schema_name)
+        report = {'key_id': keyring.current_id, 'scanned': 0, 'rotated': 0, 'skipped': 0, 'failed': []}
+        target = self._target(keyring)
+        start_id = self._start_id(schema_name, target)
+        for last_id, size, (changed, failed) in self._reencrypted_batches(start_id, keyring):
+            rotated = self.write_batch(changed)
+            report['scanned'] += size
+            report['rotated'] += rotated
+            # Modifiées entre lecture et écriture : déjà réenregistrées par l'application
+            report['skipped'] += len(changed) - rotated
+            report['failed'].extend(failed)
+            self.checkpoint['schemas'][schema_name] = [target, last_id]
+            self._save_checkpoint()
+            if progress is not None:
+                progress(last_id, report)
+            if self.pause:
+                time.sleep(self.pause)
+        return report
+
+    def _batches(self, last_id):
+        """Paquets (dernier id, lignes) lus après last_id"""
+        table = connection.ops.quote_name(Patient._meta.db_table)
+        columns = ', '.join(connection.ops.quote_name(field.column) for field in self.fields)
+        while True:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"SELECT id, {columns} FROM {table} WHERE id > %s ORDER BY id LIMIT %s",
+                    [last_id, self.batch_size]
+                )
+                # bytea : memoryview, non transmissible aux processus de travail
+                rows = [
+                    tuple(value.tobytes() if isinstance(value, memoryview) else value for value in row)
+                    for row in cursor.fetchall()
+                ]
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            yield last_id, rows
+
+    def _reencrypted_batches(self, start_id, keyring):
+        """(dernier id, taille, résultat de reencrypt_rows) par paquet, dans l'ordre des id"""
+        if self.workers <= 1:
+            for last_id, rows in self._batches(start_id):
+                yield last_id, len(rows), reencrypt_rows(rows, keyring, self.algorithms)
+            return
+
+        with process_pool(self.workers) as executor:
+            pending = deque()
+            for last_id, rows in self._batches(start_id):
+                pending.append((last_id, len(rows), executor.submit(reencrypt_rows, rows, keyring, self.algorithms)))
+                if len(pending) >= self.workers * 2:
+                    last_id, size, future = pending.popleft()
+                    yield last_id, size, future.result()
+            while pending:
+                last_id, size, future = pending.popleft()
+                yield last_id, size, future.result()
+
+    def write_batch(self, changed):
+        """Enregistre les nouvelles valeurs des lignes inchangées depuis leur lecture"""
+        if not changed:
+            return 0
+        qn = connection.ops.quote_name
+        columns = [qn(field.column) for field in self.fields]
+        old_columns = [qn(f'old_{field.column}') for field in self.fields]
+        # Types explicites : une colonne de VALUES entièrement NULL serait du text
+        types = [field.db_type(connection) for field in self.fields]
+        assignments = ', '.join(f'{column} = v.{column}::{db_type}' for column, db_type in zip(columns, types))
+        current = ', '.join(f'p.{column}' for column in columns)
+        loaded = ', '.join(f'v.{column}::{db_type}' for column, db_type in zip(old_columns, types))
+        sql = (
+            f"UPDATE {qn(Patient._meta.db_table)} AS p SET {assignments} "
+            f"FROM (VALUES %s) AS v (id, {', '.join(columns)}, {', '.join(old_columns)}) "
+            f"WHERE p.id = v.id AND ({current}) IS NOT DISTINCT FROM ({loaded})"
+        )
+        values = [(row_id, *new_values, *old_values) for row_id, old_values, new_values in changed]
+        with transaction.atomic(), connection.cursor() as cursor:
+            execute_values(cursor.cursor, sql, values, page_size=len(values))
+            return cursor.rowcount
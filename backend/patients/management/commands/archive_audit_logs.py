@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from django_tenants.utils import get_public_schema_name, get_tenant_model, schema_context
+
+from patients import partitions
+from patients.archive import archive_record, audit_archive
+from patients.models import AuditLog
+
+
+class Command(BaseCommand):
+    help = (
+        "Déplace les logs d'audit plus anciens que N mois vers des segments "
+        "d'archive compressés (un par cabinet et par mois)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months', type=int, default=12, help="Âge minimal des logs archivés, en mois")
+        parser.add_argument('--schema', help="Limiter à un seul cabinet")
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        cutoff = partitions.add_months(partitions.month_start(timezone.now()), -options['months'])
+        schemas = get_tenant_model().objects.exclude(schema_name=get_public_schema_name())
+        if options['schema']:
+            schemas = schemas.filter(schema_name=options['schema'])
+
+        for schema_name in schemas.values_list('schema_name', flat=True):
+            with schema_context(schema_name):
+                months = AuditLog.objects.filter(timestamp__lt=cutoff).dates('timestamp', 'month')
+                for month in months:
+                    count = self.archive_month(schema_name, month, options['chunk_size'])
+                    self.stdout.write(f"[{schema_name}] {month:%Y-%m} : {count} logs archivés")
+
+    def archive_month(self, schema_name, month, chunk_size):
+        """Archive un mois puis le supprime de la table (après écriture sur disque)"""
+        start, end = month, partitions.add_months(month, 1)
+        logs = AuditLog.objects.filter(timestamp__gte=start, timestamp__lt=end)
+        max_id = None
+
+        def records():
+            nonlocal max_id
+            for log in logs.select_related('user').order_by('id').iterator(chunk_size=chunk_size):
+                max_id = log.id
+                yield archive_record(log)
+
+        count = audit_archive.append(schema_name, month, records())
+        if max_id is not None:
+            with transaction.atomic():
+                logs.filter(id__lte=max_id).delete()
+        return count
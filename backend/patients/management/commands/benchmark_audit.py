@@ -0,0 +1,75 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from patients import audit
+from patients.models import Patient
+
+
+class Command(BaseCommand):
+    help = "Mesure le surcoût du journal d'audit automatique par écriture de patient (sans base de données)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20000)
+        parser.add_argument(
+            '--max-overhead-us', type=float, default=50.0,
+            help="Échoue si le surcoût moyen par écriture dépasse ce seuil (microsecondes)"
+        )
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        writer = audit.AuditWriter(autostart=False)
+        field_names = [field.attname for field in Patient._meta.concrete_fields]
+        values = [self._sample_value(field) for field in Patient._meta.concrete_fields]
+
+        # Référence : chargement et modification sans audit
+        start = time.perf_counter()
+        for _ in range(iterations):
+            patient = Patient.from_db('default', field_names, values)
+            patient.city = 'Lyon'
+            patient.first_name = 'Marie'
+        baseline = time.perf_counter() - start
+
+        # Avec audit : diff, construction de l'entrée et mise en tampon
+        original_writer = audit.audit_writer
+        audit.audit_writer = writer
+        try:
+            start = time.perf_counter()
+            for _ in range(iterations):
+                patient = Patient.from_db('default', field_names, values)
+                patient.city = 'Lyon'
+                patient.first_name = 'Marie'
+                audit.log_model_change(patient, created=False)
+            audited = time.perf_counter() - start
+        finally:
+            audit.audit_writer = original_writer
+
+        overhead_us = (audited - baseline) / iterations * 1e6
+        self.stdout.write(f"Itérations           : {iterations}")
+        self.stdout.write(f"Sans audit           : {baseline / iterations * 1e6:.2f} µs/écriture")
+        self.stdout.write(f"Avec audit           : {audited / iterations * 1e6:.2f} µs/écriture")
+        self.stdout.write(f"Surcoût              : {overhead_us:.2f} µs/écriture")
+        self.stdout.write(f"Entrées en tampon    : {writer.pending()}")
+
+        if overhead_us > options['max_overhead_us']:
+            raise CommandError(
+                f"Surcoût d'audit {overhead_us:.2f} µs > seuil {options['max_overhead_us']} µs"
+            )
+        self.stdout.write(self.style.SUCCESS("Surcoût dans le budget."))
+
+    @staticmethod
+    def _sample_value(field):
+        if field.primary_key:
+            return 1
+        if field.get_internal_type() == 'DateField':
+            return datetime.date(1980, 5, 17)
+        if field.get_internal_type() == 'DateTimeField':
+            return datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
+        if field.get_internal_type() == 'BooleanField':
+            return True
+        if field.get_internal_type() == 'ArrayField':
+            return []
+        if field.is_relation:
+            return None
+        return 'Paris'
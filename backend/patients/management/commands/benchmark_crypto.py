@@ -0,0 +1,175 @@
+import base64
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from cryptography.fernet import Fernet
+from django.core.management.base import BaseCommand, CommandError
+from django_tenants.utils import get_public_schema_name, get_tenant_model, schema_context
+
+from patients.encryption import (
+    AEAD_ALGORITHMS, FERNET, get_key_provider, get_tenant_keyring, tenant_keyring, using_keyring
+)
+from patients.models import EncryptedField, Patient, decrypt_instances
+
+# Valeurs typiques des champs chiffrés d'un patient
+SAMPLE_VALUES = {
+    'first_name': 'Marie',
+    'last_name': 'Dupont',
+    'social_security_number': '2 85 05 75 123 456 78',
+    'address': '12 rue de la République',
+    'phone': '01 23 45 67 89',
+    'mobile': '06 12 34 56 78',
+    'email': 'marie.dupont@example.fr',
+    'emergency_contact_name': 'Jean Dupont',
+    'emergency_contact_phone': '06 98 76 54 32',
+    'insurance_number': 'MGEN-123456789',
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Mesure le coût du chiffrement des champs patients selon l'origine des clés, "
+        "puis la taille et le débit de chaque format de stockage et le déchiffrement "
+        "par paquets selon le nombre de threads (sans base de données)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20000)
+        parser.add_argument('--schema', help="Cabinet dont la clé de données est utilisée (par défaut le premier)")
+        parser.add_argument('--values-per-request', type=int, default=10,
+                            help="Valeurs chiffrées et déchiffrées par requête simulée")
+        parser.add_argument('--patients', type=int, default=20000,
+                            help="Patients déchiffrés par le test de déchiffrement par paquets")
+        parser.add_argument('--chunk', type=int, default=1000, help="Taille des paquets de déchiffrement")
+
+    def handle(self, *args, **options):
+        tenants = get_tenant_model().objects.exclude(schema_name=get_public_schema_name())
+        if options['schema']:
+            tenants = tenants.filter(schema_name=options['schema'])
+        tenant = tenants.order_by('pk').first()
+        if tenant is None:
+            raise CommandError("Aucun cabinet")
+
+        iterations = options['iterations']
+        per_request = options['values_per_request']
+        field = Patient._meta.get_field('last_name')
+        master_keyring = get_key_provider().get_keyring()
+
+        with schema_context(tenant.schema_name):
+            get_tenant_keyring(tenant.schema_name)
+            data_keys = type(tenant).objects.values_list('encrypted_data_key', flat=True).get(pk=tenant.pk)
+
+            def single_key():
+                with using_keyring(master_keyring):
+                    self._round_trips(field, per_request)
+
+            def cached_tenant_key():
+                self._round_trips(field, per_request)
+
+            def unwrapped_tenant_key():
+                with using_keyring(tenant_keyring(master_keyring, data_keys)):
+                    self._round_trips(field, per_request)
+
+            results = [
+                ("Clé unique (référence)", self._measure(single_key, iterations, per_request)),
+                ("Clé du cabinet, en cache", self._measure(cached_tenant_key, iterations, per_request)),
+                ("Clé du cabinet, déchiffrée par requête", self._measure(unwrapped_tenant_key, iterations, per_request)),
+            ]
+            formats = self._measure_formats(get_tenant_keyring(tenant.schema_name), iterations)
+            scaling = self._measure_batches(get_tenant_keyring(tenant.schema_name), options['patients'], options['chunk'])
+
+        self.stdout.write(f"Cabinet              : {tenant.schema_name}")
+        self.stdout.write(f"Itérations           : {iterations} ({per_request} valeurs par requête)")
+        baseline = results[0][1]
+        for label, duration_us in results:
+            self.stdout.write(
+                f"{label:<40}: {duration_us:.2f} µs/valeur ({(duration_us / baseline - 1) * 100:+.1f} %)"
+            )
+
+        current = [field.algorithm for field in Patient._meta.concrete_fields if isinstance(field, EncryptedField)]
+        self.stdout.write("")
+        self.stdout.write(f"Formats de stockage ({len(SAMPLE_VALUES)} champs chiffrés par patient, format actuel : "
+                          f"{', '.join(sorted(set(current)))})")
+        self.stdout.write(f"{'Format':<28}{'octets/patient':>16}{'chiffrement':>16}{'déchiffrement':>16}")
+        for label, size, encrypt_us, decrypt_us in formats:
+            self.stdout.write(f"{label:<28}{size:>16}{encrypt_us:>11.2f} µs/v{decrypt_us:>11.2f} µs/v")
+
+        self.stdout.write("")
+        self.stdout.write(f"Déchiffrement par paquets ({options['patients']} patients, paquets de {options['chunk']}, "
+                          f"{os.cpu_count()} cœurs)")
+        self.stdout.write(f"{'Threads':<10}{'patients/s':>14}{'µs/valeur':>12}{'accélération':>14}")
+        for workers, patients_per_s, value_us in scaling:
+            self.stdout.write(
+                f"{workers:<10}{patients_per_s:>14.0f}{value_us:>12.2f}{patients_per_s / scaling[0][1]:>13.2f}x"
+            )
+
+    @staticmethod
+    def _measure_formats(keyring, iterations):
+        """(format, octets par patient, µs par chiffrement, µs par déchiffrement) de chaque format"""
+        legacy_cipher = Fernet(keyring.keys[keyring.current_id])
+        encoders = [
+            ("fernet + base64 (historique)", lambda data: base64.urlsafe_b64encode(legacy_cipher.encrypt(data)).decode()),
+            (FERNET, lambda data: keyring.encrypt(data, FERNET)),
+            *((name, lambda data, name=name: keyring.encrypt(data, name)) for name in AEAD_ALGORITHMS),
+        ]
+        values = [value.encode() for value in SAMPLE_VALUES.values()]
+        rows = max(iterations // len(values), 1)
+        results = []
+        for label, encrypt in encoders:
+            start = time.perf_counter()
+            for _ in range(rows):
+                encrypted = [encrypt(value) for value in values]
+            encrypt_us = (time.perf_counter() - start) / (rows * len(values)) * 1e6
+
+            start = time.perf_counter()
+            for _ in range(rows):
+                for value in encrypted:
+                    keyring.decrypt(value)
+            decrypt_us = (time.perf_counter() - start) / (rows * len(values)) * 1e6
+
+            size = sum(len(value.encode() if isinstance(value, str) else value) for value in encrypted)
+            results.append((label, size, encrypt_us, decrypt_us))
+        return results
+
+    @staticmethod
+    def _measure_batches(keyring, count, chunk):
+        """(threads, patients par seconde, µs par valeur) de decrypt_instances, de 1 thread à un par cœur"""
+        fields = {field.name: field for field in Patient._meta.concrete_fields if isinstance(field, EncryptedField)}
+        encrypted = {
+            fields[name].attname: keyring.encrypt(value.encode(), fields[name].algorithm)
+            for name, value in SAMPLE_VALUES.items()
+        }
+        thread_counts = [1]
+        while thread_counts[-1] < max(os.cpu_count() or 1, 2):
+            thread_counts.append(thread_counts[-1] * 2)
+
+        results = []
+        for workers in thread_counts:
+            with ThreadPoolExecutor(workers) as executor:
+                elapsed = 0.0
+                for start in range(0, count, chunk):
+                    patients = [
+                        Patient(**{attname: Patient._meta.get_field(attname).ciphertext(value)
+                                   for attname, value in encrypted.items()})
+                        for _ in range(min(chunk, count - start))
+                    ]
+                    begin = time.perf_counter()
+                    decrypt_instances(patients, keyring, executor if workers > 1 else None, workers)
+                    elapsed += time.perf_counter() - begin
+            results.append((workers, count / elapsed, elapsed / (count * len(encrypted)) * 1e6))
+        return results
+
+    @staticmethod
+    def _round_trips(field, count):
+        for _ in range(count):
+            field.decrypt_value(field.encrypt_value('Dupont'))
+
+    @staticmethod
+    def _measure(request, iterations, per_request):
+        """Durée moyenne d'un chiffrement + déchiffrement, en microsecondes"""
+        requests = max(iterations // per_request, 1)
+        start = time.perf_counter()
+        for _ in range(requests):
+            request()
+        return (time.perf_counter() - start) / (requests * per_request) * 1e6
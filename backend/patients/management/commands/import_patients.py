@@ -0,0 +1,47 @@
+import os
+from pathlib import Path
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django_tenants.utils import schema_context
+
+from patients.importer import PatientImporter, iter_rows
+
+
+class Command(BaseCommand):
+    help = "Importe des patients depuis un fichier CSV ou NDJSON dans le cabinet indiqué"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--schema', required=True, help="Schéma du cabinet")
+        parser.add_argument('--format', dest='file_format', choices=['csv', 'ndjson'],
+                            help="Par défaut d'après l'extension du fichier")
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help="Processus de validation/chiffrement (0 : aucun)")
+        parser.add_argument('--username', help="Utilisateur enregistré comme créateur")
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        file_format = options['file_format'] or ('ndjson' if path.suffix in ('.ndjson', '.jsonl') else 'csv')
+        user = None
+        if options['username']:
+            user = get_user_model().objects.filter(username=options['username']).first()
+            if user is None:
+                raise CommandError(f"Utilisateur inconnu : {options['username']}")
+
+        importer = PatientImporter(user=user, chunk_size=options['chunk_size'], workers=options['workers'])
+
+        def progress(processed, created, errors):
+            self.stdout.write(f"{processed} lignes lues, {created} patients créés, {errors} erreurs")
+
+        with schema_context(options['schema']), open(path, newline='', encoding='utf-8-sig') as stream:
+            report = importer.run(iter_rows(stream, file_format), progress=progress)
+
+        for error in report['errors']:
+            self.stderr.write(f"Ligne {error['row']} : {error['errors']}")
+        if report['error_count'] > len(report['errors']):
+            self.stderr.write(f"... {report['error_count'] - len(report['errors'])} autres erreurs")
+        self.stdout.write(self.style.SUCCESS(
+            f"{report['created']} patients importés, {report['error_count']} lignes rejetées."
+        ))
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from django_tenants.utils import get_public_schema_name, get_tenant_model, schema_context
+
+from patients import partitions
+
+
+class Command(BaseCommand):
+    help = (
+        "Crée les partitions mensuelles à venir du journal d'audit, vide la "
+        "partition par défaut dans des partitions mensuelles et détache les "
+        "partitions plus anciennes que la durée de rétention, pour chaque cabinet"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ahead', type=int, default=3, help="Nombre de mois à créer à l'avance")
+        parser.add_argument(
+            '--retain-months', type=int, default=None,
+            help="Détacher les partitions plus anciennes que ce nombre de mois (aucune par défaut)"
+        )
+        parser.add_argument('--drop', action='store_true', help="Supprimer les partitions détachées")
+        parser.add_argument('--schema', help="Limiter à un seul cabinet")
+
+    def handle(self, *args, **options):
+        current_month = partitions.month_start(timezone.now())
+        schemas = get_tenant_model().objects.exclude(schema_name=get_public_schema_name())
+        if options['schema']:
+            schemas = schemas.filter(schema_name=options['schema'])
+
+        for schema_name in schemas.values_list('schema_name', flat=True):
+            with schema_context(schema_name):
+                created = partitions.create_partitions(
+                    current_month, partitions.add_months(current_month, options['ahead'])
+                )
+                self.stdout.write(f"[{schema_name}] partitions présentes jusqu'à {created[-1]}")
+                # Lignes hors plage (mois passés ou lointains) : partitions créées pour
+                # leurs mois, détachées ci-dessous si elles dépassent la rétention
+                for name in partitions.drain_default_partition():
+                    self.stdout.write(f"[{schema_name}] partition créée pour la partition par défaut : {name}")
+
+                if options['retain_months'] is not None:
+                    oldest = partitions.add_months(current_month, -options['retain_months'])
+                    detached = partitions.detach_partitions_before(oldest, drop=options['drop'])
+                    action = 'supprimée' if options['drop'] else 'détachée'
+                    for name in detached:
+                        self.stdout.write(f"[{schema_name}] partition {action} : {name}")
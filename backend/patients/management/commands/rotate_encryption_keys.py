@@ -0,0 +1,77 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django_tenants.utils import get_public_schema_name, get_tenant_model, schema_context
+
+from patients.encryption import get_key_provider, rewrap_data_keys, rotate_data_key
+from patients.key_rotation import KeyRotation
+
+
+class Command(BaseCommand):
+    help = (
+        "Ajoute une clé maître (--new-key) et rechiffre les clés de données des cabinets, "
+        "ajoute une clé de données à chaque cabinet (--new-data-key), puis rechiffre avec "
+        "la clé courante de leur cabinet les patients chiffrés par une autre clé. "
+        "Reprend là où une exécution précédente s'est arrêtée."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--new-key', action='store_true', help="Ajoute une clé maître, qui devient la clé courante")
+        parser.add_argument('--new-data-key', action='store_true',
+                            help="Ajoute une clé de données à chaque cabinet, qui devient sa clé courante")
+        parser.add_argument('--schema', help="Limiter à un seul cabinet")
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help="Processus de rechiffrement (0 : aucun)")
+        parser.add_argument('--pause', type=float, default=0.05, help="Pause entre deux paquets, en secondes")
+        parser.add_argument('--checkpoint', help="Fichier de reprise (par défaut <ENCRYPTION_KEY_FILE>.rotation.json)")
+        parser.add_argument('--restart', action='store_true',
+                            help="Repart du début (rattrape les lignes écrites avec l'ancienne clé pendant la rotation)")
+
+    def handle(self, *args, **options):
+        provider = get_key_provider()
+        if options['new_key']:
+            key_id = provider.add_key()
+            self.stdout.write(
+                f"Clé maître {key_id} ajoutée : prise en compte par les serveurs sous "
+                f"{getattr(settings, 'ENCRYPTION_KEY_RELOAD_INTERVAL', 30)} s."
+            )
+            self.stdout.write(f"{rewrap_data_keys()} clés de données rechiffrées.")
+
+        rotation = KeyRotation(
+            options['checkpoint'] or f'{provider.get_key_file()}.rotation.json',
+            batch_size=options['batch_size'],
+            workers=options['workers'],
+            pause=options['pause'],
+        )
+        schemas = get_tenant_model().objects.exclude(schema_name=get_public_schema_name())
+        if options['schema']:
+            schemas = schemas.filter(schema_name=options['schema'])
+
+        for schema_name in schemas.values_list('schema_name', flat=True):
+            if options['restart']:
+                rotation.restart(schema_name)
+            if options['new_data_key']:
+                key_id = rotate_data_key(schema_name)
+                self.stdout.write(
+                    f"[{schema_name}] clé de données {key_id} ajoutée : prise en compte par les serveurs "
+                    f"sous {getattr(settings, 'TENANT_DATA_KEY_CACHE_TTL', 300)} s (relancer avec --restart ensuite)."
+                )
+
+            def progress(last_id, report):
+                self.stdout.write(
+                    f"[{schema_name}] id {last_id} : {report['scanned']} lues, {report['rotated']} rechiffrées"
+                )
+
+            with schema_context(schema_name):
+                report = rotation.run(schema_name, progress=progress)
+            if report['failed']:
+                self.stderr.write(
+                    f"[{schema_name}] {len(report['failed'])} patients indéchiffrables : "
+                    f"{', '.join(map(str, report['failed'][:20]))}"
+                )
+            self.stdout.write(self.style.SUCCESS(
+                f"[{schema_name}] clé {report['key_id']} : {report['rotated']} patients rechiffrés, "
+                f"{report['skipped']} modifiés entre-temps."
+            ))
@@ -0,0 +1,65 @@
+# Generated by Django 5.2.5 on 2026-10-17 01:21
+
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+from django.conf import settings
+from django.db import migrations, models
+
+from patients import blind_index
+
+
+def fill_blind_indexes(apps, schema_editor):
+    """Calcule les jetons de recherche des patients existants"""
+    Patient = apps.get_model('patients', 'Patient')
+    batch = []
+    for patient in Patient.objects.using(schema_editor.connection.alias).iterator(chunk_size=500):
+        patient.first_name_bidx = blind_index.name_tokens(patient.first_name, 'first_name')
+        patient.last_name_bidx = blind_index.name_tokens(patient.last_name, 'last_name')
+        patient.phone_bidx = blind_index.phone_token(patient.phone)
+        patient.email_bidx = blind_index.email_token(patient.email)
+        batch.append(patient)
+        if len(batch) >= 500:
+            Patient.objects.bulk_update(batch, ['first_name_bidx', 'last_name_bidx', 'phone_bidx', 'email_bidx'])
+            batch = []
+    if batch:
+        Patient.objects.bulk_update(batch, ['first_name_bidx', 'last_name_bidx', 'phone_bidx', 'email_bidx'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='patient',
+            name='email_bidx',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=16),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='first_name_bidx',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.CharField(max_length=16), blank=True, default=list, editable=False, size=None),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='last_name_bidx',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.CharField(max_length=16), blank=True, default=list, editable=False, size=None),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='phone_bidx',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=16),
+        ),
+        migrations.RunPython(fill_blind_indexes, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='patient',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['first_name_bidx'], name='patient_first_name_bidx_gin'),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['last_name_bidx'], name='patient_last_name_bidx_gin'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.5 on 2026-10-17 01:22
+
+from django.db import migrations, models
+
+from patients import blind_index
+
+
+def fill_phone_blind_indexes(apps, schema_editor):
+    """Recalcule les jetons téléphone au format E.164 et ceux du mobile"""
+    Patient = apps.get_model('patients', 'Patient')
+    batch = []
+    for patient in Patient.objects.using(schema_editor.connection.alias).iterator(chunk_size=500):
+        patient.phone_bidx = blind_index.phone_token(patient.phone)
+        patient.mobile_bidx = blind_index.phone_token(patient.mobile)
+        batch.append(patient)
+        if len(batch) >= 500:
+            Patient.objects.bulk_update(batch, ['phone_bidx', 'mobile_bidx'])
+            batch = []
+    if batch:
+        Patient.objects.bulk_update(batch, ['phone_bidx', 'mobile_bidx'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0002_patient_blind_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='patient',
+            name='mobile_bidx',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=16),
+        ),
+        migrations.RunPython(fill_phone_blind_indexes, migrations.RunPython.noop),
+    ]
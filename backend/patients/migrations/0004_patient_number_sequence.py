@@ -0,0 +1,45 @@
+# Generated by Django 5.2.5 on 2026-10-17 01:23
+
+import patients.models
+from django.db import migrations, models
+
+
+# Séquence et fonction créées dans le schéma de chaque cabinet : la séquence
+# repart du plus grand numéro déjà attribué.
+CREATE_PATIENT_NUMBER_SEQUENCE = """
+CREATE SEQUENCE IF NOT EXISTS patients_patient_number_seq;
+SELECT setval(
+    'patients_patient_number_seq',
+    COALESCE((
+        SELECT MAX(SUBSTRING(patient_number FROM 2)::bigint)
+        FROM patients_patient
+        WHERE patient_number ~ '^P[0-9]+$'
+    ), 0) + 1,
+    false
+);
+CREATE OR REPLACE FUNCTION patients_next_patient_number() RETURNS varchar AS $$
+    SELECT 'P' || CASE WHEN n < 1000000 THEN lpad(n::text, 6, '0') ELSE n::text END
+    FROM nextval('patients_patient_number_seq') AS n
+$$ LANGUAGE sql VOLATILE;
+"""
+
+DROP_PATIENT_NUMBER_SEQUENCE = """
+DROP FUNCTION IF EXISTS patients_next_patient_number();
+DROP SEQUENCE IF EXISTS patients_patient_number_seq;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0003_patient_mobile_blind_index'),
+    ]
+
+    operations = [
+        migrations.RunSQL(CREATE_PATIENT_NUMBER_SEQUENCE, DROP_PATIENT_NUMBER_SEQUENCE),
+        migrations.AlterField(
+            model_name='patient',
+            name='patient_number',
+            field=models.CharField(db_default=patients.models.NextPatientNumber(), max_length=20, unique=True, verbose_name='Numéro patient'),
+        ),
+    ]
@@ -0,0 +1,83 @@
+# Generated by Django 5.2.5 on 2026-10-17 01:29
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+from patients import partitions
+
+
+# Table partitionnée par mois : la clé primaire doit inclure timestamp et
+# l'id provient d'une séquence (pas de colonne IDENTITY avant PostgreSQL 17).
+CREATE_PARTITIONED_TABLE = """
+CREATE TABLE patients_auditlog_partitioned (
+    id bigint NOT NULL,
+    action varchar(10) NOT NULL,
+    model_name varchar(100) NOT NULL,
+    object_id varchar(100) NOT NULL,
+    object_repr varchar(200) NOT NULL,
+    changes jsonb NULL,
+    ip_address inet NULL,
+    user_agent text NOT NULL,
+    "timestamp" timestamp with time zone NOT NULL,
+    user_id bigint NULL,
+    PRIMARY KEY (id, "timestamp")
+) PARTITION BY RANGE ("timestamp");
+CREATE TABLE patients_auditlog_default PARTITION OF patients_auditlog_partitioned DEFAULT;
+"""
+
+SWAP_TABLES = """
+INSERT INTO patients_auditlog_partitioned
+    (id, action, model_name, object_id, object_repr, changes, ip_address, user_agent, "timestamp", user_id)
+SELECT id, action, model_name, object_id, object_repr, changes, ip_address, user_agent, "timestamp", user_id
+FROM patients_auditlog;
+DROP TABLE patients_auditlog;
+ALTER TABLE patients_auditlog_partitioned RENAME TO patients_auditlog;
+ALTER TABLE patients_auditlog RENAME CONSTRAINT patients_auditlog_partitioned_pkey TO patients_auditlog_pkey;
+CREATE SEQUENCE patients_auditlog_id_seq OWNED BY patients_auditlog.id;
+SELECT setval('patients_auditlog_id_seq', COALESCE(MAX(id), 0) + 1, false) FROM patients_auditlog;
+ALTER TABLE patients_auditlog ALTER COLUMN id SET DEFAULT nextval('patients_auditlog_id_seq');
+"""
+
+# Clé étrangère et index créés par Django sur l'ancienne table (mêmes noms)
+RESTORE_CONSTRAINTS = """
+ALTER TABLE patients_auditlog ADD CONSTRAINT patients_auditlog_user_id_e20accd3_fk_core_customuser_id
+    FOREIGN KEY (user_id) REFERENCES core_customuser (id) DEFERRABLE INITIALLY DEFERRED;
+CREATE INDEX patients_auditlog_user_id_e20accd3 ON patients_auditlog (user_id);
+CREATE INDEX auditlog_timestamp_id_idx ON patients_auditlog ("timestamp" DESC, id DESC);
+"""
+
+
+def partition_audit_log(apps, schema_editor):
+    """Convertit patients_auditlog en table partitionnée par mois"""
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        cursor.execute(CREATE_PARTITIONED_TABLE)
+        cursor.execute('SELECT MIN("timestamp") FROM patients_auditlog')
+        first = cursor.fetchone()[0] or timezone.now()
+
+    # Partitions de la plus ancienne entrée jusqu'à trois mois d'avance
+    last = partitions.add_months(partitions.month_start(timezone.now()), 3)
+    partitions.create_partitions(first, last, parent='patients_auditlog_partitioned', connection=connection)
+    schema_editor.execute(SWAP_TABLES)
+    schema_editor.execute(RESTORE_CONSTRAINTS)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0005_cursor_pagination_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_audit_log, elidable=False),
+        migrations.AddIndex(
+            model_name='auditlog',
+            index=models.Index(fields=['model_name', 'object_id', '-timestamp'], name='auditlog_object_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='auditlog',
+            index=models.Index(fields=['user', '-timestamp'], name='auditlog_user_timestamp_idx'),
+        ),
+    ]
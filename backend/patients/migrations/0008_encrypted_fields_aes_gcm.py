@@ -0,0 +1,104 @@
+# Generated by Django 5.2.5 on 2026-10-17 01:55
+
+import patients.models
+from django.db import migrations
+
+
+# Colonnes chiffrées passées de text (Fernet) à bytea (AES-GCM), en une seule
+# réécriture de la table. Les valeurs existantes sont conservées octet pour
+# octet et restent lisibles ; rotate_encryption_keys les rechiffre ensuite en
+# AES-GCM, par paquets. Retour arrière possible tant qu'aucune valeur AES-GCM
+# n'a été écrite (convert_from échoue sinon).
+#
+# INTERRUPTION DE SERVICE : la réécriture garde un verrou ACCESS EXCLUSIVE sur
+# la table des patients du cabinet pendant toute sa durée (proportionnelle au
+# nombre de patients) ; aucune lecture ni écriture de patient n'aboutit entre-temps.
+# migrate_schemas l'applique cabinet par cabinet : pour les gros cabinets,
+# migrer hors des heures d'ouverture (migrate_schemas --schema=<cabinet>).
+# lock_timeout : si des transactions tiennent déjà la table, la migration
+# échoue au bout de 5 s (à relancer) au lieu de bloquer tout le trafic en attente.
+ENCRYPTED_COLUMNS = [
+    'address',
+    'email',
+    'emergency_contact_name',
+    'emergency_contact_phone',
+    'first_name',
+    'insurance_number',
+    'last_name',
+    'mobile',
+    'phone',
+    'social_security_number',
+]
+
+TO_BYTEA = "SET LOCAL lock_timeout = '5s'; ALTER TABLE patients_patient " + ', '.join(
+    f"ALTER COLUMN {column} TYPE bytea USING convert_to({column}, 'UTF8')" for column in ENCRYPTED_COLUMNS
+)
+
+TO_TEXT = 'ALTER TABLE patients_patient ' + ', '.join(
+    f"ALTER COLUMN {column} TYPE text USING convert_from({column}, 'UTF8')" for column in ENCRYPTED_COLUMNS
+)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0007_patient_updated_by'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[migrations.RunSQL(TO_BYTEA, TO_TEXT)],
+            state_operations=[
+                migrations.AlterField(
+                    model_name='patient',
+                    name='address',
+                    field=patients.models.EncryptedField(algorithm='aes-gcm', blank=True, verbose_name='Adresse'),
+                ),
+                migrations.AlterField(
+                    model_name='patient',
+                    name='email',
+                    field=patients.models.EncryptedField(algorithm='aes-gcm', blank=True, verbose_name='Email'),
+                ),
+                migrations.AlterField(
+                    model_name='patient',
+                    name='emergency_contact_name',
+                    field=patients.models.EncryptedField(algorithm='aes-gcm', blank=True, verbose_name="Contact d'urgence - Nom"),
+                ),
+                migrations.AlterField(
+                    model_name='patient',
+                    name='emergency_contact_phone',
+                    field=patients.models.EncryptedField(algorithm='aes-gcm', blank=True, verbose_name="Contact d'urgence - Téléphone"),
+                ),
+                migrations.AlterField(
+                    model_name='patient',
+                    name='first_name',
+                    field=patients.models.EncryptedField(algorithm='aes-gcm', verbose_name='Prénom'),
+                ),
+                migrations.AlterField(
+                    model_name='patient',
+                    name='insurance_number',
+                    field=patients.models.EncryptedField(algorithm='aes-gcm', blank=True, verbose_name='Numéro adhérent'),
+                ),
+                migrations.AlterField(
+                    model_name='patient',
+                    name='last_name',
+                    field=patients.models.EncryptedField(algorithm='aes-gcm', verbose_name='Nom'),
+                ),
+                migrations.AlterField(
+                    model_name='patient',
+                    name='mobile',
+                    field=patients.models.EncryptedField(algorithm='aes-gcm', blank=True, verbose_name='Mobile'),
+                ),
+                migrations.AlterField(
+                    model_name='patient',
+                    name='phone',
+                    field=patients.models.EncryptedField(algorithm='aes-gcm', blank=True, verbose_name='Téléphone'),
+                ),
+                migrations.AlterField(
+                    model_name='patient',
+                    name='social_security_number',
+                    field=patients.models.EncryptedField(algorithm='aes-gcm', blank=True, verbose_name='Numéro de sécurité sociale'),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.5 on 2026-10-17 02:07
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0008_encrypted_fields_aes_gcm'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['patient_number'], name='patient_number_pattern_idx', opclasses=['varchar_pattern_ops']),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.5 on 2026-10-17 02:21
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0009_patient_number_pattern_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PatientImport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('PENDING', 'En attente'), ('RUNNING', 'En cours'), ('DONE', 'Terminé'), ('FAILED', 'Échec')], default='PENDING', max_length=10, verbose_name='Statut')),
+                ('file_format', models.CharField(choices=[('csv', 'CSV'), ('ndjson', 'NDJSON')], max_length=10, verbose_name='Format')),
+                ('file_name', models.CharField(blank=True, max_length=255, verbose_name='Fichier')),
+                ('processed', models.PositiveIntegerField(default=0, verbose_name='Lignes lues')),
+                ('created', models.PositiveIntegerField(default=0, verbose_name='Patients créés')),
+                ('error_count', models.PositiveIntegerField(default=0, verbose_name='Lignes rejetées')),
+                ('errors', models.JSONField(blank=True, default=list, verbose_name='Erreurs')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('created_by', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='patient_imports', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Import de patients',
+                'verbose_name_plural': 'Imports de patients',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
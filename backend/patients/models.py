@@ -1,9 +1,23 @@
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+from cryptography.fernet import InvalidToken
+from django.conf import settings
 from django.db import models
+from django.db.models import Q
+from django.db.models.expressions import DatabaseDefault
+from django.db.models.query_utils import DeferredAttribute
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
 from django.utils import timezone
-from cryptography.fernet import Fernet
-import base64
-import os
+
+from core.profiling import profiled, record
+
+from . import blind_index
+from .encryption import AEAD_ALGORITHMS, FERNET, Keyring, UnknownKeyId, get_current_keyring, reload_keyring
 
 User = get_user_model()
 
@@ -13,7 +27,10 @@ User = get_user_model()
 # ============================================================================
 
 class AuditLog(models.Model):
-    """Modèle d'audit pour traçabilité RGPD"""
+    """
+    Modèle d'audit pour traçabilité RGPD.
+    Table partitionnée par mois sur timestamp (voir manage_audit_partitions).
+    """
     ACTION_CHOICES = [
         ('CREATE', 'Création'),
         ('READ', 'Lecture'),
@@ -38,6 +55,14 @@ class AuditLog(models.Model):
         verbose_name = "Log d'audit"
         verbose_name_plural = "Logs d'audit"
         ordering = ['-timestamp']
+        indexes = [
+            # Pagination par curseur sur (timestamp, id)
+            models.Index(fields=['-timestamp', '-id'], name='auditlog_timestamp_id_idx'),
+            # Historique d'un objet (PatientViewSet.audit_log)
+            models.Index(fields=['model_name', 'object_id', '-timestamp'], name='auditlog_object_idx'),
+            # Actions d'un utilisateur (AuditLogViewSet hors dentistes/admins)
+            models.Index(fields=['user', '-timestamp'], name='auditlog_user_timestamp_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user} - {self.action} - {self.model_name} - {self.timestamp}"
@@ -47,55 +72,152 @@ class AuditLog(models.Model):
 # CHIFFREMENT DES DONNÉES SENSIBLES
 # ============================================================================
 
+class Ciphertext:
+    """
+    Valeur chiffrée lue en base, pas encore déchiffrée.
+    Réenregistrée telle quelle si elle n'a jamais été lue.
+    """
+    field = None
+    
+    def decrypt(self):
+        return self.field.decrypt_value(self)
+
+
+class TextCiphertext(Ciphertext, str):
+    """Valeur chiffrée d'une colonne text (Fernet)"""
+
+
+class BinaryCiphertext(Ciphertext, bytes):
+    """Valeur chiffrée d'une colonne bytea (AEAD)"""
+
+
+def decrypt_lazy(value):
+    """Valeur en clair d'une valeur éventuellement paresseuse"""
+    return value.decrypt() if isinstance(value, Ciphertext) else value
+
+
+def store_plaintext(instance, attname, ciphertext, plaintext):
+    """Remplace sur l'instance une valeur chiffrée par sa valeur en clair"""
+    instance.__dict__[attname] = plaintext
+    # L'état de référence du diff d'audit suit, sans second déchiffrement
+    loaded = instance.__dict__.get('_loaded_values')
+    if loaded is not None and loaded.get(attname) is ciphertext:
+        loaded[attname] = plaintext
+
+
+class EncryptedAttribute(DeferredAttribute):
+    """Déchiffre la valeur au premier accès puis la garde en clair sur l'instance"""
+    
+    def __get__(self, instance, cls=None):
+        value = super().__get__(instance, cls)
+        if instance is None or not isinstance(value, Ciphertext):
+            return value
+        
+        plaintext = value.decrypt()
+        store_plaintext(instance, self.field.attname, value, plaintext)
+        return plaintext
+    
+    def __set__(self, instance, value):
+        # Descripteur de données : prioritaire sur le __dict__ de l'instance
+        instance.__dict__[self.field.attname] = value
+
+
 class EncryptedField(models.TextField):
-    """Champ personnalisé pour chiffrer les données sensibles"""
+    """
+    Champ personnalisé pour chiffrer les données sensibles (déchiffrement paresseux).
+    algorithm : 'fernet' (colonne text) ou un algorithme AEAD, 'aes-gcm' ou
+    'chacha20-poly1305' (colonne bytea, plus compacte et plus rapide).
+    """
+    descriptor_class = EncryptedAttribute
     
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, algorithm=FERNET, **kwargs):
+        if algorithm != FERNET and algorithm not in AEAD_ALGORITHMS:
+            raise ValueError(f"Algorithme de chiffrement inconnu : {algorithm}")
+        self.algorithm = algorithm
         super().__init__(*args, **kwargs)
-        # Générer ou récupérer la clé de chiffrement
-        self.cipher_key = self._get_or_create_key()
-    
-    def _get_or_create_key(self):
-        """Récupère ou crée la clé de chiffrement"""
-        key_file = 'encryption.key'
-        if os.path.exists(key_file):
-            with open(key_file, 'rb') as f:
-                key = f.read()
-        else:
-            key = Fernet.generate_key()
-            with open(key_file, 'wb') as f:
-                f.write(key)
-        return key
     
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        if self.algorithm != FERNET:
+            kwargs['algorithm'] = self.algorithm
+        return name, path, args, kwargs
+    
+    def db_type(self, connection):
+        return 'bytea' if self.algorithm != FERNET else super().db_type(connection)
+    
+    @property
+    def keyring(self):
+        """Clés du cabinet courant (clé de données et clés maîtres), en cache"""
+        return get_current_keyring()
+    
+    @profiled('encrypt')
     def encrypt_value(self, value):
-        """Chiffre une valeur"""
+        """Chiffre une valeur avec la clé courante (préfixée par son identifiant)"""
         if not value:
             return value
-        f = Fernet(self.cipher_key)
-        encrypted_value = f.encrypt(value.encode())
-        return base64.urlsafe_b64encode(encrypted_value).decode()
+        return self.keyring.encrypt(value.encode(), self.algorithm)
     
+    @profiled('decrypt')
     def decrypt_value(self, value):
-        """Déchiffre une valeur"""
+        """Déchiffre une valeur, quelle que soit la clé qui l'a chiffrée"""
+        return self._decrypt(self.keyring, value)
+    
+    def decrypt_many(self, values, keyring):
+        """
+        Déchiffre une liste de valeurs avec les clés données : appelable depuis
+        un thread de travail, qui n'hérite pas des clés du cabinet courant.
+        """
+        return [self._decrypt(keyring, value) for value in values]
+    
+    @staticmethod
+    def _decrypt(keyring, value):
         if not value:
             return value
         try:
-            f = Fernet(self.cipher_key)
-            encrypted_value = base64.urlsafe_b64decode(value.encode())
-            return f.decrypt(encrypted_value).decode()
-        except:
-            return value  # Retourne la valeur non chiffrée si erreur
+            try:
+                return keyring.decrypt(value).decode()
+            except UnknownKeyId:
+                # Clé ajoutée par une rotation que ce processus n'a pas encore relue
+                fresh = reload_keyring(keyring)
+                if fresh is None:
+                    raise
+                return fresh.decrypt(value).decode()
+        except InvalidToken:
+            # Une valeur chiffrée illisible (clé inconnue ou altérée) n'est jamais servie comme donnée
+            if Keyring.is_ciphertext(value):
+                raise
+            # Texte jamais chiffré : données antérieures au chiffrement ou saisie (to_python)
+            return bytes(value).decode() if isinstance(value, bytes) else value
+    
+    def ciphertext(self, value):
+        """Valeur déjà chiffrée, enregistrée telle quelle"""
+        value = BinaryCiphertext(value) if isinstance(value, bytes) else TextCiphertext(value)
+        value.field = self
+        return value
     
     def from_db_value(self, value, expression, connection):
-        """Déchiffre lors de la lecture depuis la DB"""
-        return self.decrypt_value(value)
+        """Valeur chiffrée, déchiffrée seulement au premier accès"""
+        if isinstance(value, memoryview):
+            value = value.tobytes()
+        if not value:
+            return '' if value == b'' else value
+        return self.ciphertext(value)
     
     def to_python(self, value):
         """Conversion Python"""
+        if isinstance(value, Ciphertext):
+            return value.decrypt()
         return self.decrypt_value(value)
     
+    def pre_save(self, model_instance, add):
+        # Sans passer par le descripteur : une valeur jamais lue reste chiffrée
+        return model_instance.__dict__[self.attname]
+    
     def get_prep_value(self, value):
         """Chiffre avant sauvegarde en DB"""
+        if isinstance(value, Ciphertext):
+            # Jamais lue, donc inchangée
+            return bytes(value) if isinstance(value, bytes) else str(value)
         return self.encrypt_value(value)
 
 
@@ -103,6 +225,152 @@ class EncryptedField(models.TextField):
 # GESTION DES PATIENTS
 # ============================================================================
 
+class NextPatientNumber(models.Func):
+    """Numéro patient suivant, attribué par la séquence du schéma du cabinet"""
+    function = 'patients_next_patient_number'
+    output_field = models.CharField()
+
+
+def _decrypting_iterable(iterable_class):
+    """Itérable de values()/values_list() qui déchiffre les colonnes chiffrées"""
+    
+    class DecryptingIterable(iterable_class):
+        def __iter__(self):
+            for row in super().__iter__():
+                if isinstance(row, dict):
+                    yield {key: decrypt_lazy(value) for key, value in row.items()}
+                elif isinstance(row, tuple):
+                    values = [decrypt_lazy(value) for value in row]
+                    yield row._make(values) if hasattr(row, '_make') else tuple(values)
+                else:
+                    yield decrypt_lazy(row)
+    
+    return DecryptingIterable
+
+
+def decrypt_instances(instances, keyring, executor=None, workers=1):
+    """
+    Déchiffre les champs chargés et pas encore lus d'instances, colonne par
+    colonne : chaque colonne est découpée en workers parts, déchiffrées par les
+    threads d'executor (cryptography libère le GIL pendant le déchiffrement).
+    """
+    if not instances:
+        return
+    tasks = []
+    for field in type(instances[0])._meta.concrete_fields:
+        if not isinstance(field, EncryptedField):
+            continue
+        pending = [
+            (instance, value) for instance in instances
+            if isinstance(value := instance.__dict__.get(field.attname), Ciphertext)
+        ]
+        if not pending:
+            continue
+        size = -(-len(pending) // workers)
+        for start in range(0, len(pending), size):
+            part = pending[start:start + size]
+            values = [value for _, value in part]
+            if executor is None:
+                tasks.append((field, part, field.decrypt_many(values, keyring)))
+            else:
+                tasks.append((field, part, executor.submit(field.decrypt_many, values, keyring)))
+    
+    for field, part, result in tasks:
+        plaintexts = result if executor is None else result.result()
+        for (instance, ciphertext), plaintext in zip(part, plaintexts):
+            store_plaintext(instance, field.attname, ciphertext, plaintext)
+
+
+# Début de numéro patient saisi dans la recherche ("P", "p0001", "P000123")
+PATIENT_NUMBER_QUERY_RE = re.compile(r'^[Pp]\d+$')
+
+
+class PatientQuerySet(models.QuerySet):
+    """Requêtes patients"""
+    
+    def values(self, *fields, **expressions):
+        clone = super().values(*fields, **expressions)
+        clone._iterable_class = _decrypting_iterable(clone._iterable_class)
+        return clone
+    
+    def values_list(self, *fields, flat=False, named=False):
+        clone = super().values_list(*fields, flat=flat, named=named)
+        clone._iterable_class = _decrypting_iterable(clone._iterable_class)
+        return clone
+    
+    def decrypted_iter(self, chunk=1000, workers=None):
+        """
+        Patients déjà déchiffrés, dans l'ordre du QuerySet, lus par curseur
+        serveur et déchiffrés en parallèle par paquets de chunk
+        (workers threads, par défaut PATIENT_DECRYPT_WORKERS ou un par cœur).
+        """
+        if workers is None:
+            workers = getattr(settings, 'PATIENT_DECRYPT_WORKERS', 0) or os.cpu_count() or 1
+        # Les threads n'héritent pas du contexte : clés du cabinet capturées ici
+        keyring = get_current_keyring()
+        executor = ThreadPoolExecutor(workers, thread_name_prefix='decrypt') if workers > 1 else None
+        try:
+            patients = []
+            for patient in self.iterator(chunk_size=chunk):
+                patients.append(patient)
+                if len(patients) >= chunk:
+                    self._decrypt_chunk(patients, keyring, executor, workers)
+                    yield from patients
+                    patients = []
+            if patients:
+                self._decrypt_chunk(patients, keyring, executor, workers)
+                yield from patients
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+    
+    @staticmethod
+    def _decrypt_chunk(patients, keyring, executor, workers):
+        start = perf_counter()
+        decrypt_instances(patients, keyring, executor, workers)
+        # Une mesure par paquet, depuis le thread de la requête
+        record('decrypt', perf_counter() - start)
+    
+    def search(self, query):
+        """Recherche textuelle via les index aveugles des champs chiffrés"""
+        words = query.split()
+        if not words:
+            return self
+        
+        condition = Q()
+        for word in words:
+            word_condition = Q(pk__in=[])  # aucun critère : le mot ne correspond à rien
+            # Numéro patient (index patient_number_pattern_idx) : préfixe ("P0001") ou numéro seul ("123")
+            if PATIENT_NUMBER_QUERY_RE.match(word):
+                word_condition |= Q(patient_number__startswith=word.upper())
+            elif word.isdigit():
+                word_condition |= Q(patient_number=f"P{int(word):06d}")
+            first_name_tokens = blind_index.name_query_tokens(word, 'first_name')
+            if first_name_tokens:
+                word_condition |= Q(first_name_bidx__contains=first_name_tokens)
+                word_condition |= Q(last_name_bidx__contains=blind_index.name_query_tokens(word, 'last_name'))
+            condition &= word_condition
+        
+        # Le téléphone et l'email ne correspondent qu'à la saisie complète
+        if len(blind_index.normalize_phone(query)) > blind_index.PHONE_MIN_DIGITS:
+            condition |= self.by_phone_condition(query)
+        if '@' in query:
+            condition |= Q(email_bidx=blind_index.email_token(query))
+        
+        return self.filter(condition)
+    
+    def by_phone_condition(self, number):
+        """Condition d'égalité sur le téléphone ou le mobile"""
+        token = blind_index.phone_token(number)
+        return Q(phone_bidx=token) | Q(mobile_bidx=token)
+    
+    def by_phone(self, number):
+        """Patients dont le téléphone ou le mobile correspond exactement"""
+        if not blind_index.normalize_phone(number):
+            return self.none()
+        return self.filter(self.by_phone_condition(number))
+
+
 class Patient(models.Model):
     """Modèle Patient avec données chiffrées"""
     GENDER_CHOICES = [
@@ -119,27 +387,27 @@ class Patient(models.Model):
     ]
     
     # Identité (données chiffrées)
-    first_name = EncryptedField(verbose_name="Prénom")
-    last_name = EncryptedField(verbose_name="Nom")
+    first_name = EncryptedField(algorithm='aes-gcm', verbose_name="Prénom")
+    last_name = EncryptedField(algorithm='aes-gcm', verbose_name="Nom")
     birth_date = models.DateField(verbose_name="Date de naissance")
     gender = models.CharField(max_length=1, choices=GENDER_CHOICES, verbose_name="Sexe")
     
     # Informations personnelles
-    social_security_number = EncryptedField(blank=True, verbose_name="Numéro de sécurité sociale")
+    social_security_number = EncryptedField(algorithm='aes-gcm', blank=True, verbose_name="Numéro de sécurité sociale")
     marital_status = models.CharField(max_length=20, choices=MARITAL_STATUS_CHOICES, blank=True, verbose_name="Situation familiale")
     profession = models.CharField(max_length=100, blank=True, verbose_name="Profession")
     
     # Contact (données chiffrées)
-    address = EncryptedField(blank=True, verbose_name="Adresse")
+    address = EncryptedField(algorithm='aes-gcm', blank=True, verbose_name="Adresse")
     postal_code = models.CharField(max_length=10, blank=True, verbose_name="Code postal")
     city = models.CharField(max_length=100, blank=True, verbose_name="Ville")
-    phone = EncryptedField(blank=True, verbose_name="Téléphone")
-    mobile = EncryptedField(blank=True, verbose_name="Mobile")
-    email = EncryptedField(blank=True, verbose_name="Email")
+    phone = EncryptedField(algorithm='aes-gcm', blank=True, verbose_name="Téléphone")
+    mobile = EncryptedField(algorithm='aes-gcm', blank=True, verbose_name="Mobile")
+    email = EncryptedField(algorithm='aes-gcm', blank=True, verbose_name="Email")
     
     # Contact d'urgence
-    emergency_contact_name = EncryptedField(blank=True, verbose_name="Contact d'urgence - Nom")
-    emergency_contact_phone = EncryptedField(blank=True, verbose_name="Contact d'urgence - Téléphone")
+    emergency_contact_name = EncryptedField(algorithm='aes-gcm', blank=True, verbose_name="Contact d'urgence - Nom")
+    emergency_contact_phone = EncryptedField(algorithm='aes-gcm', blank=True, verbose_name="Contact d'urgence - Téléphone")
     emergency_contact_relation = models.CharField(max_length=50, blank=True, verbose_name="Lien de parenté")
     
     # Informations médicales
@@ -150,7 +418,7 @@ class Patient(models.Model):
     
     # Mutuelle et assurance
     insurance_name = models.CharField(max_length=100, blank=True, verbose_name="Nom mutuelle")
-    insurance_number = EncryptedField(blank=True, verbose_name="Numéro adhérent")
+    insurance_number = EncryptedField(algorithm='aes-gcm', blank=True, verbose_name="Numéro adhérent")
     
     # Consentements RGPD
     rgpd_consent = models.BooleanField(default=False, verbose_name="Consentement RGPD")
@@ -158,36 +426,98 @@ class Patient(models.Model):
     marketing_consent = models.BooleanField(default=False, verbose_name="Consentement marketing")
     
     # Métadonnées
-    patient_number = models.CharField(max_length=20, unique=True, verbose_name="Numéro patient")
+    patient_number = models.CharField(max_length=20, unique=True, db_default=NextPatientNumber(), verbose_name="Numéro patient")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='created_patients')
+    updated_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='updated_patients')
     is_active = models.BooleanField(default=True, verbose_name="Actif")
     
+    # Index aveugles (jetons HMAC) pour la recherche sur les champs chiffrés
+    first_name_bidx = ArrayField(models.CharField(max_length=blind_index.TOKEN_LENGTH), default=list, blank=True, editable=False)
+    last_name_bidx = ArrayField(models.CharField(max_length=blind_index.TOKEN_LENGTH), default=list, blank=True, editable=False)
+    phone_bidx = models.CharField(max_length=blind_index.TOKEN_LENGTH, blank=True, db_index=True, editable=False)
+    mobile_bidx = models.CharField(max_length=blind_index.TOKEN_LENGTH, blank=True, db_index=True, editable=False)
+    email_bidx = models.CharField(max_length=blind_index.TOKEN_LENGTH, blank=True, db_index=True, editable=False)
+    
+    # Champs chiffrés alimentant les index aveugles
+    BLIND_INDEX_FIELDS = {
+        'first_name': 'first_name_bidx',
+        'last_name': 'last_name_bidx',
+        'phone': 'phone_bidx',
+        'mobile': 'mobile_bidx',
+        'email': 'email_bidx',
+    }
+    
+    # Champs techniques ignorés par le diff du journal d'audit
+    AUDIT_EXCLUDED_FIELDS = ('created_at', 'updated_at', 'updated_by', *BLIND_INDEX_FIELDS.values())
+    
+    objects = PatientQuerySet.as_manager()
+    
     class Meta:
         verbose_name = "Patient"
         verbose_name_plural = "Patients"
         ordering = ['last_name', 'first_name']
+        indexes = [
+            # Pagination par curseur sur (created_at, id)
+            models.Index(fields=['-created_at', '-id'], name='patient_created_id_idx'),
+            # Recherche par préfixe de numéro patient (LIKE 'P0001%')
+            models.Index(fields=['patient_number'], name='patient_number_pattern_idx', opclasses=['varchar_pattern_ops']),
+            GinIndex(fields=['first_name_bidx'], name='patient_first_name_bidx_gin'),
+            GinIndex(fields=['last_name_bidx'], name='patient_last_name_bidx_gin'),
+        ]
     
     def __str__(self):
         return f"{self.patient_number} - {self.last_name} {self.first_name}"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        # Conserver l'état chargé pour le diff d'audit (aucun SELECT supplémentaire)
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+    
     def save(self, *args, **kwargs):
-        # Générer un numéro patient si pas défini
+        # Numéro patient attribué par la base lors de l'insertion (séquence par cabinet)
         if not self.patient_number:
-            last_patient = Patient.objects.order_by('-id').first()
-            if last_patient:
-                last_number = int(last_patient.patient_number.replace('P', ''))
-                self.patient_number = f"P{last_number + 1:06d}"
-            else:
-                self.patient_number = "P000001"
+            self.patient_number = DatabaseDefault()
         
         # Enregistrer la date de consentement RGPD
         if self.rgpd_consent and not self.rgpd_consent_date:
             self.rgpd_consent_date = timezone.now()
         
+        # Mettre à jour les index aveugles des champs chiffrés sauvegardés
+        # (un champ jamais déchiffré ou non chargé n'a pas pu changer)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None:
+            indexed = [name for name in self.BLIND_INDEX_FIELDS if self._is_plaintext(name)]
+            if indexed:
+                self.update_blind_indexes(indexed)
+        else:
+            indexed = [name for name in update_fields if name in self.BLIND_INDEX_FIELDS and self._is_plaintext(name)]
+            if indexed:
+                self.update_blind_indexes(indexed)
+                kwargs['update_fields'] = list(update_fields) + [self.BLIND_INDEX_FIELDS[name] for name in indexed]
+        
         super().save(*args, **kwargs)
     
+    def _is_plaintext(self, name):
+        return name in self.__dict__ and not isinstance(self.__dict__[name], Ciphertext)
+    
+    def update_blind_indexes(self, fields=None):
+        """Recalcule les jetons de recherche à partir des valeurs en clair"""
+        fields = fields or self.BLIND_INDEX_FIELDS
+        if 'first_name' in fields:
+            self.first_name_bidx = blind_index.name_tokens(self.first_name, 'first_name')
+        if 'last_name' in fields:
+            self.last_name_bidx = blind_index.name_tokens(self.last_name, 'last_name')
+        if 'phone' in fields:
+            self.phone_bidx = blind_index.phone_token(self.phone)
+        if 'mobile' in fields:
+            self.mobile_bidx = blind_index.phone_token(self.mobile)
+        if 'email' in fields:
+            self.email_bidx = blind_index.email_token(self.email)
+    
     @property
     def age(self):
         """Calcule l'âge du patient"""
@@ -195,7 +525,54 @@ class Patient(models.Model):
         today = date.today()
         return today.year - self.birth_date.year - ((today.month, today.day) < (self.birth_date.month, self.birth_date.day))
     
+    @property
+    def audit_repr(self):
+        """Représentation sans donnée chiffrée, pour le journal d'audit"""
+        return f"Patient {self.patient_number}"
+    
     @property
     def full_name(self):
         """Nom complet du patient"""
         return f"{self.first_name} {self.last_name}"
+
+
+# ============================================================================
+# IMPORTS EN MASSE
+# ============================================================================
+
+class PatientImport(models.Model):
+    """
+    Import en masse lancé depuis l'API, exécuté en arrière-plan (patients.importer) ;
+    progression relevée à chaque paquet, consultable depuis n'importe quel processus.
+    """
+    STATUS_CHOICES = [
+        ('PENDING', 'En attente'),
+        ('RUNNING', 'En cours'),
+        ('DONE', 'Terminé'),
+        ('FAILED', 'Échec'),
+    ]
+    
+    FORMAT_CHOICES = [
+        ('csv', 'CSV'),
+        ('ndjson', 'NDJSON'),
+    ]
+    
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING', verbose_name="Statut")
+    file_format = models.CharField(max_length=10, choices=FORMAT_CHOICES, verbose_name="Format")
+    file_name = models.CharField(max_length=255, blank=True, verbose_name="Fichier")
+    processed = models.PositiveIntegerField(default=0, verbose_name="Lignes lues")
+    created = models.PositiveIntegerField(default=0, verbose_name="Patients créés")
+    error_count = models.PositiveIntegerField(default=0, verbose_name="Lignes rejetées")
+    errors = models.JSONField(default=list, blank=True, verbose_name="Erreurs")
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='patient_imports')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        verbose_name = "Import de patients"
+        verbose_name_plural = "Imports de patients"
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return f"Import {self.pk} ({self.get_status_display()})"
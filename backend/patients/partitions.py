@@ -0,0 +1,160 @@
+import datetime
+import re
+
+from django.db import connection as default_connection, transaction
+
+
+# ============================================================================
+# PARTITIONS MENSUELLES DU JOURNAL D'AUDIT
+# ============================================================================
+
+AUDIT_LOG_TABLE = 'patients_auditlog'
+
+_PARTITION_RE = re.compile(r'^patients_auditlog_y(\d{4})m(\d{2})$')
+
+
+def month_start(value):
+    """Premier jour du mois d'une date"""
+    return datetime.date(value.year, value.month, 1)
+
+
+def add_months(month, count):
+    """Premier jour du mois décalé de count mois"""
+    index = month.year * 12 + month.month - 1 + count
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    """Nom de la partition d'un mois : patients_auditlog_y2025m08"""
+    return f'{AUDIT_LOG_TABLE}_y{month.year:04d}m{month.month:02d}'
+
+
+def create_partition(month, parent=AUDIT_LOG_TABLE, connection=default_connection):
+    """
+    Crée (si besoin) la partition couvrant un mois, bornes en UTC. Les lignes
+    de ce mois déjà tombées dans la partition par défaut (création en retard)
+    y sont déplacées : partition par défaut détachée, lignes déplacées, puis
+    rattachée, dans une seule transaction.
+    """
+    qn = connection.ops.quote_name
+    start, end = month_start(month), add_months(month_start(month), 1)
+    name = partition_name(start)
+    bounds = f"FROM ('{start.isoformat()} 00:00:00+00') TO ('{end.isoformat()} 00:00:00+00')"
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        cursor.execute("SELECT to_regclass(%s) IS NOT NULL", [name])
+        if cursor.fetchone()[0]:
+            return
+
+        default = default_partition(parent, connection)
+        moved = default is not None and default_partition_rows(parent, connection, start, end)
+        if not moved:
+            cursor.execute(f"CREATE TABLE {qn(name)} PARTITION OF {qn(parent)} FOR VALUES {bounds}")
+            return
+
+        cursor.execute(f"ALTER TABLE {qn(parent)} DETACH PARTITION {qn(default)}")
+        cursor.execute(f"CREATE TABLE {qn(name)} PARTITION OF {qn(parent)} FOR VALUES {bounds}")
+        cursor.execute(
+            f"WITH moved AS (DELETE FROM {qn(default)} WHERE \"timestamp\" >= %s AND \"timestamp\" < %s RETURNING *) "
+            f"INSERT INTO {qn(name)} SELECT * FROM moved",
+            [f'{start.isoformat()} 00:00:00+00', f'{end.isoformat()} 00:00:00+00']
+        )
+        cursor.execute(f"ALTER TABLE {qn(parent)} ATTACH PARTITION {qn(default)} DEFAULT")
+
+
+def default_partition(parent=AUDIT_LOG_TABLE, connection=default_connection):
+    """Nom de la partition par défaut de la table (None si elle n'en a pas)"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partdefid "
+            "WHERE p.partrelid = %s::regclass",
+            [parent]
+        )
+        row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def default_partition_rows(parent=AUDIT_LOG_TABLE, connection=default_connection, start=None, end=None):
+    """
+    Nombre de lignes dans la partition par défaut (entre start et end si
+    donnés) : non nul, une partition mensuelle manquait au moment de l'écriture.
+    """
+    default = default_partition(parent, connection)
+    if default is None:
+        return 0
+    sql = f"SELECT count(*) FROM {connection.ops.quote_name(default)}"
+    params = []
+    if start is not None:
+        sql += ' WHERE "timestamp" >= %s AND "timestamp" < %s'
+        params = [f'{start.isoformat()} 00:00:00+00', f'{end.isoformat()} 00:00:00+00']
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchone()[0]
+
+
+def default_partition_months(parent=AUDIT_LOG_TABLE, connection=default_connection):
+    """Mois (UTC) des lignes tombées dans la partition par défaut, triés"""
+    default = default_partition(parent, connection)
+    if default is None:
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT DISTINCT date_trunc('month', \"timestamp\" AT TIME ZONE 'UTC')::date "
+            f"FROM {connection.ops.quote_name(default)} ORDER BY 1"
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def drain_default_partition(parent=AUDIT_LOG_TABLE, connection=default_connection):
+    """
+    Crée la partition de chaque mois présent dans la partition par défaut,
+    qui y déplace ses lignes : elles suivent ensuite la rétention et
+    l'archivage des partitions mensuelles au lieu d'y rester indéfiniment.
+    """
+    created = []
+    for month in default_partition_months(parent, connection):
+        create_partition(month, parent, connection)
+        created.append(partition_name(month))
+    return created
+
+
+def create_partitions(first_month, last_month, parent=AUDIT_LOG_TABLE, connection=default_connection):
+    """Crée les partitions de first_month à last_month inclus"""
+    month = month_start(first_month)
+    created = []
+    while month <= month_start(last_month):
+        create_partition(month, parent, connection)
+        created.append(partition_name(month))
+        month = add_months(month, 1)
+    return created
+
+
+def list_partitions(parent=AUDIT_LOG_TABLE, connection=default_connection):
+    """Partitions mensuelles attachées : [(premier jour du mois, nom)] triées"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = %s::regclass",
+            [parent]
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    partitions = []
+    for name in names:
+        match = _PARTITION_RE.match(name)
+        if match:
+            partitions.append((datetime.date(int(match[1]), int(match[2]), 1), name))
+    return sorted(partitions)
+
+
+def detach_partitions_before(month, drop=False, parent=AUDIT_LOG_TABLE, connection=default_connection):
+    """Détache (et supprime si drop) les partitions antérieures à un mois"""
+    qn = connection.ops.quote_name
+    detached = []
+    for partition_month, name in list_partitions(parent, connection):
+        if partition_month >= month_start(month):
+            continue
+        with connection.cursor() as cursor:
+            cursor.execute(f"ALTER TABLE {qn(parent)} DETACH PARTITION {qn(name)}")
+            if drop:
+                cursor.execute(f"DROP TABLE {qn(name)}")
+        detached.append(name)
+    return detached
@@ -1,11 +1,62 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
-from .models import Patient, AuditLog
+from django.core.exceptions import FieldDoesNotExist
+from core.profiling import ProfiledSerializerMixin
+from .models import Patient, AuditLog, PatientImport
 
 User = get_user_model()
 
 
-class PatientSerializer(serializers.ModelSerializer):
+class SparseFieldsMixin:
+    """
+    Restreint les champs sérialisés (fields=[...] / omit=[...]) et indique les
+    colonnes du modèle à charger pour eux (voir PatientViewSet.get_queryset).
+    Meta.field_dependencies : colonnes des champs calculés, ex. {'age': ['birth_date']}.
+    """
+    
+    def __init__(self, *args, fields=None, omit=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.sparse = fields is not None or bool(omit)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+        for name in omit or ():
+            self.fields.pop(name, None)
+    
+    def get_source_fields(self):
+        """Colonnes du modèle nécessaires aux champs retenus"""
+        model = self.Meta.model
+        dependencies = getattr(self.Meta, 'field_dependencies', {})
+        columns = set()
+        for name, field in self.fields.items():
+            if name in dependencies:
+                columns.update(dependencies[name])
+                continue
+            source = field.source.split('.')[0]
+            try:
+                model._meta.get_field(source)
+            except FieldDoesNotExist:
+                continue
+            columns.add(source)
+        return columns
+    
+    def get_related_fields(self):
+        """Relations lues par les champs retenus (created_by.username...), à joindre"""
+        model = self.Meta.model
+        related = set()
+        for field in self.fields.values():
+            if '.' not in field.source:
+                continue
+            try:
+                model_field = model._meta.get_field(field.source.split('.')[0])
+            except FieldDoesNotExist:
+                continue
+            if model_field.is_relation and not model_field.many_to_many:
+                related.add(model_field.name)
+        return sorted(related)
+
+
+class PatientSerializer(SparseFieldsMixin, ProfiledSerializerMixin, serializers.ModelSerializer):
     """Serializer pour le modèle Patient"""
     created_by_username = serializers.CharField(source='created_by.username', read_only=True)
     updated_by_username = serializers.CharField(source='updated_by.username', read_only=True)
@@ -26,8 +77,9 @@ class PatientSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = [
             'id', 'patient_number', 'created_at', 'updated_at',
-            'created_by', 'rgpd_consent_date', 'age'
+            'created_by', 'updated_by', 'rgpd_consent_date', 'age'
         ]
+        field_dependencies = {'age': ['birth_date']}
     
     def get_age(self, obj):
         """Calculer l'âge du patient"""
@@ -77,7 +129,7 @@ class PatientCreateSerializer(serializers.ModelSerializer):
         return value
 
 
-class PatientListSerializer(serializers.ModelSerializer):
+class PatientListSerializer(SparseFieldsMixin, ProfiledSerializerMixin, serializers.ModelSerializer):
     """Serializer pour la liste des patients (champs limités)"""
     age = serializers.SerializerMethodField()
     
@@ -87,13 +139,14 @@ class PatientListSerializer(serializers.ModelSerializer):
             'id', 'patient_number', 'first_name', 'last_name',
             'birth_date', 'age', 'phone', 'email', 'created_at'
         ]
+        field_dependencies = {'age': ['birth_date']}
     
     def get_age(self, obj):
         """Calculer l'âge du patient"""
         return obj.age
 
 
-class AuditLogSerializer(serializers.ModelSerializer):
+class AuditLogSerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
     """Serializer pour les logs d'audit"""
     user_username = serializers.CharField(source='user.username', read_only=True)
     
@@ -106,6 +159,18 @@ class AuditLogSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'timestamp']
 
 
+class PatientImportSerializer(serializers.ModelSerializer):
+    """Serializer pour le suivi d'un import en masse"""
+    
+    class Meta:
+        model = PatientImport
+        fields = [
+            'id', 'status', 'file_format', 'file_name', 'processed', 'created',
+            'error_count', 'errors', 'created_at', 'updated_at', 'finished_at'
+        ]
+        read_only_fields = fields
+
+
 class PatientSearchSerializer(serializers.Serializer):
     """Serializer pour la recherche de patients"""
     query = serializers.CharField(max_length=100, required=False)
@@ -0,0 +1,42 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django_tenants.utils import get_tenant_model
+
+from . import audit, caller_id
+from .encryption import new_wrapped_data_key
+from .models import Patient
+from .statistics import invalidate_statistics
+
+
+@receiver(pre_save, sender=get_tenant_model())
+def create_tenant_data_key(sender, instance, raw=False, **kwargs):
+    """Clé de données générée avec le cabinet (les cabinets existants l'obtiennent au premier usage)"""
+    if not raw and not instance.encrypted_data_key:
+        instance.encrypted_data_key = new_wrapped_data_key()
+
+
+@receiver(post_save, sender=Patient)
+@receiver(post_delete, sender=Patient)
+def invalidate_caller_id_cache(sender, instance, **kwargs):
+    """Un patient créé, modifié ou supprimé change les résultats par numéro"""
+    caller_id.invalidate_patient(instance)
+
+
+@receiver(post_save, sender=Patient)
+@receiver(post_delete, sender=Patient)
+def invalidate_patient_statistics(sender, instance, **kwargs):
+    """Les statistiques du cabinet sont recalculées à la prochaine consultation"""
+    invalidate_statistics()
+
+
+@receiver(post_save, sender=Patient)
+def audit_patient_save(sender, instance, created, raw=False, **kwargs):
+    """Journalise la création ou la modification d'un patient"""
+    if not raw:
+        audit.log_model_change(instance, created)
+
+
+@receiver(post_delete, sender=Patient)
+def audit_patient_delete(sender, instance, **kwargs):
+    """Journalise la suppression d'un patient"""
+    audit.log_action('DELETE', instance=instance)
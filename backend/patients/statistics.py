@@ -0,0 +1,78 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from core.routers import read_from_primary
+
+from .models import Patient
+
+
+# ============================================================================
+# STATISTIQUES PATIENTS
+# ============================================================================
+
+def _cache_key(schema_name, today):
+    """Clé de cache par cabinet et par jour (les tranches d'âge dépendent de la date)"""
+    return f'patients:statistics:{schema_name}:{today.isoformat()}'
+
+
+def compute_statistics(queryset, now=None):
+    """Calcule toutes les statistiques en une seule requête d'agrégation"""
+    now = now or timezone.now()
+    today = now.date()
+    this_month = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    age_18 = today - timedelta(days=18*365.25)
+    age_35 = today - timedelta(days=35*365.25)
+    age_55 = today - timedelta(days=55*365.25)
+
+    counts = queryset.order_by().aggregate(
+        total=Count('pk'),
+        male=Count('pk', filter=Q(gender='M')),
+        female=Count('pk', filter=Q(gender='F')),
+        new_this_month=Count('pk', filter=Q(created_at__gte=this_month)),
+        age_0_18=Count('pk', filter=Q(birth_date__gte=age_18)),
+        age_19_35=Count('pk', filter=Q(birth_date__gte=age_35, birth_date__lt=age_18)),
+        age_36_55=Count('pk', filter=Q(birth_date__gte=age_55, birth_date__lt=age_35)),
+        age_56_plus=Count('pk', filter=Q(birth_date__lt=age_55)),
+    )
+
+    return {
+        'total_patients': counts['total'],
+        'gender_distribution': {
+            'male': counts['male'],
+            'female': counts['female']
+        },
+        'new_this_month': counts['new_this_month'],
+        'age_distribution': {
+            '0-18': counts['age_0_18'],
+            '19-35': counts['age_19_35'],
+            '36-55': counts['age_36_55'],
+            '56+': counts['age_56_plus'],
+        }
+    }
+
+
+def get_statistics():
+    """Statistiques du cabinet courant, servies depuis le cache tant qu'aucun patient ne change"""
+    now = timezone.now()
+    key = _cache_key(connection.schema_name, now.date())
+    statistics = cache.get(key)
+    if statistics is None:
+        with read_from_primary():
+            statistics = compute_statistics(Patient.objects.all(), now)
+        cache.set(key, statistics, getattr(settings, 'PATIENT_STATISTICS_CACHE_TIMEOUT', 3600))
+    return statistics
+
+
+def invalidate_statistics():
+    """
+    Invalide les statistiques du cabinet courant (à appeler après un bulk_create/update),
+    une fois la transaction validée : un autre processus ne peut plus remettre
+    en cache des chiffres lus avant la modification.
+    """
+    key = _cache_key(connection.schema_name, timezone.now().date())
+    transaction.on_commit(lambda: cache.delete(key))
@@ -1,3 +1,1513 @@
-from django.test import TestCase
+import base64
+import csv
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from unittest import mock
 
-# Create your tests here.
+from cryptography.fernet import Fernet, InvalidToken
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import OperationalError, connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django_tenants.test.cases import TenantTestCase
+from rest_framework.test import APIClient
+
+from core.pagination import ArchivedQuerySet, approximate_count
+from core.routers import use_replica
+
+from . import audit, blind_index, caller_id, partitions
+from .archive import AuditArchive, audit_archive
+from .encryption import (
+    TENANT_KEY_ID, KeyProvider, Keyring, LocalKMS, _last_keyring, _tenant_keyrings, format_data_keys,
+    get_current_keyring, get_key_provider, get_tenant_keyring, parse_data_keys, rewrap_data_keys, rotate_data_key,
+    using_keyring
+)
+from .exporter import PatientExporter
+from .importer import PatientImporter, iter_rows
+from .key_rotation import KeyRotation, reencrypt_rows
+from .models import AuditLog, Ciphertext, Patient
+from .statistics import get_statistics
+
+User = get_user_model()
+
+
+class PatientTestCase(TenantTestCase):
+    """Cabinet de test, journal d'audit écrit immédiatement"""
+    
+    def setUp(self):
+        super().setUp()
+        # TenantTestCase ignore les décorateurs de classe
+        audit_settings = override_settings(AUDIT_LOG_ASYNC=False)
+        audit_settings.enable()
+        self.addCleanup(audit_settings.disable)
+
+
+# ============================================================================
+# NOMBRE DE REQUÊTES DES ENDPOINTS PATIENTS
+# ============================================================================
+
+class PatientQueryCountTests(PatientTestCase):
+    """Le nombre de requêtes ne dépend pas de la taille de la page (pas de N+1)"""
+    
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='dentiste', password='x', role='DENTIST')
+        self.client = APIClient(HTTP_HOST=self.domain.domain)
+        self.client.force_authenticate(self.user)
+        # Cabinet résolu puis mis en cache par le middleware (hors mesures)
+        self.client.get('/api/patients/')
+    
+    def create_patients(self, count):
+        for i in range(count):
+            Patient.objects.create(
+                first_name=f'Prénom{i}', last_name='Martin', birth_date=date(1990, 1, 1),
+                gender='F', rgpd_consent=True, created_by=self.user, updated_by=self.user
+            )
+    
+    def count_queries(self, method, url, data=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(url, data, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        return len(queries)
+    
+    def assertConstantQueries(self, method, url, data=None):
+        self.create_patients(2)
+        small = self.count_queries(method, url, data)
+        self.create_patients(10)
+        large = self.count_queries(method, url, data)
+        self.assertEqual(small, large)
+    
+    def test_list(self):
+        self.assertConstantQueries('get', '/api/patients/')
+    
+    def test_search(self):
+        self.assertConstantQueries('post', '/api/patients/search/', {'query': 'Martin'})
+    
+    def test_retrieve(self):
+        self.create_patients(1)
+        patient = Patient.objects.get()
+        queries = self.count_queries('get', f'/api/patients/{patient.pk}/')
+        # Une seule lecture du patient, jointe à created_by et updated_by
+        patient_queries = queries - self.count_queries('get', f'/api/patients/{patient.pk}/?fields=id')
+        self.assertEqual(patient_queries, 0)
+    
+    def test_updated_by(self):
+        response = self.client.post('/api/patients/', {
+            'first_name': 'Marie', 'last_name': 'Curie', 'birth_date': '1990-01-01',
+            'gender': 'F', 'rgpd_consent': True,
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        patient = Patient.objects.get()
+        self.assertEqual(patient.updated_by, self.user)
+        
+        response = self.client.get(f'/api/patients/{patient.pk}/')
+        self.assertEqual(response.data['updated_by_username'], 'dentiste')
+
+
+# ============================================================================
+# PAGINATION PAR CURSEUR DE LA LISTE DES PATIENTS
+# ============================================================================
+
+class PatientCursorPaginationTests(PatientTestCase):
+    """?cursor= sur (created_at, id) : pages stables, lien précédent, comptages optionnels"""
+    
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='dentiste', password='x', role='DENTIST')
+        self.client = APIClient(HTTP_HOST=self.domain.domain)
+        self.client.force_authenticate(self.user)
+        for i in range(25):
+            self.create_patient(f'Prénom{i}')
+        self.ids = list(Patient.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+    
+    def create_patient(self, first_name):
+        return Patient.objects.create(first_name=first_name, last_name='Martin', birth_date=date(1990, 1, 1), gender='F')
+    
+    def get_page(self, url, data=None):
+        response = self.client.get(url, data)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.data
+    
+    def page_ids(self, page):
+        return [patient['id'] for patient in page['results']]
+    
+    def all_ids(self):
+        ids, url = [], '/api/patients/?cursor='
+        while url:
+            page = self.get_page(url)
+            ids += self.page_ids(page)
+            url = page['next']
+        return ids
+    
+    def test_stable_when_rows_inserted_between_pages(self):
+        first = self.get_page('/api/patients/', {'cursor': ''})
+        self.assertEqual(self.page_ids(first), self.ids[:20])
+        self.assertIsNone(first['previous'])
+        self.assertNotIn('count', first)
+        
+        self.create_patient('Nouveau')
+        second = self.get_page(first['next'])
+        self.assertEqual(self.page_ids(second), self.ids[20:])
+        self.assertIsNone(second['next'])
+    
+    def test_previous_link(self):
+        first = self.get_page('/api/patients/', {'cursor': ''})
+        second = self.get_page(first['next'])
+        previous = self.get_page(second['previous'])
+        self.assertEqual(self.page_ids(previous), self.ids[:20])
+        self.assertIsNone(previous['previous'])
+        self.assertEqual(self.page_ids(self.get_page(previous['next'])), self.ids[20:])
+    
+    def test_invalid_cursor(self):
+        def encode(payload):
+            return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+        
+        for cursor in ['pas-un-curseur', encode(['2024-01-01T00:00:00+00:00', 1]),
+                       encode([['hier', 1], 0]), encode([['2024-01-01T00:00:00+00:00', 1, 2], 0])]:
+            response = self.client.get('/api/patients/', {'cursor': cursor})
+            self.assertEqual(response.status_code, 404, cursor)
+            self.assertEqual(str(response.data['detail']), 'Curseur invalide.')
+    
+    def test_ties_broken_by_id(self):
+        Patient.objects.update(created_at=datetime(2024, 1, 1, tzinfo=dt_timezone.utc))
+        self.assertEqual(self.all_ids(), sorted(self.ids, reverse=True))
+    
+    def test_counts(self):
+        self.assertEqual(self.get_page('/api/patients/', {'cursor': '', 'count': 'exact'})['count'], 25)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE patients_patient')
+        self.assertEqual(self.get_page('/api/patients/', {'cursor': '', 'count': 'approx'})['count'], 25)
+        filtered = self.get_page('/api/patients/', {'cursor': '', 'count': 'exact', 'gender': 'M'})
+        self.assertEqual((filtered['count'], filtered['results']), (0, []))
+
+
+# ============================================================================
+# RECHERCHE PAR INDEX AVEUGLES
+# ============================================================================
+
+class PatientSearchTests(PatientTestCase):
+    """Recherche sur les champs chiffrés, mot par mot, et par numéro patient"""
+    
+    def setUp(self):
+        super().setUp()
+        self.jean_pierre = Patient.objects.create(
+            first_name='Jean-Pierre', last_name='Dupont', birth_date=date(1970, 1, 1), gender='M'
+        )
+        self.obrien = Patient.objects.create(
+            first_name='Seán', last_name="O'Brien", birth_date=date(1980, 1, 1), gender='M'
+        )
+    
+    def search(self, query):
+        return set(Patient.objects.search(query))
+    
+    def test_compound_names(self):
+        self.assertEqual(self.search('Jean-Pierre'), {self.jean_pierre})
+        self.assertEqual(self.search('jean pierre dupont'), {self.jean_pierre})
+        self.assertEqual(self.search('Pierre'), {self.jean_pierre})
+        self.assertEqual(self.search("O'Brien"), {self.obrien})
+        self.assertEqual(self.search('sean obrien'), set())
+    
+    def test_prefixes_and_accents(self):
+        self.assertEqual(self.search('dup'), {self.jean_pierre})
+        self.assertEqual(self.search('SEAN bri'), {self.obrien})
+        self.assertEqual(self.search('Dupond'), set())
+    
+    def test_patient_number(self):
+        number = self.obrien.patient_number
+        self.assertEqual(self.search(number), {self.obrien})
+        self.assertEqual(self.search(number.lower()), {self.obrien})
+        self.assertEqual(self.search(str(int(number[1:]))), {self.obrien})
+    
+    def test_name_words_skip_patient_number(self):
+        where = str(Patient.objects.search('Dupont').query).split(' WHERE ')[1]
+        self.assertNotIn('patient_number', where)
+
+
+# ============================================================================
+# IDENTIFICATION DE L'APPELANT
+# ============================================================================
+
+class CallerIdTests(PatientTestCase):
+    """Normalisation des numéros et lecture journalisée de by-phone"""
+    
+    def setUp(self):
+        super().setUp()
+        caller_id.clear()
+        self.addCleanup(caller_id.clear)
+        self.user = User.objects.create_user(username='secretaire', password='x', role='SECRETARY')
+        self.client = APIClient(HTTP_HOST=self.domain.domain)
+        self.client.force_authenticate(self.user)
+        self.patient = Patient.objects.create(
+            first_name='Marie', last_name='Curie', birth_date=date(1990, 1, 1), gender='F',
+            mobile='06 12 34 56 78'
+        )
+    
+    def test_normalize_phone(self):
+        for value in ['06 12 34 56 78', '0612345678', '612345678', '+33 6 12 34 56 78', '0033612345678']:
+            self.assertEqual(blind_index.normalize_phone(value), '+33612345678', value)
+        self.assertEqual(blind_index.normalize_phone('+61 2 1234 5678'), '+61212345678')
+        self.assertEqual(blind_index.normalize_phone('abc'), '')
+    
+    def test_lookup_without_leading_zero(self):
+        response = self.client.get('/api/patients/by-phone/', {'n': '612345678'})
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual([patient['id'] for patient in response.data['patients']], [self.patient.pk])
+    
+    def test_lookup_is_audited(self):
+        for _ in range(2):  # le second appel est servi par le cache
+            response = self.client.get('/api/patients/by-phone/', {'n': '06 12 34 56 78'})
+            self.assertEqual(response.status_code, 200, response.content)
+        reads = AuditLog.objects.filter(action='READ', model_name='Patient', object_id=str(self.patient.pk))
+        self.assertEqual(reads.count(), 2)
+        self.assertEqual(reads.first().user, self.user)
+    
+    def test_cache_filled_from_primary(self):
+        token = use_replica.set(True)
+        self.addCleanup(use_replica.reset, token)
+        by_phone = Patient.objects.by_phone
+        with mock.patch.object(Patient.objects, 'by_phone', wraps=by_phone) as lookup:
+            lookup.side_effect = lambda number: self.assertFalse(use_replica.get()) or by_phone(number)
+            patients = caller_id.lookup('0612345678')
+        lookup.assert_called_once()
+        self.assertEqual([patient['id'] for patient in patients], [self.patient.pk])
+    
+    def test_invalidated_in_other_processes(self):
+        self.assertEqual(len(caller_id.lookup('0612345678')), 1)
+        # Le cache local d'un autre processus n'est pas touché par la suppression
+        with mock.patch.object(caller_id._cache, 'delete_where'):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.patient.delete()
+        self.assertEqual(caller_id.lookup('0612345678'), [])
+    
+    def test_shared_version_bumped_on_commit(self):
+        key = caller_id._version_key(connection.schema_name)
+        version = caches['default'].get(key, 0)
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.patient.save()
+        self.assertEqual(caches['default'].get(key, 0), version)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(caches['default'].get(key), version + 1)
+
+
+# ============================================================================
+# STATISTIQUES EN CACHE
+# ============================================================================
+
+class PatientStatisticsTests(PatientTestCase):
+    """Statistiques en cache partagé, invalidées à la validation des écritures"""
+    
+    def create_patient(self):
+        return Patient.objects.create(first_name='Marie', last_name='Curie', birth_date=date(1990, 1, 1), gender='F')
+    
+    def test_cache_is_shared_between_processes(self):
+        self.assertNotIsInstance(caches['default'], LocMemCache)
+    
+    def test_invalidated_on_commit(self):
+        self.assertEqual(get_statistics()['total_patients'], 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_patient()
+            # Transaction non validée : les autres processus liraient encore 0
+            self.assertEqual(get_statistics()['total_patients'], 0)
+        self.assertEqual(get_statistics()['total_patients'], 1)
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            Patient.objects.all().delete()
+        self.assertEqual(get_statistics()['total_patients'], 0)
+    
+    def test_cache_filled_from_primary(self):
+        token = use_replica.set(True)
+        self.addCleanup(use_replica.reset, token)
+        with mock.patch('patients.statistics.compute_statistics', side_effect=lambda *args: use_replica.get()):
+            self.assertIs(get_statistics(), False)
+
+
+# ============================================================================
+# ÉCRITURE DIFFÉRÉE DU JOURNAL D'AUDIT
+# ============================================================================
+
+class AuditWriterTests(PatientTestCase):
+    """COPY des logs en attente ; seules les entrées rejetées par la base sont écartées"""
+    
+    def setUp(self):
+        super().setUp()
+        async_settings = override_settings(AUDIT_LOG_ASYNC=True)
+        async_settings.enable()
+        self.addCleanup(async_settings.disable)
+        self.writer = audit.AuditWriter(autostart=False)
+    
+    def entry(self, object_id, **values):
+        return {
+            'action': 'READ', 'model_name': 'Patient', 'object_id': object_id,
+            'object_repr': f'Patient {object_id}', 'timestamp': datetime(2024, 1, 1, tzinfo=dt_timezone.utc),
+            **values,
+        }
+    
+    def written_ids(self):
+        return list(AuditLog.objects.order_by('id').values_list('object_id', flat=True))
+    
+    def test_write_entries_values(self):
+        audit.write_entries([
+            self.entry('1', object_repr='Curie, "Marie"\nligne 2', user_agent='', ip_address=None,
+                       changes={'notes': {'old': 'a,"b"', 'new': None}, 'vide': ''}),
+            self.entry('2', object_repr=r'\N', user_agent='Mozilla/5.0 (X11, "Linux")',
+                       ip_address='10.0.0.1', changes=None),
+        ])
+        first, second = AuditLog.objects.order_by('object_id')
+        self.assertEqual(first.object_repr, 'Curie, "Marie"\nligne 2')
+        self.assertEqual(first.user_agent, '')
+        self.assertIsNone(first.ip_address)
+        self.assertEqual(first.changes, {'notes': {'old': 'a,"b"', 'new': None}, 'vide': ''})
+        self.assertEqual(first.timestamp, datetime(2024, 1, 1, tzinfo=dt_timezone.utc))
+        self.assertEqual(second.object_repr, r'\N')
+        self.assertEqual(second.user_agent, 'Mozilla/5.0 (X11, "Linux")')
+        self.assertEqual(second.ip_address, '10.0.0.1')
+        self.assertIsNone(second.changes)
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT changes IS NULL FROM patients_auditlog WHERE object_id = %s', ['2'])
+            self.assertIs(cursor.fetchone()[0], True)
+    
+    def test_flush_drops_only_rejected_entries(self):
+        for i in range(7):
+            self.writer.record(self.entry(str(i), object_repr='nul \x00' if i in (2, 5) else f'Patient {i}'))
+        with self.assertLogs('patients.audit', 'ERROR') as logs:
+            self.writer.flush()
+        self.assertEqual(len(logs.records), 2)
+        self.assertEqual(self.written_ids(), ['0', '1', '3', '4', '6'])
+        self.assertEqual(self.writer.pending(), 0)
+        
+        self.writer.record(self.entry('7'))
+        self.writer.flush()
+        self.assertEqual(self.written_ids()[-1], '7')
+    
+    def test_requeued_when_database_unreachable(self):
+        for i in range(3):
+            self.writer.record(self.entry(str(i)))
+        with mock.patch('patients.audit.write_entries', side_effect=OperationalError('connexion perdue')), \
+                self.assertLogs('patients.audit', 'ERROR'):
+            self.writer.flush()
+        self.assertEqual(self.writer.pending(), 3)
+        self.assertEqual(self.written_ids(), [])
+        
+        self.writer.record(self.entry('3'))
+        self.writer.flush()
+        self.assertEqual(self.written_ids(), ['0', '1', '2', '3'])
+    
+    def test_unwritten_part_requeued_once(self):
+        write_entries = audit.write_entries
+        
+        def unreachable_after_first_batch(batch):
+            if any(entry['object_id'] == '3' for entry in batch) and len(batch) < 4:
+                raise OperationalError('connexion perdue')
+            write_entries(batch)
+        
+        for i in range(4):
+            self.writer.record(self.entry(str(i), object_repr='nul \x00' if i == 0 else f'Patient {i}'))
+        with mock.patch('patients.audit.write_entries', side_effect=unreachable_after_first_batch), \
+                self.assertLogs('patients.audit', 'ERROR'):
+            self.writer.flush()
+        # 0 écarté, 1 écrit, 2 et 3 remis en attente sans doublon
+        self.assertEqual(self.written_ids(), ['1'])
+        self.assertEqual(self.writer.pending(), 2)
+        self.writer.flush()
+        self.assertEqual(self.written_ids(), ['1', '2', '3'])
+    
+    def test_requeue_bounded(self):
+        limit = override_settings(AUDIT_LOG_MAX_PENDING=2)
+        limit.enable()
+        self.addCleanup(limit.disable)
+        for i in range(3):
+            self.writer.record(self.entry(str(i)))
+        with mock.patch('patients.audit.write_entries', side_effect=OperationalError('connexion perdue')), \
+                self.assertLogs('patients.audit', 'ERROR'):
+            self.writer.flush()
+        self.writer.flush()
+        self.assertEqual(self.written_ids(), ['1', '2'])
+
+
+# ============================================================================
+# PARTITIONS DU JOURNAL D'AUDIT
+# ============================================================================
+
+class AuditPartitionTests(PatientTestCase):
+    """Partition mensuelle créée après que des entrées sont tombées dans la partition par défaut"""
+    
+    def log_at(self, moment):
+        entry = AuditLog.objects.create(action='READ', model_name='Patient', object_id='1', object_repr='Patient')
+        AuditLog.objects.filter(pk=entry.pk).update(timestamp=moment)
+        return entry.pk
+    
+    def test_late_partition_takes_default_rows(self):
+        month = date(2100, 1, 1)
+        in_month = self.log_at(datetime(2100, 1, 15, tzinfo=dt_timezone.utc))
+        next_month = self.log_at(datetime(2100, 2, 1, tzinfo=dt_timezone.utc))
+        self.assertEqual(partitions.default_partition_rows(), 2)
+        
+        partitions.create_partition(month)
+        
+        self.assertIn((month, 'patients_auditlog_y2100m01'), partitions.list_partitions())
+        self.assertEqual(partitions.default_partition_rows(), 1)
+        self.assertEqual(set(AuditLog.objects.filter(timestamp__year=2100).values_list('pk', flat=True)),
+                         {in_month, next_month})
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT id FROM patients_auditlog_y2100m01')
+            self.assertEqual([row[0] for row in cursor.fetchall()], [in_month])
+        
+        # Déjà présente : sans effet
+        partitions.create_partition(month)
+        self.assertEqual(partitions.default_partition_rows(), 1)
+    
+    def test_maintenance_drains_default_partition(self):
+        old = self.log_at(datetime(2001, 3, 15, tzinfo=dt_timezone.utc))
+        future = self.log_at(datetime(2100, 6, 10, tzinfo=dt_timezone.utc))
+        self.assertEqual(partitions.default_partition_rows(), 2)
+        
+        call_command('manage_audit_partitions', schema=connection.schema_name, retain_months=12,
+                     stdout=io.StringIO())
+        
+        self.assertEqual(partitions.default_partition_rows(), 0)
+        # Partition du mois hors rétention détachée avec sa ligne
+        self.assertFalse(AuditLog.objects.filter(pk=old).exists())
+        self.assertNotIn('patients_auditlog_y2001m03', [name for _, name in partitions.list_partitions()])
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT id FROM patients_auditlog_y2001m03')
+            self.assertEqual([row[0] for row in cursor.fetchall()], [old])
+            cursor.execute('SELECT id FROM patients_auditlog_y2100m06')
+            self.assertEqual([row[0] for row in cursor.fetchall()], [future])
+    
+    def test_approximate_count_sums_partitions(self):
+        for moment in [datetime(2100, 1, 15, tzinfo=dt_timezone.utc), *[datetime.now(dt_timezone.utc)] * 2]:
+            self.log_at(moment)
+        partitions.create_partition(date(2100, 1, 1))
+        # Comme l'autovacuum : partitions analysées, jamais la table parente
+        with connection.cursor() as cursor:
+            for _, name in partitions.list_partitions():
+                cursor.execute(f'ANALYZE {name}')
+            cursor.execute(f'ANALYZE {partitions.default_partition()}')
+        self.assertEqual(approximate_count(AuditLog.objects.all()), AuditLog.objects.count())
+    
+    def test_migration_restores_constraints(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT conname FROM pg_constraint WHERE conrelid = 'patients_auditlog'::regclass AND contype = 'f'"
+            )
+            self.assertEqual([row[0] for row in cursor.fetchall()],
+                             ['patients_auditlog_user_id_e20accd3_fk_core_customuser_id'])
+            cursor.execute("SELECT indexname FROM pg_indexes WHERE tablename = 'patients_auditlog' AND schemaname = %s",
+                           [connection.schema_name])
+            self.assertTrue({'patients_auditlog_user_id_e20accd3', 'auditlog_timestamp_id_idx'}
+                            <= {row[0] for row in cursor.fetchall()})
+
+
+# ============================================================================
+# ARCHIVES DU JOURNAL D'AUDIT
+# ============================================================================
+
+def archived_entry(entry_id, moment, object_id='1', user=None):
+    return {
+        'id': entry_id, 'user': user, 'user_username': None, 'action': 'READ',
+        'model_name': 'Patient', 'object_id': object_id, 'object_repr': 'Patient',
+        'changes': None, 'timestamp': moment.isoformat().replace('+00:00', 'Z'),
+        'ip_address': None, 'user_agent': '',
+    }
+
+
+class AuditArchiveTests(PatientTestCase):
+    """Segments d'archive : index par objet et utilisateur, réécrit à chaque ajout"""
+    
+    def setUp(self):
+        super().setUp()
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.archive = AuditArchive(self.root)
+        self.archive.block_size = 2
+    
+    def test_lookup_across_appends(self):
+        month = date(2020, 1, 1)
+        start = datetime(2020, 1, 1, tzinfo=dt_timezone.utc)
+        self.archive.append('cab', month, [
+            archived_entry(1, start, '1', user=7), archived_entry(2, start + timedelta(hours=1), '2'),
+            archived_entry(3, start + timedelta(hours=2), '1'),
+        ])
+        self.assertEqual([r['id'] for r in self.archive.lookup('cab', 'Patient', '1')], [3, 1])
+        
+        # Second ajout : index remplacé, relu malgré le cache ; doublon d'une reprise ignoré
+        self.archive.append('cab', month, [archived_entry(4, start + timedelta(hours=3), '1'),
+                                           archived_entry(3, start + timedelta(hours=2), '1')])
+        self.assertEqual([r['id'] for r in self.archive.lookup('cab', 'Patient', '1')], [4, 3, 1])
+        self.assertEqual([r['id'] for r in self.archive.lookup('cab', user_id=7)], [1])
+        self.assertEqual(self.archive.lookup('cab', 'Patient', '9'), [])
+        self.assertEqual(self.archive.lookup('autre', 'Patient', '1'), [])
+    
+    def append_entries(self, month, ids):
+        start = datetime(month.year, month.month, 1, tzinfo=dt_timezone.utc)
+        return self.archive.append('cab', month, [
+            archived_entry(entry_id, start + timedelta(minutes=entry_id), str(entry_id % 2), user=entry_id % 3 or None)
+            for entry_id in ids
+        ])
+    
+    def test_count_without_decompression(self):
+        self.assertEqual(self.append_entries(date(2020, 1, 1), range(1, 8)), 7)
+        self.assertEqual(self.append_entries(date(2020, 2, 1), range(8, 11)), 3)
+        # Reprise après interruption : lignes déjà archivées écartées
+        self.assertEqual(self.append_entries(date(2020, 2, 1), range(9, 13)), 2)
+        with mock.patch('patients.archive.zlib.decompress', side_effect=AssertionError('décompression')):
+            self.assertEqual(self.archive.count('cab', 'Patient', '1'), 6)
+            self.assertEqual(self.archive.count('cab', 'Patient', '0'), 6)
+            self.assertEqual(self.archive.count('cab', user_id=1), 4)
+            self.assertEqual(self.archive.count('cab', 'Patient', '9'), 0)
+            self.assertEqual(self.archive.count('autre', 'Patient', '1'), 0)
+        self.assertEqual(len(self.archive.lookup('cab', 'Patient', '1')), 6)
+    
+    def test_count_with_index_written_before_counts(self):
+        month = date(2020, 1, 1)
+        self.append_entries(month, [1, 2, 3, 3, 5])  # doublon écrit avant la déduplication
+        _, index_path = self.archive.segment_paths('cab', month)
+        with open(index_path) as f:
+            index = json.load(f)
+        del index['counts'], index['max_id']
+        with open(index_path, 'w') as f:
+            json.dump(index, f)
+        self.assertEqual(self.archive.count('cab', 'Patient', '1'), 3)
+        
+        # Comptages complétés au prochain ajout
+        self.append_entries(month, [5, 7])
+        with mock.patch('patients.archive.zlib.decompress', side_effect=AssertionError('décompression')):
+            self.assertEqual(self.archive.count('cab', 'Patient', '1'), 4)
+
+
+class PatientAuditLogTests(PatientTestCase):
+    """Historique d'un patient : logs en base paginés, puis archives"""
+    
+    def setUp(self):
+        super().setUp()
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        archive_settings = override_settings(AUDIT_ARCHIVE_DIR=root)
+        archive_settings.enable()
+        self.addCleanup(archive_settings.disable)
+        
+        self.user = User.objects.create_user(username='dentiste', password='x', role='DENTIST')
+        self.client = APIClient(HTTP_HOST=self.domain.domain)
+        self.client.force_authenticate(self.user)
+        self.patient = Patient.objects.create(first_name='Marie', last_name='Curie', birth_date=date(1990, 1, 1), gender='F')
+        for _ in range(4):
+            audit.log_action('READ', instance=self.patient, user=self.user)
+        self.hot_ids = list(AuditLog.objects.filter(object_id=str(self.patient.pk))
+                            .order_by('-timestamp', '-id').values_list('id', flat=True))
+        start = datetime(2020, 1, 1, tzinfo=dt_timezone.utc)
+        audit_archive.append(connection.schema_name, date(2020, 1, 1), [
+            archived_entry(100000 + i, start + timedelta(minutes=i), str(self.patient.pk)) for i in range(25)
+        ])
+        self.archived_ids = [100000 + i for i in reversed(range(25))]
+        self.url = f'/api/patients/{self.patient.pk}/audit_log/'
+    
+    def test_page_numbers(self):
+        first = self.client.get(self.url).data
+        self.assertEqual(first['count'], 30)
+        self.assertEqual([entry['id'] for entry in first['results']], self.hot_ids + self.archived_ids[:15])
+        second = self.client.get(self.url, {'page': 2}).data
+        self.assertEqual([entry['id'] for entry in second['results']], self.archived_ids[15:])
+        self.assertEqual(set(second['results'][0]), set(first['results'][0]))
+    
+    def test_cursor_pages_forward_and_back(self):
+        ids, pages, url = [], [], f'{self.url}?cursor='
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, response.content)
+            self.assertNotIn('count', response.data)
+            pages.append([entry['id'] for entry in response.data['results']])
+            url = response.data['next']
+        self.assertEqual([entry_id for page in pages for entry_id in page], self.hot_ids + self.archived_ids)
+        self.assertEqual([len(page) for page in pages], [20, 10])
+        
+        previous = self.client.get(response.data['previous']).data
+        self.assertEqual([entry['id'] for entry in previous['results']], pages[0])
+    
+    def test_archive_counted_without_being_read(self):
+        logs = AuditLog.objects.filter(object_id=str(self.patient.pk)).order_by('-timestamp', '-id')
+        history = ArchivedQuerySet(logs, mock.Mock(side_effect=AssertionError('archives lues')), lambda: 25)
+        self.assertEqual(history.count(), 30)
+        self.assertEqual([log.id for log in history[0:5]], self.hot_ids)
+        with mock.patch.object(audit_archive, 'lookup', wraps=audit_archive.lookup) as lookup:
+            response = self.client.get(self.url, {'cursor': '', 'count': 'exact'})
+        self.assertEqual(response.data['count'], 30)
+        lookup.assert_called_once()  # première page complétée par les archives, comptage par l'index
+    
+    def test_archive_read_only_past_database_rows(self):
+        loads = []
+        logs = AuditLog.objects.filter(object_id=str(self.patient.pk)).order_by('-timestamp', '-id')
+        history = ArchivedQuerySet(logs, lambda: loads.append(1) or audit_archive.lookup(
+            connection.schema_name, 'Patient', str(self.patient.pk)))
+        self.assertEqual([log.id for log in history[0:5]], self.hot_ids)
+        self.assertEqual(loads, [])
+        self.assertEqual([entry['id'] for entry in history[5:7]], self.archived_ids[:2])
+        self.assertEqual(loads, [1])
+
+
+class PatientAuditDiffTests(PatientTestCase):
+    """Diff champ par champ des créations et modifications, sans valeur chiffrée en clair"""
+    
+    def setUp(self):
+        super().setUp()
+        self.patient = Patient.objects.create(
+            first_name='Marie', last_name='Curie', birth_date=date(1990, 1, 1), gender='F',
+            city='Paris', mobile='06 12 34 56 78'
+        )
+    
+    def entries(self, action):
+        return list(AuditLog.objects.filter(action=action, model_name='Patient', object_id=str(self.patient.pk)))
+    
+    def test_create_logged(self):
+        [entry] = self.entries('CREATE')
+        self.assertEqual(entry.changes['city'], {'old': None, 'new': 'Paris'})
+        self.assertEqual(entry.changes['birth_date'], {'old': None, 'new': '1990-01-01'})
+        self.assertEqual(entry.changes['last_name'], {'changed': True})
+        self.assertNotIn('created_at', entry.changes)
+        self.assertNotIn('Curie', json.dumps(entry.changes))
+    
+    def test_update_stores_old_and_new_values(self):
+        patient = Patient.objects.get(pk=self.patient.pk)
+        patient.city = 'Lyon'
+        patient.birth_date = date(1991, 2, 3)
+        patient.save()
+        [entry] = self.entries('UPDATE')
+        self.assertEqual(entry.changes, {
+            'city': {'old': 'Paris', 'new': 'Lyon'},
+            'birth_date': {'old': '1990-01-01', 'new': '1991-02-03'},
+        })
+    
+    def test_update_of_encrypted_fields_stores_no_value(self):
+        patient = Patient.objects.get(pk=self.patient.pk)
+        patient.last_name = 'Sklodowska'
+        patient.mobile = '07 00 00 00 00'
+        patient.save()
+        [entry] = self.entries('UPDATE')
+        self.assertEqual(entry.changes, {'last_name': {'changed': True}, 'mobile': {'changed': True}})
+        stored = json.dumps(entry.changes)
+        for plaintext in ['Curie', 'Sklodowska', '06 12', '07 00']:
+            self.assertNotIn(plaintext, stored)
+    
+    def test_unchanged_save_not_logged(self):
+        self.patient.save()
+        patient = Patient.objects.get(pk=self.patient.pk)
+        patient.save()
+        # Mêmes valeurs réaffectées, sans (nom) ou après (ville) lecture
+        patient.last_name = 'Curie'
+        patient.city = patient.city
+        patient.save()
+        self.assertEqual(self.entries('UPDATE'), [])
+    
+    def test_delete_logged(self):
+        patient_id = self.patient.pk
+        self.patient.delete()
+        entry = AuditLog.objects.get(action='DELETE', model_name='Patient', object_id=str(patient_id))
+        self.assertIsNone(entry.changes)
+    
+    def test_retrieve_logged_as_read(self):
+        user = User.objects.create_user(username='dentiste', password='x', role='DENTIST')
+        client = APIClient(HTTP_HOST=self.domain.domain)
+        client.force_authenticate(user)
+        response = client.get(f'/api/patients/{self.patient.pk}/')
+        self.assertEqual(response.status_code, 200, response.content)
+        [entry] = self.entries('READ')
+        self.assertEqual(entry.user, user)
+
+
+# ============================================================================
+# CHIFFREMENT PARESSEUX DES CHAMPS SENSIBLES
+# ============================================================================
+
+class EncryptedFieldTests(PatientTestCase):
+    """Déchiffrement au premier accès ; une valeur chiffrée illisible n'est jamais servie"""
+    
+    def setUp(self):
+        super().setUp()
+        self.patient = Patient.objects.create(first_name='Marie', last_name='Curie', birth_date=date(1990, 1, 1), gender='F')
+    
+    def store_raw(self, column, value):
+        with connection.cursor() as cursor:
+            cursor.execute(f'UPDATE patients_patient SET {column} = %s WHERE id = %s', [value, self.patient.pk])
+    
+    def test_decrypted_on_first_access(self):
+        patient = Patient.objects.get(pk=self.patient.pk)
+        self.assertTrue(patient.__dict__['first_name'].startswith(b'\x01'))
+        self.assertEqual(patient.first_name, 'Marie')
+        self.assertEqual(patient.__dict__['first_name'], 'Marie')
+    
+    def test_unread_value_saved_unchanged(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT first_name FROM patients_patient WHERE id = %s', [self.patient.pk])
+            stored = bytes(cursor.fetchone()[0])
+        patient = Patient.objects.get(pk=self.patient.pk)
+        patient.gender = 'O'
+        patient.save()
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT first_name FROM patients_patient WHERE id = %s', [self.patient.pk])
+            self.assertEqual(bytes(cursor.fetchone()[0]), stored)
+    
+    def test_unknown_key_raises(self):
+        other = Keyring([('9', Fernet.generate_key())])
+        self.store_raw('first_name', other.encrypt(b'Marie', 'aes-gcm'))
+        self.store_raw('last_name', other.encrypt(b'Curie').encode())
+        patient = Patient.objects.get(pk=self.patient.pk)
+        with self.assertRaises(InvalidToken):
+            patient.first_name
+        with self.assertRaises(InvalidToken):
+            patient.last_name
+    
+    def test_plain_text_passes_through(self):
+        self.store_raw('first_name', 'Jean:Pierre'.encode())
+        self.assertEqual(Patient.objects.get(pk=self.patient.pk).first_name, 'Jean:Pierre')
+        field = Patient._meta.get_field('last_name')
+        self.assertEqual(field.to_python('Curie'), 'Curie')
+        self.assertEqual(field.to_python(field.encrypt_value('Curie')), 'Curie')
+
+
+# ============================================================================
+# PROJECTIONS ?fields= / ?omit=
+# ============================================================================
+
+class SparseFieldsTests(PatientTestCase):
+    """Champs demandés validés, seuls sérialisés et seuls lus en base"""
+    
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='dentiste', password='x', role='DENTIST')
+        self.client = APIClient(HTTP_HOST=self.domain.domain)
+        self.client.force_authenticate(self.user)
+        self.patient = Patient.objects.create(
+            first_name='Marie', last_name='Curie', birth_date=date(1990, 1, 1), gender='F',
+            email='marie@example.fr', created_by=self.user
+        )
+    
+    def get(self, url, params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200, response.content)
+        patient_sql = [q['sql'] for q in queries.captured_queries if 'FROM "patients_patient"' in q['sql']]
+        return response.data, patient_sql
+    
+    def test_fields_on_list(self):
+        data, sql = self.get('/api/patients/', {'fields': 'id,last_name'})
+        self.assertEqual(data['results'], [{'id': self.patient.pk, 'last_name': 'Curie'}])
+        self.assertNotIn('"first_name"', sql[-1])
+        self.assertNotIn('"email"', sql[-1])
+    
+    def test_omit_on_retrieve(self):
+        data, _ = self.get(f'/api/patients/{self.patient.pk}/', {'omit': 'email,medical_notes,created_by_username'})
+        self.assertNotIn('email', data)
+        self.assertNotIn('created_by_username', data)
+        self.assertEqual(data['first_name'], 'Marie')
+    
+    def test_computed_and_related_fields(self):
+        data, sql = self.get(f'/api/patients/{self.patient.pk}/', {'fields': 'age,created_by_username'})
+        self.assertEqual(set(data), {'age', 'created_by_username'})
+        self.assertEqual(data['created_by_username'], 'dentiste')
+        self.assertIn('"birth_date"', sql[-1])
+        self.assertIn('JOIN "core_customuser"', sql[-1])
+    
+    def test_fields_on_search(self):
+        response = self.client.post('/api/patients/search/?fields=id', {'query': 'Curie'}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.data['results'], [{'id': self.patient.pk}])
+    
+    def test_unknown_fields_rejected(self):
+        for params in ({'fields': 'id,nom'}, {'omit': 'password'}):
+            response = self.client.get('/api/patients/', params)
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('error', response.data)
+        response = self.client.get('/api/patients/', {'fields': 'id,,last_name,'})
+        self.assertEqual(set(response.data['results'][0]), {'id', 'last_name'})
+
+
+# ============================================================================
+# IMPORT EN MASSE
+# ============================================================================
+
+class PatientImportTests(PatientTestCase):
+    """Lignes rejetées, paquets, numéros réservés et suivi de l'import lancé par l'API"""
+    
+    HEADER = 'first_name,last_name,birth_date,gender,mobile,rgpd_consent\n'
+    
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='secretaire', password='x', role='SECRETARY')
+        import_settings = override_settings(PATIENT_IMPORT_ASYNC=False, PATIENT_IMPORT_WORKERS=0)
+        import_settings.enable()
+        self.addCleanup(import_settings.disable)
+    
+    def csv_rows(self, count, start=0):
+        return ''.join(f'Prénom{i},Nom{i},1980-01-01,F,06 00 00 00 {i:02d},true\n' for i in range(start, start + count))
+    
+    def run_import(self, content, file_format='csv', **options):
+        progress = []
+        importer = PatientImporter(user=self.user, **options)
+        report = importer.run(
+            iter_rows(io.StringIO(content), file_format),
+            progress=lambda *counts: progress.append(counts)
+        )
+        return report, progress
+    
+    def test_row_errors_reported_with_line_numbers(self):
+        content = self.HEADER + self.csv_rows(1) + ',Nom,1980-01-01,F,,true\n' + 'A,B,1980-01-01,F,,false\n'
+        report, _ = self.run_import(content)
+        self.assertEqual(report['created'], 1)
+        self.assertEqual(report['error_count'], 2)
+        self.assertEqual([error['row'] for error in report['errors']], [3, 4])
+        self.assertIn('first_name', report['errors'][0]['errors'])
+        self.assertIn('rgpd_consent', report['errors'][1]['errors'])
+    
+    def test_unreadable_ndjson_line(self):
+        content = '{"first_name": "Marie", "last_name": "Curie", "birth_date": "1990-01-01", ' \
+                  '"gender": "F", "rgpd_consent": true}\n{pas du json\n'
+        report, _ = self.run_import(content, file_format='ndjson')
+        self.assertEqual(report['created'], 1)
+        self.assertEqual(report['errors'], [{'row': 2, 'errors': {'non_field_errors': ['Ligne illisible.']}}])
+    
+    def test_chunks_written_and_reported(self):
+        report, progress = self.run_import(self.HEADER + self.csv_rows(5), chunk_size=2)
+        self.assertEqual(report['created'], 5)
+        self.assertEqual(progress, [(2, 2, 0), (4, 4, 0), (5, 5, 0)])
+        imports = AuditLog.objects.filter(action='CREATE', object_repr__startswith='Import de')
+        self.assertEqual(sorted(entry.changes['import']['count'] for entry in imports), [1, 2, 2])
+    
+    def test_patient_numbers_follow_sequence(self):
+        existing = Patient.objects.create(first_name='Marie', last_name='Curie', birth_date=date(1990, 1, 1), gender='F')
+        self.run_import(self.HEADER + self.csv_rows(3), chunk_size=2)
+        first = int(existing.patient_number[1:])
+        numbers = list(Patient.objects.exclude(pk=existing.pk).order_by('id').values_list('patient_number', flat=True))
+        self.assertEqual(numbers, [f'P{first + i:06d}' for i in range(1, 4)])
+        # Numéros réservés puis abandonnés : jamais réattribués
+        PatientImporter.allocate_numbers(2)
+        self.assertEqual(Patient.objects.create(
+            first_name='Pierre', last_name='Curie', birth_date=date(1990, 1, 1), gender='M'
+        ).patient_number, f'P{first + 6:06d}')
+    
+    def test_imported_patients_searchable_and_decryptable(self):
+        self.run_import(self.HEADER + self.csv_rows(2))
+        patient = Patient.objects.search('Nom1').get()
+        self.assertEqual((patient.first_name, patient.mobile), ('Prénom1', '06 00 00 00 01'))
+        self.assertEqual(list(Patient.objects.by_phone('0600000001')), [patient])
+    
+    def test_process_pool_preserves_order(self):
+        report, progress = self.run_import(self.HEADER + self.csv_rows(5), chunk_size=2, workers=2)
+        self.assertEqual(report['created'], 5)
+        self.assertEqual(progress[-1], (5, 5, 0))
+        self.assertEqual(
+            [patient.last_name for patient in Patient.objects.order_by('patient_number')],
+            [f'Nom{i}' for i in range(5)]
+        )
+    
+    def test_api_import_reports_progress(self):
+        client = APIClient(HTTP_HOST=self.domain.domain)
+        client.force_authenticate(self.user)
+        upload = SimpleUploadedFile('patients.csv', (self.HEADER + self.csv_rows(3) + ',,,,,\n').encode())
+        with self.settings(PATIENT_IMPORT_DIR=self.tmpdir()):
+            response = client.post('/api/patients/import/', {'file': upload}, format='multipart')
+            self.assertEqual(response.status_code, 202, response.content)
+            self.assertEqual(os.listdir(settings.PATIENT_IMPORT_DIR), [])
+        self.assertEqual(response.data['status'], 'DONE')
+        self.assertEqual((response.data['processed'], response.data['created'], response.data['error_count']), (4, 3, 1))
+        
+        response = client.get(f"/api/patients/import/{response.data['id']}/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['file_name'], 'patients.csv')
+        self.assertEqual(response.data['errors'][0]['row'], 5)
+        self.assertEqual(client.get('/api/patients/import/999/').status_code, 404)
+    
+    def test_api_import_runs_after_commit(self):
+        client = APIClient(HTTP_HOST=self.domain.domain)
+        client.force_authenticate(self.user)
+        upload = SimpleUploadedFile('patients.csv', (self.HEADER + self.csv_rows(1)).encode())
+        with self.settings(PATIENT_IMPORT_ASYNC=True), \
+                mock.patch('patients.importer.threading.Thread') as thread, \
+                self.captureOnCommitCallbacks() as callbacks:
+            response = client.post('/api/patients/import/', {'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, 202, response.content)
+        self.assertEqual(response.data['status'], 'PENDING')
+        self.assertEqual(callbacks, [thread.return_value.start])
+        schema_name, job_id, path, workers = thread.call_args.kwargs['args']
+        self.assertEqual((schema_name, job_id), (connection.schema_name, response.data['id']))
+        os.unlink(path)
+    
+    def tmpdir(self):
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        return path
+
+
+# ============================================================================
+# EXPORT EN FLUX
+# ============================================================================
+
+class PatientExportTests(PatientTestCase):
+    """Formats de sortie, lecture par paquets et journalisation des exports interrompus"""
+    
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='dentiste', password='x', role='DENTIST')
+        self.client = APIClient(HTTP_HOST=self.domain.domain)
+        self.client.force_authenticate(self.user)
+        self.patients = [
+            Patient.objects.create(
+                first_name=f'Prénom{i}', last_name=f'Nom{i}', birth_date=date(1980, 1, 1), gender='F',
+                email=f'patient{i}@example.fr'
+            )
+            for i in range(5)
+        ]
+    
+    def export(self, **params):
+        response = self.client.get('/api/patients/export/', params)
+        self.assertEqual(response.status_code, 200)
+        return response, b''.join(response.streaming_content)
+    
+    def exports(self):
+        return AuditLog.objects.filter(action='EXPORT')
+    
+    def test_ndjson(self):
+        response, content = self.export()
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        records = [json.loads(line) for line in content.decode().splitlines()]
+        self.assertEqual([record['id'] for record in records], [patient.pk for patient in self.patients])
+        self.assertEqual(records[0]['first_name'], 'Prénom0')
+        self.assertNotIn('age', records[0])
+        self.assertEqual(self.exports().get().changes['export'], {'count': 5, 'format': 'ndjson', 'complete': True})
+    
+    def test_csv(self):
+        response, content = self.export(file_format='csv')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        rows = list(csv.DictReader(io.StringIO(content.decode())))
+        self.assertEqual([row['last_name'] for row in rows], [f'Nom{i}' for i in range(5)])
+        self.assertEqual(rows[4]['email'], 'patient4@example.fr')
+    
+    def test_gzip(self):
+        _, plain = self.export(file_format='csv')
+        response, content = self.export(file_format='csv', gzip='1')
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertIn('.csv.gz"', response['Content-Disposition'])
+        self.assertEqual(gzip.decompress(content), plain)
+    
+    def test_unknown_format_rejected(self):
+        response = self.client.get('/api/patients/export/', {'file_format': 'xml'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('error', response.data)
+    
+    def test_keyset_pages(self):
+        exporter = PatientExporter(Patient.objects.order_by('-id'), chunk_size=2)
+        with CaptureQueriesContext(connection) as queries:
+            records = list(exporter.records())
+        self.assertEqual([record['id'] for record in records], [patient.pk for patient in self.patients])
+        pages = [q['sql'] for q in queries.captured_queries if 'FROM "patients_patient"' in q['sql']]
+        self.assertEqual(len(pages), 3)
+        self.assertIn(f'"patients_patient"."id" > {self.patients[3].pk}', pages[-1])
+        self.assertTrue(all('LIMIT 2' in sql for sql in pages))
+    
+    def test_interrupted_export_audited(self):
+        exporter = PatientExporter(Patient.objects.all(), chunk_size=2)
+        exporter.buffer_size = 1
+        stream = exporter.stream()
+        next(stream)
+        self.assertFalse(self.exports().exists())
+        stream.close()  # client déconnecté
+        self.assertEqual(self.exports().get().changes['export'], {'count': 2, 'format': 'ndjson', 'complete': False})
+
+
+# ============================================================================
+# ROTATION DES CLÉS DE CHIFFREMENT
+# ============================================================================
+
+class EncryptionKeysTestCase(PatientTestCase):
+    """Fichier de clés maîtres temporaire, relu seulement sur demande ; clé de données du cabinet recréée"""
+    
+    def setUp(self):
+        super().setUp()
+        self.key_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.key_dir)
+        self.key_file = os.path.join(self.key_dir, 'encryption.key')
+        key_settings = override_settings(ENCRYPTION_KEY_FILE=self.key_file, ENCRYPTION_KEY_RELOAD_INTERVAL=3600)
+        key_settings.enable()
+        self.addCleanup(key_settings.disable)
+        # Clé de données chiffrée par les clés maîtres réelles : remplacée au premier usage
+        self.addCleanup(setattr, self.tenant, 'encrypted_data_key', self.tenant.encrypted_data_key)
+        self.tenant.encrypted_data_key = ''
+        type(self.tenant).objects.filter(pk=self.tenant.pk).update(encrypted_data_key='')
+    
+    def master_keyring(self):
+        return get_key_provider().get_keyring()
+    
+    def raw(self, column, patient):
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT {column} FROM patients_patient WHERE id = %s', [patient.pk])
+            return bytes(cursor.fetchone()[0])
+    
+    @contextmanager
+    def other_process(self, provider):
+        """Exécute le bloc comme un autre processus : ses propres clés maîtres et caches"""
+        _tenant_keyrings.clear()
+        _last_keyring.set(None)
+        try:
+            with mock.patch('patients.encryption._key_provider', provider), \
+                    mock.patch('patients.encryption.get_kms', return_value=LocalKMS(provider)):
+                yield
+        finally:
+            _tenant_keyrings.clear()
+            _last_keyring.set(None)
+
+
+class KeyProviderTests(EncryptionKeysTestCase):
+    """Clés maîtres chargées une fois, relues après modification du fichier ou sur clé inconnue"""
+    
+    def later(self, seconds):
+        return mock.patch('patients.encryption.time.monotonic', return_value=time.monotonic() + seconds)
+    
+    def test_created_and_loaded_once(self):
+        provider = KeyProvider(key_file=self.key_file)
+        keyring = provider.get_keyring()
+        self.assertTrue(os.path.exists(self.key_file))
+        self.assertEqual(list(keyring.keys), ['1'])  # une seule clé sans identifiant : clé 1
+        self.assertIs(provider.get_keyring(), keyring)
+        self.assertEqual(provider.get_key(), keyring.keys['1'])
+    
+    def test_reloaded_after_interval_when_file_changed(self):
+        provider = KeyProvider(key_file=self.key_file)
+        keyring = provider.get_keyring()
+        KeyProvider(key_file=self.key_file).add_key()
+        self.assertIs(provider.get_keyring(), keyring)  # intervalle de relecture non écoulé
+        with self.later(settings.ENCRYPTION_KEY_RELOAD_INTERVAL + 1):
+            reloaded = provider.get_keyring()
+        self.assertEqual(sorted(reloaded.keys), ['1', '2'])
+        self.assertEqual(reloaded.current_id, '2')
+        self.assertEqual(reloaded.keys['1'], keyring.keys['1'])
+    
+    def test_unchanged_file_not_reloaded(self):
+        provider = KeyProvider(key_file=self.key_file)
+        keyring = provider.get_keyring()
+        with self.later(settings.ENCRYPTION_KEY_RELOAD_INTERVAL + 1):
+            self.assertIs(provider.get_keyring(), keyring)
+        self.assertIs(provider.refresh(), keyring)
+    
+    def test_add_key(self):
+        provider = KeyProvider(key_file=self.key_file)
+        first = provider.get_key()
+        self.assertEqual(provider.add_key(), '2')
+        self.assertEqual(provider.add_key(), '3')
+        keyring = provider.get_keyring()
+        self.assertEqual(keyring.current_id, '3')
+        self.assertEqual(keyring.keys['1'], first)
+        with open(self.key_file, 'rb') as f:
+            self.assertEqual([line.split(b':')[0] for line in f.read().splitlines()], [b'1', b'2', b'3'])
+        self.assertEqual(os.listdir(self.key_dir), ['encryption.key'])
+        # Valeurs chiffrées avec une ancienne clé toujours lisibles
+        self.assertEqual(keyring.decrypt(Keyring([('1', first)]).encrypt(b'Curie', 'aes-gcm')), b'Curie')
+    
+    def test_unknown_key_id_refreshes(self):
+        stale = self.master_keyring()
+        other = KeyProvider(key_file=self.key_file)
+        other.add_key()
+        field = Patient._meta.get_field('last_name')
+        with mock.patch.object(KeyProvider, 'refresh', autospec=True, side_effect=KeyProvider.refresh) as refresh:
+            self.assertEqual(field._decrypt(stale, stale.encrypt(b'Curie', 'aes-gcm')), 'Curie')
+            refresh.assert_not_called()
+            self.assertEqual(field._decrypt(stale, other.get_keyring().encrypt(b'Curie', 'aes-gcm')), 'Curie')
+        refresh.assert_called_once_with(get_key_provider())
+        self.assertEqual(self.master_keyring().current_id, '2')
+
+
+class KeyRotationTests(EncryptionKeysTestCase):
+    """Clé ajoutée par un autre processus, reprise sur point de contrôle et écritures concurrentes"""
+    
+    def create_patients(self, count, keyring=None):
+        # Valeurs chiffrées par une clé maître (antérieures au chiffrement d'enveloppe)
+        with using_keyring(keyring or self.master_keyring()):
+            return [
+                Patient.objects.create(first_name=f'Prénom{i}', last_name=f'Nom{i}', birth_date=date(1980, 1, 1), gender='F')
+                for i in range(count)
+            ]
+    
+    def rotation(self, **options):
+        return KeyRotation(os.path.join(self.key_dir, 'rotation.json'), **options)
+    
+    def test_stale_provider_reloads_unknown_key(self):
+        patient, = self.create_patients(1)
+        get_current_keyring()  # clés chargées par ce processus avant la rotation
+        other = KeyProvider(key_file=self.key_file)
+        key_id = other.add_key()
+        value = other.get_keyring().encrypt(b'Marie', 'aes-gcm')
+        with connection.cursor() as cursor:
+            cursor.execute('UPDATE patients_patient SET first_name = %s WHERE id = %s', [value, patient.pk])
+        
+        patient = Patient.objects.get(pk=patient.pk)
+        self.assertEqual(patient.first_name, 'Marie')
+        self.assertIn(key_id, self.master_keyring().keys)
+        # Réenregistrée en clair puis rechiffrée : jamais le chiffré pris pour le nom
+        patient.save()
+        self.assertEqual(Patient.objects.get(pk=patient.pk).first_name, 'Marie')
+    
+    def test_unknown_key_still_raises_after_reload(self):
+        patient, = self.create_patients(1)
+        value = Keyring([('9', Fernet.generate_key())]).encrypt(b'Marie', 'aes-gcm')
+        with connection.cursor() as cursor:
+            cursor.execute('UPDATE patients_patient SET first_name = %s WHERE id = %s', [value, patient.pk])
+        with self.assertRaises(InvalidToken):
+            Patient.objects.get(pk=patient.pk).first_name
+    
+    def test_rotation_by_other_process_with_stale_reader(self):
+        patients = self.create_patients(3)
+        stale = get_current_keyring()
+        other = KeyProvider(key_file=self.key_file)
+        with self.other_process(other):
+            call_command(
+                'rotate_encryption_keys', '--new-key', '--schema', self.tenant.schema_name, '--workers', '0',
+                '--pause', '0', '--checkpoint', os.path.join(self.key_dir, 'rotation.json'), stdout=io.StringIO()
+            )
+        self.assertEqual(sorted(other.get_keyring().keys), ['1', '2'])
+        self.assertNotIn('2', stale.keys)
+        
+        # Processus web : clés d'avant la rotation encore en cache
+        _tenant_keyrings.set(self.tenant.schema_name, stale)
+        for patient in Patient.objects.filter(pk__in=[p.pk for p in patients]):
+            self.assertFalse(stale.needs_rotation(self.raw('first_name', patient), 'aes-gcm'))
+            self.assertTrue(patient.first_name.startswith('Prénom'))
+            patient.last_name = 'Curie'
+            patient.save()
+        self.assertEqual(Patient.objects.search('Curie').count(), 3)
+    
+    def test_checkpoint_resume(self):
+        patients = self.create_patients(5)
+        keyring = get_tenant_keyring(self.tenant.schema_name)
+        
+        def interrupt(last_id, report):
+            raise KeyboardInterrupt
+        
+        with self.assertRaises(KeyboardInterrupt):
+            self.rotation(batch_size=2).run(self.tenant.schema_name, progress=interrupt)
+        self.assertFalse(keyring.needs_rotation(self.raw('first_name', patients[1]), 'aes-gcm'))
+        self.assertTrue(keyring.needs_rotation(self.raw('first_name', patients[2]), 'aes-gcm'))
+        
+        # Nouvelle exécution : reprise après le dernier paquet enregistré
+        report = self.rotation(batch_size=2).run(self.tenant.schema_name)
+        self.assertEqual((report['scanned'], report['rotated'], report['failed']), (3, 3, []))
+        for patient in patients:
+            self.assertFalse(keyring.needs_rotation(self.raw('last_name', patient), 'aes-gcm'))
+        self.assertEqual(
+            [p.first_name for p in Patient.objects.order_by('id')], [f'Prénom{i}' for i in range(5)]
+        )
+        
+        report = self.rotation(batch_size=2).run(self.tenant.schema_name)
+        self.assertEqual(report['scanned'], 0)
+        rotation = self.rotation(batch_size=2)
+        rotation.restart(self.tenant.schema_name)
+        self.assertEqual(rotation.run(self.tenant.schema_name)['rotated'], 0)
+    
+    def test_concurrent_write_skipped(self):
+        patients = self.create_patients(3)
+        rotation = self.rotation()
+        keyring = get_tenant_keyring(self.tenant.schema_name)
+        (_, rows), = rotation._batches(0)
+        changed, failed = reencrypt_rows(rows, keyring, rotation.algorithms)
+        self.assertEqual((len(changed), failed), (3, []))
+        
+        # Modifié par l'application entre la lecture et l'écriture du paquet
+        edited = Patient.objects.get(pk=patients[1].pk)
+        edited.first_name = 'Irène'
+        edited.save()
+        self.assertEqual(rotation.write_batch(changed), 2)
+        self.assertEqual(
+            [p.first_name for p in Patient.objects.order_by('id')], ['Prénom0', 'Irène', 'Prénom2']
+        )
+
+
+class TenantDataKeyTests(EncryptionKeysTestCase):
+    """Clé de données par cabinet : chiffrée par le KMS, créée au premier usage, gardée en cache"""
+    
+    def stored_key(self):
+        return type(self.tenant).objects.values_list('encrypted_data_key', flat=True).get(pk=self.tenant.pk)
+    
+    def test_wrap_unwrap(self):
+        kms = LocalKMS()
+        data_key = Fernet.generate_key()
+        wrapped = kms.wrap(data_key)
+        self.assertTrue(wrapped.startswith('1:'))
+        self.assertEqual(kms.unwrap(wrapped), data_key)
+        self.assertFalse(kms.needs_rewrap(wrapped))
+        
+        KeyProvider(key_file=self.key_file).add_key()
+        get_key_provider().refresh()
+        self.assertTrue(kms.needs_rewrap(wrapped))
+        rewrapped = kms.wrap(kms.unwrap(wrapped))
+        self.assertTrue(rewrapped.startswith('2:'))
+        self.assertEqual(kms.unwrap(rewrapped), data_key)
+    
+    def test_created_on_first_use(self):
+        self.assertEqual(self.stored_key(), '')
+        keyring = get_tenant_keyring(self.tenant.schema_name)
+        self.assertEqual(keyring.current_id, TENANT_KEY_ID)
+        self.assertEqual(LocalKMS().unwrap(self.stored_key()), keyring.keys[TENANT_KEY_ID])
+        self.assertIn('1', keyring.keys)  # clés maîtres : valeurs antérieures à l'enveloppe
+        patient = Patient.objects.create(first_name='Marie', last_name='Curie', birth_date=date(1990, 1, 1), gender='F')
+        self.assertTrue(self.raw('first_name', patient).startswith(b'\x01\x02t1'))
+    
+    def test_concurrent_creation_keeps_first_key(self):
+        kms = LocalKMS()
+        first = kms.wrap(Fernet.generate_key())
+        
+        def created_by_other_process():
+            type(self.tenant).objects.filter(pk=self.tenant.pk).update(encrypted_data_key=first)
+            return kms.wrap(Fernet.generate_key())
+        
+        with mock.patch('patients.encryption.new_wrapped_data_key', side_effect=created_by_other_process):
+            keyring = get_tenant_keyring(self.tenant.schema_name)
+        self.assertEqual(self.stored_key(), first)
+        self.assertEqual(keyring.keys[TENANT_KEY_ID], kms.unwrap(first))
+    
+    def test_read_back_from_primary(self):
+        with mock.patch('core.routers.ReplicaRouter.db_for_read', return_value='replica1'):
+            keyring = get_tenant_keyring(self.tenant.schema_name)
+        self.assertEqual(keyring.keys[TENANT_KEY_ID], LocalKMS().unwrap(self.stored_key()))
+    
+    def test_cached_until_ttl(self):
+        with mock.patch.object(LocalKMS, 'unwrap', autospec=True, side_effect=LocalKMS.unwrap) as unwrap:
+            keyring = get_tenant_keyring(self.tenant.schema_name)
+            with self.assertNumQueries(0):
+                self.assertIs(get_tenant_keyring(self.tenant.schema_name), keyring)
+            now = time.monotonic()
+            with mock.patch('core.cache.time.monotonic', return_value=now + settings.TENANT_DATA_KEY_CACHE_TTL + 1):
+                refreshed = get_tenant_keyring(self.tenant.schema_name)
+        self.assertIsNot(refreshed, keyring)
+        self.assertEqual(refreshed.keys, keyring.keys)
+        self.assertEqual(unwrap.call_count, 2)
+    
+    def test_stale_master_keys_after_rewrap(self):
+        data_key = get_tenant_keyring(self.tenant.schema_name).keys[TENANT_KEY_ID]
+        other = KeyProvider(key_file=self.key_file)
+        with self.other_process(other):
+            other.add_key()
+            self.assertEqual(rewrap_data_keys(), 1)
+        self.assertEqual([wrapped[:2] for _, wrapped in parse_data_keys(self.stored_key())], ['2:'])
+        
+        # Clés du cabinet expirées avant la relecture périodique des clés maîtres
+        _tenant_keyrings.clear()
+        self.tenant.encrypted_data_key = self.stored_key()
+        self.assertNotIn('2', get_key_provider().get_keyring().keys)
+        self.assertEqual(get_tenant_keyring(self.tenant.schema_name).keys[TENANT_KEY_ID], data_key)
+        self.assertIn('2', get_key_provider().get_keyring().keys)
+
+
+class DataKeyRotationTests(EncryptionKeysTestCase):
+    """Clés de données versionnées : nouvelle clé courante, anciennes gardées pour la lecture"""
+    
+    def setUp(self):
+        super().setUp()
+        self.patients = [
+            Patient.objects.create(first_name=f'Prénom{i}', last_name='Curie', birth_date=date(1990, 1, 1), gender='F')
+            for i in range(3)
+        ]
+    
+    def stored_keys(self):
+        stored = type(self.tenant).objects.values_list('encrypted_data_key', flat=True).get(pk=self.tenant.pk)
+        return parse_data_keys(stored)
+    
+    def rotate(self, *args):
+        call_command(
+            'rotate_encryption_keys', *args, '--schema', self.tenant.schema_name, '--workers', '0', '--pause', '0',
+            '--checkpoint', os.path.join(self.key_dir, 'rotation.json'), stdout=io.StringIO()
+        )
+    
+    def test_initial_key_without_id(self):
+        wrapped = LocalKMS().wrap(Fernet.generate_key())
+        self.assertEqual(parse_data_keys(wrapped), [(TENANT_KEY_ID, wrapped)])
+        keys = [('t1', wrapped), ('t2', LocalKMS().wrap(Fernet.generate_key()))]
+        self.assertEqual(parse_data_keys(format_data_keys(keys)), keys)
+    
+    def test_rows_reencrypted_with_new_data_key(self):
+        old_keyring = get_tenant_keyring(self.tenant.schema_name)
+        self.rotate('--new-data-key')
+        
+        self.assertEqual([key_id for key_id, _ in self.stored_keys()], ['t1', 't2'])
+        keyring = get_tenant_keyring(self.tenant.schema_name)
+        self.assertEqual(keyring.current_id, 't2')
+        self.assertEqual(keyring.keys['t1'], old_keyring.keys['t1'])
+        self.assertNotEqual(keyring.keys['t2'], keyring.keys['t1'])
+        for patient in self.patients:
+            self.assertTrue(self.raw('first_name', patient).startswith(b'\x01\x02t2'))
+            self.assertTrue(self.raw('last_name', patient).startswith(b'\x01\x02t2'))
+        self.assertEqual([p.first_name for p in Patient.objects.order_by('id')], ['Prénom0', 'Prénom1', 'Prénom2'])
+        
+        # Nouvelle rotation : t3, t1 et t2 toujours lisibles
+        self.rotate('--new-data-key')
+        self.assertEqual([key_id for key_id, _ in self.stored_keys()], ['t1', 't2', 't3'])
+        self.assertTrue(self.raw('first_name', self.patients[0]).startswith(b'\x01\x02t3'))
+    
+    def test_values_under_old_data_key_still_read(self):
+        get_current_keyring()
+        rotate_data_key(self.tenant.schema_name)
+        patient = Patient.objects.get(pk=self.patients[0].pk)
+        self.assertTrue(self.raw('first_name', patient).startswith(b'\x01\x02t1'))
+        self.assertEqual(patient.first_name, 'Prénom0')
+        patient.first_name = 'Irène'
+        patient.save()
+        self.assertTrue(self.raw('first_name', patient).startswith(b'\x01\x02t2'))
+    
+    def test_stale_reader_reloads_new_data_key(self):
+        stale = get_current_keyring()
+        other = KeyProvider(key_file=self.key_file)
+        with self.other_process(other):
+            self.rotate('--new-data-key')
+        
+        # Processus web : clés du cabinet et cabinet de la requête d'avant la rotation
+        _tenant_keyrings.set(self.tenant.schema_name, stale)
+        self.tenant.encrypted_data_key = format_data_keys(self.stored_keys()[:1])
+        self.assertNotIn('t2', stale.keys)
+        self.assertEqual([p.first_name for p in Patient.objects.order_by('id')], ['Prénom0', 'Prénom1', 'Prénom2'])
+        self.assertIn('t2', get_tenant_keyring(self.tenant.schema_name).keys)
+    
+    def test_rewrap_keeps_every_data_key(self):
+        keyring = get_tenant_keyring(self.tenant.schema_name)
+        rotate_data_key(self.tenant.schema_name)
+        data_keys = {key_id: key for key_id, key in get_tenant_keyring(self.tenant.schema_name).keys.items()
+                     if key_id.startswith('t')}
+        get_key_provider().add_key()
+        self.assertEqual(rewrap_data_keys(), 1)
+        stored = self.stored_keys()
+        self.assertEqual([(key_id, wrapped[:2]) for key_id, wrapped in stored], [('t1', '2:'), ('t2', '2:')])
+        self.assertEqual({key_id: LocalKMS().unwrap(wrapped) for key_id, wrapped in stored}, data_keys)
+        self.assertEqual(data_keys['t1'], keyring.keys['t1'])
+
+
+# ============================================================================
+# FORMAT AEAD ET VALEURS HISTORIQUES
+# ============================================================================
+
+class AeadFormatTests(PatientTestCase):
+    """Valeurs AEAD binaires, valeurs Fernet antérieures dans les mêmes colonnes, détection des valeurs à rechiffrer"""
+    
+    def setUp(self):
+        super().setUp()
+        self.old_key, self.key = Fernet.generate_key(), Fernet.generate_key()
+        self.keyring = Keyring([('1', self.old_key), ('2', self.key)])
+        self.old_keyring = Keyring([('1', self.old_key)])
+    
+    def test_layout(self):
+        for algorithm, version in (('aes-gcm', 1), ('chacha20-poly1305', 2)):
+            value = self.keyring.encrypt(b'Curie', algorithm)
+            self.assertEqual(value[:3], bytes((version, 1)) + b'2')
+            self.assertEqual(len(value), 3 + 12 + len(b'Curie') + 16)
+            self.assertEqual(self.keyring.decrypt(value), b'Curie')
+            self.assertEqual(self.keyring.decrypt(memoryview(value)), b'Curie')
+        # Nonce aléatoire : deux chiffrements d'une même valeur diffèrent
+        self.assertNotEqual(self.keyring.encrypt(b'Curie', 'aes-gcm'), self.keyring.encrypt(b'Curie', 'aes-gcm'))
+    
+    def test_subkeys_per_algorithm(self):
+        value = bytearray(self.keyring.encrypt(b'Curie', 'aes-gcm'))
+        value[0] = 2  # même clé, autre algorithme
+        with self.assertRaises(InvalidToken):
+            self.keyring.decrypt(bytes(value))
+    
+    def test_tampered_value_rejected(self):
+        value = bytearray(self.keyring.encrypt(b'Curie', 'aes-gcm'))
+        value[-1] ^= 1
+        with self.assertRaises(InvalidToken):
+            self.keyring.decrypt(bytes(value))
+    
+    def test_legacy_values_decrypt(self):
+        fernet = self.old_keyring.encrypt(b'Curie')
+        legacy = base64.urlsafe_b64encode(Fernet(self.old_key).encrypt(b'Curie'))
+        for value in (fernet, fernet.encode(), legacy, legacy.decode(), self.old_keyring.encrypt(b'Curie', 'aes-gcm')):
+            self.assertEqual(self.keyring.decrypt(value), b'Curie', value)
+    
+    def test_mixed_formats_in_one_column(self):
+        with using_keyring(self.keyring):
+            patients = [
+                Patient.objects.create(first_name=f'Prénom{i}', last_name='Curie', birth_date=date(1990, 1, 1), gender='F')
+                for i in range(3)
+            ]
+            values = [
+                self.old_keyring.encrypt(b'Marie').encode(),  # texte Fernet conservé par la migration 0008
+                base64.urlsafe_b64encode(Fernet(self.old_key).encrypt('Irène'.encode())),  # format historique
+            ]
+            with connection.cursor() as cursor:
+                for patient, value in zip(patients, values):
+                    cursor.execute('UPDATE patients_patient SET first_name = %s WHERE id = %s', [value, patient.pk])
+            self.assertEqual(
+                [patient.first_name for patient in Patient.objects.order_by('id')], ['Marie', 'Irène', 'Prénom2']
+            )
+    
+    def test_needs_rotation(self):
+        self.assertFalse(self.keyring.needs_rotation(self.keyring.encrypt(b'x', 'aes-gcm'), 'aes-gcm'))
+        self.assertFalse(self.keyring.needs_rotation(memoryview(self.keyring.encrypt(b'x', 'aes-gcm')), 'aes-gcm'))
+        self.assertFalse(self.keyring.needs_rotation(self.keyring.encrypt(b'x')))
+        self.assertFalse(self.keyring.needs_rotation(b'', 'aes-gcm'))
+        self.assertFalse(self.keyring.needs_rotation(''))
+        # Ancienne clé, autre algorithme ou texte Fernet dans une colonne AEAD
+        self.assertTrue(self.keyring.needs_rotation(self.old_keyring.encrypt(b'x', 'aes-gcm'), 'aes-gcm'))
+        self.assertTrue(self.keyring.needs_rotation(self.keyring.encrypt(b'x', 'chacha20-poly1305'), 'aes-gcm'))
+        self.assertTrue(self.keyring.needs_rotation(self.keyring.encrypt(b'x').encode(), 'aes-gcm'))
+        self.assertTrue(self.keyring.needs_rotation(self.old_keyring.encrypt(b'x')))
+        self.assertTrue(self.keyring.needs_rotation(self.keyring.encrypt(b'x', 'aes-gcm')))
+
+
+# ============================================================================
+# DÉCHIFFREMENT PAR PAQUETS
+# ============================================================================
+
+class DecryptedIterTests(PatientTestCase):
+    """decrypted_iter : ordre du QuerySet conservé, état de référence du diff d'audit en clair"""
+    
+    def setUp(self):
+        super().setUp()
+        self.patients = [
+            Patient.objects.create(
+                first_name=f'Prénom{i}', last_name=f'Nom{i}', birth_date=date(1980, 1, 1), gender='F',
+                email=f'patient{i}@example.fr' if i % 2 else ''
+            )
+            for i in range(7)
+        ]
+    
+    def decrypted(self, queryset, **kwargs):
+        with mock.patch('patients.models.ThreadPoolExecutor', wraps=ThreadPoolExecutor) as executor:
+            patients = list(queryset.decrypted_iter(**kwargs))
+        return patients, executor
+    
+    def test_order_preserved_with_workers(self):
+        patients, executor = self.decrypted(Patient.objects.order_by('-id'), chunk=3, workers=3)
+        executor.assert_called_once_with(3, thread_name_prefix='decrypt')
+        self.assertEqual([p.pk for p in patients], [p.pk for p in reversed(self.patients)])
+        self.assertEqual([p.__dict__['first_name'] for p in patients], [f'Prénom{i}' for i in reversed(range(7))])
+        self.assertEqual([p.__dict__['email'] for p in patients][:2], ['', 'patient5@example.fr'])
+    
+    def test_single_worker_without_threads(self):
+        patients, executor = self.decrypted(Patient.objects.order_by('id'), chunk=4, workers=1)
+        executor.assert_not_called()
+        self.assertEqual([p.last_name for p in patients], [f'Nom{i}' for i in range(7)])
+    
+    def test_loaded_values_updated(self):
+        patients, _ = self.decrypted(Patient.objects.order_by('id'), chunk=3, workers=2)
+        for i, patient in enumerate(patients):
+            self.assertEqual(patient._loaded_values['first_name'], f'Prénom{i}')
+            self.assertEqual(patient._loaded_values['last_name'], f'Nom{i}')
+            self.assertNotIsInstance(patient._loaded_values['first_name'], Ciphertext)
+        # Diff d'audit : seul le champ modifié, sans déchiffrement supplémentaire
+        patient = patients[0]
+        patient.last_name = 'Curie'
+        with mock.patch.object(Keyring, 'decrypt') as decrypt:
+            self.assertEqual(audit.compute_changes(patient), {'last_name': {'changed': True}})
+        decrypt.assert_not_called()
+    
+    def test_deferred_fields_untouched(self):
+        patients, _ = self.decrypted(Patient.objects.only('id', 'last_name').order_by('id'), chunk=3, workers=2)
+        self.assertEqual([p.__dict__['last_name'] for p in patients], [f'Nom{i}' for i in range(7)])
+        self.assertNotIn('first_name', patients[0].__dict__)
@@ -1,35 +1,93 @@
 from rest_framework import viewsets, status, permissions, filters
 from rest_framework.decorators import action
+from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
-from rest_framework.exceptions import PermissionDenied
+from rest_framework.exceptions import PermissionDenied, ValidationError
 from django_filters.rest_framework import DjangoFilterBackend
+from django.db import connection
 from django.db.models import Q
+from django.http import StreamingHttpResponse
 from django.utils import timezone
 from datetime import datetime, timedelta
 
-from .models import Patient, AuditLog
+from core.pagination import ArchivedQuerySet
+from core.routers import ReplicaReadMixin
+
+from . import audit, caller_id
+from .archive import audit_archive
+from .blind_index import normalize_phone
+from .exporter import PatientExporter
+from .filters import PatientSearchFilter
+from .importer import start_import
+from .statistics import get_statistics
+from .models import Patient, AuditLog, PatientImport
 from .serializers import (
     PatientSerializer, PatientCreateSerializer, PatientListSerializer,
-    AuditLogSerializer, PatientSearchSerializer
+    AuditLogSerializer, PatientImportSerializer, PatientSearchSerializer, SparseFieldsMixin
 )
 
 
-class PatientViewSet(viewsets.ModelViewSet):
+class PatientViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
     """ViewSet pour la gestion des patients"""
     queryset = Patient.objects.all()
     serializer_class = PatientSerializer
     permission_classes = [permissions.IsAuthenticated]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
-    filterset_fields = ['gender', 'gdpr_consent', 'marketing_consent']
+    filter_backends = [DjangoFilterBackend, PatientSearchFilter, filters.OrderingFilter]
+    filterset_fields = ['gender', 'rgpd_consent', 'marketing_consent']
+    # Champs chiffrés : recherche via les index aveugles (voir PatientQuerySet.search)
     search_fields = ['first_name', 'last_name', 'patient_number', 'phone', 'email']
     ordering_fields = ['created_at', 'last_name', 'first_name', 'birth_date']
     ordering = ['-created_at']
+    cursor_ordering = ('-created_at', '-id')
+    # Projection ?fields=a,b / ?omit=c : colonnes non demandées ni chargées ni déchiffrées
+    sparse_fields_actions = ['list', 'retrieve', 'search']
+    replica_actions = ['list', 'retrieve', 'search', 'statistics', 'audit_log', 'by_phone', 'export', 'export_all']
+    
+    def get_queryset(self):
+        """Joindre les utilisateurs sérialisés et ne charger que les champs demandés"""
+        queryset = super().get_queryset()
+        serializer = self.get_serializer()
+        if isinstance(serializer, SparseFieldsMixin):
+            queryset = queryset.select_related(*serializer.get_related_fields())
+            if serializer.sparse:
+                columns = serializer.get_source_fields()
+                columns.add('patient_number')  # audit_repr (lecture journalisée)
+                columns.update(field.lstrip('-') for field in self.get_cursor_ordering())
+                queryset = queryset.only(*columns)
+        return queryset
+    
+    def get_serializer(self, *args, **kwargs):
+        if self.action in self.sparse_fields_actions:
+            kwargs.update(self.get_sparse_fields())
+        return super().get_serializer(*args, **kwargs)
+    
+    def get_sparse_fields(self):
+        """Champs demandés (?fields=) et exclus (?omit=), validés"""
+        params = self.request.query_params
+        requested = {
+            param: [name for name in params[param].split(',') if name]
+            for param in ('fields', 'omit') if param in params
+        }
+        if not requested:
+            return {}
+        
+        available = self.get_serializer_class()().fields
+        unknown = sorted({name for names in requested.values() for name in names} - set(available))
+        if unknown:
+            raise ValidationError({'error': f"Champs inconnus : {', '.join(unknown)}"})
+        return requested
+    
+    def get_cursor_ordering(self):
+        """Ordre de la pagination par curseur (?cursor=) selon l'action"""
+        if self.action == 'audit_log':
+            return ('-timestamp', '-id')
+        return self.cursor_ordering
     
     def get_serializer_class(self):
         """Retourner le bon serializer selon l'action"""
         if self.action == 'create':
             return PatientCreateSerializer
-        elif self.action == 'list':
+        elif self.action in ['list', 'search']:
             return PatientListSerializer
         return PatientSerializer
     
@@ -43,6 +101,13 @@ class PatientViewSet(viewsets.ModelViewSet):
         
         return [permission() for permission in permission_classes]
     
+    def retrieve(self, request, *args, **kwargs):
+        """Consulter un patient (lecture journalisée)"""
+        instance = self.get_object()
+        serializer = self.get_serializer(instance)
+        audit.log_action('READ', instance=instance, request=request)
+        return Response(serializer.data)
+    
     def perform_create(self, serializer):
         """Créer un patient"""
         # Vérifier les permissions
@@ -62,7 +127,7 @@ class PatientViewSet(viewsets.ModelViewSet):
         # Vérifier les permissions
         user_role = self.request.user.role
         if user_role not in ['DENTIST', 'ADMIN', 'SECRETARY']:
-            raise permissions.PermissionDenied(
+            raise PermissionDenied(
                 "Seuls les dentistes, administrateurs et secrétaires peuvent modifier des patients."
             )
         
@@ -73,7 +138,7 @@ class PatientViewSet(viewsets.ModelViewSet):
         # Vérifier les permissions
         user_role = self.request.user.role
         if user_role not in ['DENTIST', 'ADMIN']:
-            raise permissions.PermissionDenied(
+            raise PermissionDenied(
                 "Seuls les dentistes et administrateurs peuvent supprimer des patients."
             )
         
@@ -97,13 +162,7 @@ class PatientViewSet(viewsets.ModelViewSet):
         # Filtrage par requête textuelle
         query = data.get('query')
         if query:
-            queryset = queryset.filter(
-                Q(first_name__icontains=query) |
-                Q(last_name__icontains=query) |
-                Q(patient_number__icontains=query) |
-                Q(phone__icontains=query) |
-                Q(email__icontains=query)
-            )
+            queryset = queryset.search(query)
         
         # Filtrage par genre
         gender = data.get('gender')
@@ -133,12 +192,130 @@ class PatientViewSet(viewsets.ModelViewSet):
         # Paginer les résultats
         page = self.paginate_queryset(queryset)
         if page is not None:
-            serializer = PatientListSerializer(page, many=True)
+            serializer = self.get_serializer(page, many=True)
             return self.get_paginated_response(serializer.data)
         
-        serializer = PatientListSerializer(queryset, many=True)
+        serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data)
     
+    @action(detail=False, methods=['post'], url_path='import', parser_classes=[MultiPartParser])
+    def import_patients(self, request):
+        """Import en masse depuis un fichier CSV ou NDJSON (champ file)"""
+        user_role = request.user.role
+        if user_role not in ['DENTIST', 'ADMIN', 'SECRETARY']:
+            raise PermissionDenied(
+                "Seuls les dentistes, administrateurs et secrétaires peuvent importer des patients."
+            )
+        
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response(
+                {'error': 'Fichier requis (champ file).'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        file_format = request.data.get('file_format') or (
+            'ndjson' if upload.name.endswith(('.ndjson', '.jsonl')) else 'csv'
+        )
+        if file_format not in ['csv', 'ndjson']:
+            return Response(
+                {'error': 'Format non supporté (csv ou ndjson).'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        # Import hors de la requête : progression sur GET import/<id>/
+        job = start_import(upload, file_format, user=request.user)
+        return Response(PatientImportSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+    
+    @action(detail=False, methods=['get'], url_path=r'import/(?P<import_id>\d+)')
+    def import_status(self, request, import_id=None):
+        """Progression d'un import en masse"""
+        user_role = request.user.role
+        if user_role not in ['DENTIST', 'ADMIN', 'SECRETARY']:
+            raise PermissionDenied(
+                "Seuls les dentistes, administrateurs et secrétaires peuvent importer des patients."
+            )
+        
+        job = PatientImport.objects.filter(pk=import_id).first()
+        if job is None:
+            return Response(
+                {'error': 'Import introuvable.'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        return Response(PatientImportSerializer(job).data)
+    
+    @action(detail=True, methods=['get'])
+    def export(self, request, pk=None):
+        """Export RGPD des données d'un patient (droit d'accès)"""
+        user_role = request.user.role
+        if user_role not in ['DENTIST', 'ADMIN', 'SECRETARY']:
+            raise PermissionDenied(
+                "Seuls les dentistes, administrateurs et secrétaires peuvent exporter des patients."
+            )
+        
+        patient = self.get_object()
+        return self.export_response(
+            Patient.objects.filter(pk=patient.pk), f'patient-{patient.patient_number}',
+            object_id=str(patient.pk), object_repr=patient.audit_repr
+        )
+    
+    @action(detail=False, methods=['get'], url_path='export')
+    def export_all(self, request):
+        """Export de tous les patients du cabinet, en flux"""
+        user_role = request.user.role
+        if user_role not in ['DENTIST', 'ADMIN']:
+            raise PermissionDenied(
+                "Seuls les dentistes et administrateurs peuvent exporter tous les patients."
+            )
+        
+        return self.export_response(
+            Patient.objects.order_by('id'),
+            f'patients-{connection.schema_name}-{timezone.now():%Y%m%d}'
+        )
+    
+    def export_response(self, queryset, basename, **audit_kwargs):
+        """Réponse en flux : ?file_format=ndjson|csv, ?gzip=1 pour compresser"""
+        file_format = self.request.query_params.get('file_format', 'ndjson')
+        if file_format not in PatientExporter.formats:
+            return Response(
+                {'error': 'Format non supporté (ndjson ou csv).'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        exporter = PatientExporter(
+            # Base choisie maintenant : le flux est lu après la fin de la vue
+            queryset.using(queryset.db),
+            file_format=file_format,
+            compress=self.request.query_params.get('gzip') in ('1', 'true'),
+            request=self.request,
+        )
+        response = StreamingHttpResponse(exporter.stream(**audit_kwargs), content_type=exporter.content_type)
+        response['Content-Disposition'] = f'attachment; filename="{exporter.filename(basename)}"'
+        return response
+    
+    @action(detail=False, methods=['get'], url_path='by-phone')
+    def by_phone(self, request):
+        """Identification de l'appelant à partir d'un numéro de téléphone"""
+        number = normalize_phone(request.query_params.get('n', ''))
+        if not number:
+            return Response(
+                {'error': 'Numéro de téléphone requis (paramètre n).'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        patients = caller_id.lookup(number)
+        # Lecture journalisée, comme retrieve (données du cache comprises)
+        for patient in patients:
+            audit.log_action(
+                'READ', request=request, model_name='Patient',
+                object_id=str(patient['id']), object_repr=f"Patient {patient['patient_number']}"
+            )
+        
+        return Response({
+            'number': number,
+            'patients': patients
+        })
+    
     @action(detail=True, methods=['get'])
     def audit_log(self, request, pk=None):
         """Récupérer l'historique d'audit d'un patient"""
@@ -147,22 +324,38 @@ class PatientViewSet(viewsets.ModelViewSet):
         # Vérifier les permissions (seuls dentistes et admins)
         user_role = request.user.role
         if user_role not in ['DENTIST', 'ADMIN']:
-            raise permissions.PermissionDenied(
+            raise PermissionDenied(
                 "Seuls les dentistes et administrateurs peuvent consulter l'historique d'audit."
             )
         
-        logs = AuditLog.objects.filter(
+        logs = AuditLog.objects.select_related('user').filter(
             model_name='Patient',
             object_id=str(patient.id)
-        ).order_by('-timestamp')
+        ).order_by('-timestamp', '-id')
         
-        page = self.paginate_queryset(logs)
+        # Historique ancien : segments d'archive (tous antérieurs aux logs en base),
+        # lus seulement quand la pagination dépasse les logs en base, comptés par leurs index
+        history = ArchivedQuerySet(
+            logs,
+            lambda: audit_archive.lookup(connection.schema_name, 'Patient', str(patient.id)),
+            lambda: audit_archive.count(connection.schema_name, 'Patient', str(patient.id)),
+        )
+        page = self.paginate_queryset(history)
         if page is not None:
-            serializer = AuditLogSerializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
-        
-        serializer = AuditLogSerializer(logs, many=True)
-        return Response(serializer.data)
+            return self.get_paginated_response(self.serialize_history(page))
+        return Response(self.serialize_history(history[:]))
+    
+    @staticmethod
+    def serialize_history(entries):
+        """Logs en base sérialisés, enregistrements archivés réduits aux mêmes champs"""
+        fields = AuditLogSerializer.Meta.fields
+        serialized = iter(AuditLogSerializer(
+            [entry for entry in entries if not isinstance(entry, dict)], many=True
+        ).data)
+        return [
+            {field: entry.get(field) for field in fields} if isinstance(entry, dict) else next(serialized)
+            for entry in entries
+        ]
     
     @action(detail=False, methods=['get'])
     def statistics(self, request):
@@ -170,48 +363,15 @@ class PatientViewSet(viewsets.ModelViewSet):
         # Vérifier les permissions
         user_role = request.user.role
         if user_role not in ['DENTIST', 'ADMIN']:
-            raise permissions.PermissionDenied(
+            raise PermissionDenied(
                 "Seuls les dentistes et administrateurs peuvent consulter les statistiques."
             )
         
-        queryset = self.get_queryset()
-        
-        # Statistiques de base
-        total_patients = queryset.count()
-        male_patients = queryset.filter(gender='M').count()
-        female_patients = queryset.filter(gender='F').count()
-        
-        # Patients créés ce mois
-        this_month = timezone.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        new_this_month = queryset.filter(created_at__gte=this_month).count()
-        
-        # Répartition par tranche d'âge
-        today = timezone.now().date()
-        age_ranges = {
-            '0-18': queryset.filter(birth_date__gte=today - timedelta(days=18*365.25)).count(),
-            '19-35': queryset.filter(
-                birth_date__gte=today - timedelta(days=35*365.25),
-                birth_date__lt=today - timedelta(days=18*365.25)
-            ).count(),
-            '36-55': queryset.filter(
-                birth_date__gte=today - timedelta(days=55*365.25),
-                birth_date__lt=today - timedelta(days=35*365.25)
-            ).count(),
-            '56+': queryset.filter(birth_date__lt=today - timedelta(days=55*365.25)).count(),
-        }
-        
-        return Response({
-            'total_patients': total_patients,
-            'gender_distribution': {
-                'male': male_patients,
-                'female': female_patients
-            },
-            'new_this_month': new_this_month,
-            'age_distribution': age_ranges
-        })
+        # Une seule requête d'agrégation, mise en cache par cabinet
+        return Response(get_statistics())
 
 
-class AuditLogViewSet(viewsets.ReadOnlyModelViewSet):
+class AuditLogViewSet(ReplicaReadMixin, viewsets.ReadOnlyModelViewSet):
     """ViewSet pour les logs d'audit (lecture seule)"""
     queryset = AuditLog.objects.all()
     serializer_class = AuditLogSerializer
@@ -220,6 +380,7 @@ class AuditLogViewSet(viewsets.ReadOnlyModelViewSet):
     filterset_fields = ['action', 'model_name', 'user']
     ordering_fields = ['timestamp']
     ordering = ['-timestamp']
+    cursor_ordering = ('-timestamp', '-id')
     
     def get_permissions(self):
         """Seuls les dentistes et admins peuvent consulter les logs"""
@@ -231,7 +392,7 @@ class AuditLogViewSet(viewsets.ReadOnlyModelViewSet):
         user_role = self.request.user.role
         if user_role not in ['DENTIST', 'ADMIN']:
             # Les autres rôles ne voient que leurs propres actions
-            return AuditLog.objects.filter(user=self.request.user)
+            return AuditLog.objects.select_related('user').filter(user=self.request.user)
         
         # Dentistes et admins voient tout
-        return AuditLog.objects.all()
+        return AuditLog.objects.select_related('user')